@@ -127,6 +127,8 @@ class Provider(Updateable):
         myprov.create()
 
     """
+    #: stats gathered from the backend management system to be matched in :py:meth:`validate`
+    STATS_TO_MATCH = ['num_template', 'num_vm']
 
     def __init__(self, name=None, credentials=None, zone=None, key=None):
         self.name = name
@@ -194,22 +196,27 @@ class Provider(Updateable):
         cfg_btn('Remove this Cloud Provider from the VMDB', invokes_alert=True)
         sel.handle_alert(cancel=cancel)
 
-    def validate(self):
+    def validate(self, host_stats=None):
         """ Validates that the detail page matches the Providers information.
 
         This method logs into the provider using the mgmt_system interface and collects
         a set of statistics to be matched against the UI. The details page is then refreshed
         continuously until the matching of all items is complete. A error will be raised
         if the match is not complete within a certain defined time period.
+
+        Args:
+            host_stats: Optional dict of :py:attr:`STATS_TO_MATCH` already gathered from the
+                mgmt_system, used for the first match instead of asking the backend again.
+                See :py:func:`utils.providers.validate_providers`.
         """
         if not self._on_detail_page():
             sel.force_navigate('cloud_provider', context={'provider': self})
 
-        stats_to_match = ['num_template', 'num_vm']
+        stats_to_match = self.STATS_TO_MATCH
         client = self.get_mgmt_system()
 
         # Bail out here if the stats match.
-        if self._do_stats_match(client, stats_to_match):
+        if self._do_stats_match(client, stats_to_match, host_stats):
             client.disconnect()
             return
 
@@ -246,7 +253,7 @@ class Provider(Updateable):
             sel.force_navigate('cloud_provider', context={'provider': self})
         return details_page.infoblock.text(*ident)
 
-    def _do_stats_match(self, client, stats_to_match=None):
+    def _do_stats_match(self, client, stats_to_match=None, host_stats=None):
         """ A private function to match a set of statistics, with a Provider.
 
         This function checks if the list of stats match, if not, the page is refreshed.
@@ -257,12 +264,15 @@ class Provider(Updateable):
         Args:
             client: A provider mgmt_system instance.
             stats_to_match: A list of key/attribute names to match.
+            host_stats: Stats already gathered from ``client``, if ``None`` they will be
+                requested from ``client``.
 
         Raises:
             KeyError: If the host stats does not contain the specified key.
             ProviderHasNoProperty: If the provider does not have the property defined.
         """
-        host_stats = client.stats(*stats_to_match)
+        if host_stats is None:
+            host_stats = client.stats(*stats_to_match)
 
         for stat in stats_to_match:
             try:
@@ -381,21 +381,24 @@ def test_action_create_snapshot_and_delete_last(
         snapshot_create_action.delete()
     request.addfinalizer(finalize)
 
+    # The baseline must be current, not read from a snapshot fetched earlier
+    vm.refresh()
     snapshots_before = vm.ws_attributes["v_total_snapshots"]
     # Power off to invoke snapshot creation
     vm_stop_func()
     wait_for(vm_is_off_func, num_sec=90, delay=5)
-    wait_for(lambda: vm.ws_attributes["v_total_snapshots"] > snapshots_before, num_sec=300,
-        message="wait for snapshot appear", delay=5)
+    vm.wait_for(lambda: vm.ws_attributes["v_total_snapshots"] > snapshots_before, 'object',
+        num_sec=300, message="wait for snapshot appear", delay=5)
     assert vm.ws_attributes["v_snapshot_newest_description"] == "Created by EVM Policy Action"
     assert vm.ws_attributes["v_snapshot_newest_name"] == snapshot_name
     # Snapshot created and validated, so let's delete it
+    vm.refresh()
     snapshots_before = vm.ws_attributes["v_total_snapshots"]
     # Power on to invoke last snapshot deletion
     vm_start_func()
     wait_for(vm_is_on_func, num_sec=90, delay=5)
-    wait_for(lambda: vm.ws_attributes["v_total_snapshots"] < snapshots_before, num_sec=300,
-        message="wait for snapshot deleted", delay=5)
+    vm.wait_for(lambda: vm.ws_attributes["v_total_snapshots"] < snapshots_before, 'object',
+        num_sec=300, message="wait for snapshot deleted", delay=5)
 
 
 def test_action_create_snapshots_and_delete_them(
@@ -430,8 +433,8 @@ def test_action_create_snapshots_and_delete_them(
         snapshots_before = vm.ws_attributes["v_total_snapshots"]
         vm_stop_func()
         wait_for(vm_is_off_func, num_sec=90, delay=5)
-        wait_for(lambda: vm.ws_attributes["v_total_snapshots"] > snapshots_before, num_sec=300,
-            message="wait for snapshot %d to appear" % (n + 1), delay=5)
+        vm.wait_for(lambda: vm.ws_attributes["v_total_snapshots"] > snapshots_before, 'object',
+            num_sec=300, message="wait for snapshot %d to appear" % (n + 1), delay=5)
         assert vm.ws_attributes["v_snapshot_newest_name"] == snapshot_name
         vm_start_func()
         wait_for(vm_is_on_func, num_sec=90, delay=5)
@@ -445,8 +448,8 @@ def test_action_create_snapshots_and_delete_them(
     # Power on to invoke all snapshots deletion
     vm_start_func()
     wait_for(vm_is_on_func, num_sec=90, delay=5)
-    wait_for(lambda: vm.ws_attributes["v_total_snapshots"] == 0, num_sec=300,
-        message="wait for snapshots to be deleted", delay=5)
+    vm.wait_for(lambda: vm.ws_attributes["v_total_snapshots"] == 0, 'object',
+        num_sec=300, message="wait for snapshots to be deleted", delay=5)
 
 
 @pytest.mark.skipif("True")
@@ -472,7 +475,8 @@ def test_action_initiate_smartstate_analysis(
         t = vm.last_scan_attempt_on
         return False if t is None else t >= switched_on
     try:
-        wait_for(wait_analysis_tried, num_sec=90, message="wait for analysis attempt", delay=5)
+        vm.wait_for(wait_analysis_tried, 'object', num_sec=90,
+            message="wait for analysis attempt", delay=5)
     except TimedOutError:
         pytest.fail("CFME did not even try analysing the VM %s" % vm.name)
 
@@ -481,7 +485,8 @@ def test_action_initiate_smartstate_analysis(
         t = vm.last_scan_on
         return False if t is None else t >= switched_on
     try:
-        wait_for(wait_analysis_finished, num_sec=180, message="wait for analysis finished", delay=5)
+        vm.wait_for(wait_analysis_finished, 'object', num_sec=180,
+            message="wait for analysis finished", delay=5)
     except TimedOutError:
         pytest.fail("CFME did not analyse the VM %s" % vm.name)
 
@@ -535,10 +540,11 @@ def test_action_tag(request, policy_for_testing, vm, vm_off, vm_start_func, vm_i
     vm_start_func()
     wait_for(vm_is_on_func, num_sec=90, delay=5)
     try:
-        wait_for(
+        vm.wait_for(
             lambda: any(
                 [tag.category == "service_level" and tag.tag_name == "gold" for tag in vm.tags]
             ),
+            'tags',
             num_sec=80,
             message="tag presence check"
         )
@@ -562,10 +568,11 @@ def test_action_untag(request, policy_for_testing, vm, vm_off, vm_start_func, vm
     vm_start_func()
     wait_for(vm_is_on_func, num_sec=90, delay=5)
     try:
-        wait_for(
+        vm.wait_for(
             lambda: not any(
                 [tag.category == "service_level" and tag.tag_name == "gold" for tag in vm.tags]
             ),
+            'tags',
             num_sec=80,
             message="tag presence check"
         )
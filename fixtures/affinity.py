@@ -0,0 +1,168 @@
+"""Fixture affinity ordering of test runs
+
+``--affinity-order`` reorders the collected tests so tests that need the same appliance state, or
+start on the same page, run one after the other:
+
+* Test modules using the same appliance state fixtures (listed in :py:data:`state_fixtures`) and
+  server roles (the ``server_roles`` fixtureconf) are run together, so providers are set up and
+  server roles, auth modes and event testing configured as few times as possible.
+* Inside a module, tests with the same server roles and ``go_to`` page are run together.
+
+Tests are never moved out of their module or class, or away from tests sharing their module or
+class scoped parametrization, so higher-scoped fixtures are still only set up once per module,
+class or parameter.
+
+Tests marked with ``requires_test`` stay after the tests they require, and smoke tests are still
+run first.
+
+"""
+from collections import OrderedDict
+
+from markers.requires import nodeid_suffixes, required_tests
+from utils.log import logger
+
+#: Fixtures that change the state of the appliance, tests using the same ones are run together
+state_fixtures = [
+    'configure_appliance_for_event_testing',
+    'configure_aws_iam_auth_mode',
+    'configure_ldap_auth_mode',
+    'setup_cloud_providers',
+    'setup_infrastructure_providers',
+    'setup_providers',
+]
+
+# Scope number of function-scoped parametrization, see _pytest.python.scopes
+_function_scopenum = 3
+
+# fixtureconf keys read by the server_roles fixture
+_server_roles_keys = ['clear_roles', 'server_roles', 'server_roles_cfmedata', 'set_default_roles']
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme', 'cfme')
+    group._addoption('--affinity-order', action='store_true', default=False,
+        dest='affinity_order', help='Run tests needing the same appliance state or starting on '
+        'the same page together')
+
+
+# Runs after fixtures.durations and before markers.smoke
+def pytest_collection_modifyitems(session, config, items):
+    if not config.getvalue('affinity_order'):
+        return
+    changes_before = state_changes(items)
+    items[:] = affinity_order(items)
+    logger.info('Affinity ordering reduced state and page changes from %d to %d'
+        % (changes_before, state_changes(items)))
+
+
+def _fixtureconf(item):
+    mark = item.get_marker('fixtureconf')
+    return mark.kwargs if mark is not None else {}
+
+
+def _server_roles(item):
+    if 'server_roles' not in item.fixturenames:
+        return None
+    fixtureconf = _fixtureconf(item)
+    return tuple((key, repr(fixtureconf[key])) for key in _server_roles_keys if key in fixtureconf)
+
+
+def _page(item):
+    if 'go_to_fixture' not in item.fixturenames:
+        return None
+    return _fixtureconf(item).get('page_name')
+
+
+def _state(item):
+    # Appliance state needed by the item, as a hashable key
+    return (tuple(name for name in state_fixtures if name in item.fixturenames),
+        _server_roles(item))
+
+
+def _scope(item):
+    # Items with the same scope share their module, class, and higher-scoped parameters
+    try:
+        callspec = item.callspec
+    except AttributeError:
+        params = ()
+    else:
+        params = tuple(sorted((argname, index) for argname, index in callspec.indices.items()
+            if callspec._arg2scopenum.get(argname) < _function_scopenum))
+    return item.fspath, getattr(item, 'cls', None), params
+
+
+def _group(elements, key):
+    # Stable grouping, groups are ordered by the first appearance of their key
+    groups = OrderedDict()
+    for element in elements:
+        groups.setdefault(key(element), []).append(element)
+    return [element for group in groups.values() for element in group]
+
+
+def _runs(items, key):
+    # Split items into runs of consecutive items with the same key
+    runs = []
+    for item in items:
+        if runs and key(runs[-1][-1]) == key(item):
+            runs[-1].append(item)
+        else:
+            runs.append([item])
+    return runs
+
+
+def state_changes(items):
+    """Number of times the appliance state or starting page changes during a run of items"""
+    keys = [(_state(item), _page(item)) for item in items]
+    return sum(1 for previous, key in zip(keys, keys[1:]) if previous != key)
+
+
+def affinity_order(items):
+    """Order items so items needing the same appliance state or page run together
+
+    Args:
+        items: Test items, as collected by py.test
+
+    Returns: The reordered list of items
+    """
+    modules = _runs(items, lambda item: item.fspath)
+    # A module's state is all the states its items need
+    modules = _group(modules, lambda module: frozenset(_state(item) for item in module))
+    ordered = []
+    for module in modules:
+        for scope in _runs(module, _scope):
+            ordered.extend(_group(scope, lambda item: (_state(item), _page(item))))
+    return _honour_requires(ordered, items)
+
+
+def _honour_requires(ordered, original):
+    # Tests that required tests collected before them still run after them
+    prerequisites = {}
+    # Items collected so far, by each suffix of their nodeids that can be required
+    collected = {}
+    for item in original:
+        required = [other for test_id in required_tests(item)
+            for other in collected.get(test_id, ())]
+        if required:
+            prerequisites[item] = required
+        for suffix in nodeid_suffixes(item.nodeid):
+            collected.setdefault(suffix, []).append(item)
+
+    result = []
+    emitted = set()
+    waiting = []
+
+    def emit(item):
+        result.append(item)
+        emitted.add(item)
+        # Release anything that was waiting for this item
+        for waiting_item in list(waiting):
+            if waiting_item in waiting and emitted.issuperset(prerequisites[waiting_item]):
+                waiting.remove(waiting_item)
+                emit(waiting_item)
+
+    for item in ordered:
+        if emitted.issuperset(prerequisites.get(item, ())):
+            emit(item)
+        else:
+            waiting.append(item)
+    return result
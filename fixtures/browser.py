@@ -1,21 +1,101 @@
+import Queue
+import threading
+
 import pytest
-from py.error import ENOENT
 from selenium.common.exceptions import WebDriverException
 
 import utils.browser
+from utils import webdriver_stats
 from utils.datafile import template_env
+from utils.log import logger
 from utils.path import log_path
 from fixtures import navigation
 
 nav_fixture_names = filter(lambda x: x.endswith('_pg'), dir(navigation))
 browser_fixtures = set(['browser'] + nav_fixture_names)
 
+#: Failed tests shown on each page of the failed browser tests report
+REPORT_PAGE_SIZE = 50
+
+#: Failed tests kept for the report, later failures are only counted
+MAX_TRACKED_FAILURES = 1000
+
+#: Directory the screenshots and tracebacks of failed tests are written to
+failures_path = log_path.join('failed_browser_tests')
+
 failed_test_tracking = {
     'tests': list(),
     'total_failed': 0,
     'total_errored': 0,
+    'untracked': 0,
 }
 
+#: :py:class:`utils.webdriver_stats.CommandStats` for this run, if ``--browser-stats`` was passed
+browser_stats = None
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme', 'cfme')
+    group._addoption('--browser-stats', action='store_true', default=False,
+        dest='browser_stats',
+        help='count and time browser commands, reported in log/browser_stats.html')
+
+
+class BackgroundWriter(object):
+    """Writes files from a background thread, so failing tests don't wait on the disk
+
+    At most ``maxsize`` files are queued, after which :py:meth:`write` waits for the queue to
+    drain, bounding the memory held by files waiting to be written.
+    """
+    def __init__(self, maxsize=20):
+        self._queue = Queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, path, data):
+        """Queue data to be written to path, a :py:class:`py.path.local`"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._monitor, name='BackgroundWriter')
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((path, data))
+
+    def flush(self):
+        """Wait for all queued files to be written"""
+        self._queue.join()
+
+    def _monitor(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                path.write_binary(data, ensure=True)
+            except Exception as ex:
+                logger.error('Could not write %s: %s' % (path, ex))
+            finally:
+                self._queue.task_done()
+
+
+failure_writer = BackgroundWriter()
+
+
+def pytest_configure(config):
+    global browser_stats
+    if config.getoption('browser_stats'):
+        browser_stats = webdriver_stats.instrument()
+    # Clean out any old reports, xdist slaves start after the master has done this
+    if hasattr(config, 'slaveinput'):
+        return
+    if failures_path.check():
+        failures_path.remove(ignore_errors=True)
+    for page in log_path.listdir('failed_browser_tests*.html'):
+        page.remove(ignore_errors=True)
+
+
+def pytest_runtest_logstart(nodeid, location):
+    if browser_stats is not None:
+        browser_stats.current_test = nodeid
+
 
 def pytest_namespace():
     # Return the contents of this file as the 'sel' namespace in pytest.
@@ -28,61 +108,139 @@ def pytest_runtest_setup(item):
         utils.browser.ensure_browser_open()
 
 
-def pytest_exception_interact(node, call, report):
-    if set(getattr(node, 'fixturenames', [])) & browser_fixtures:
-        val = unicode(call.excinfo.value)
-        short_tb = '%s\n%s' % (call.excinfo.type.__name__, val.encode('ascii', 'ignore'))
-        # base64 encoded to go into a data uri, same for screenshots
-        full_tb = str(report.longrepr).encode('base64').strip()
-        # errors are when exceptions are thrown outside of the test call phase
-        is_error = report.when != 'call'
-
-        template_data = {
-            'name': node.name,
-            'file': node.fspath,
-            'is_error': is_error,
-            'fail_stage': report.when,
-            'short_tb': short_tb,
-            'full_tb': full_tb,
-        }
-
-        try:
-            template_data['screenshot'] = utils.browser.browser().get_screenshot_as_base64()
-        except (AttributeError, WebDriverException):
-            # See comments utils.browser.ensure_browser_open for why these two exceptions
-            template_data['screenshot'] = None
-            template_data['screenshot_error'] = 'browser error'
-        except Exception as ex:
-            # If this fails for any other reason,
-            # leave out the screenshot but record the reason
-            template_data['screenshot'] = None
-            if ex.message:
-                screenshot_error = '%s: %s' % (type(ex).__name__, ex.message)
-            else:
-                screenshot_error = type(ex).__name__
-            template_data['screenshot_error'] = screenshot_error
+@pytest.mark.hookwrapper
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    # Failures without an exception, like strict xpasses, have no traceback to capture
+    if (report.failed and call.excinfo is not None
+            and set(getattr(item, 'fixturenames', [])) & browser_fixtures):
+        # Attached to the report, so it's sent to the xdist master along with it
+        report.failed_browser_test = _capture_failure(item, call, report)
+
+
+def _capture_failure(item, call, report):
+    val = unicode(call.excinfo.value)
+    short_tb = '%s\n%s' % (call.excinfo.type.__name__, val.encode('ascii', 'ignore'))
+    # errors are when exceptions are thrown outside of the test call phase
+    is_error = report.when != 'call'
+    template_data = {
+        'name': item.name,
+        'file': str(item.fspath),
+        'is_error': is_error,
+        'fail_stage': report.when,
+        'short_tb': short_tb,
+    }
+    if len(failed_test_tracking['tests']) >= MAX_TRACKED_FAILURES:
+        # Only counted in the report
+        return template_data
+
+    # Screenshots and full tracebacks are written to files, named by failure number (and xdist
+    # slave), and linked to from the report
+    failure_name = str(len(failed_test_tracking['tests']) + 1)
+    if hasattr(item.config, 'slaveinput'):
+        failure_name = '%s-%s' % (item.config.slaveinput['slaveid'], failure_name)
+    full_tb = failures_path.join('%s.txt' % failure_name)
+    failure_writer.write(full_tb, str(report.longrepr))
+    template_data['full_tb'] = full_tb.relto(log_path)
 
-        failed_test_tracking['tests'].append(template_data)
-        if is_error:
-            failed_test_tracking['total_errored'] += 1
+    try:
+        screenshot = utils.browser.browser().get_screenshot_as_png()
+    except (AttributeError, WebDriverException):
+        # See comments utils.browser.ensure_browser_open for why these two exceptions
+        template_data['screenshot'] = None
+        template_data['screenshot_error'] = 'browser error'
+    except Exception as ex:
+        # If this fails for any other reason,
+        # leave out the screenshot but record the reason
+        template_data['screenshot'] = None
+        if ex.message:
+            screenshot_error = '%s: %s' % (type(ex).__name__, ex.message)
         else:
-            failed_test_tracking['total_failed'] += 1
+            screenshot_error = type(ex).__name__
+        template_data['screenshot_error'] = screenshot_error
+    else:
+        screenshot_file = failures_path.join('%s.png' % failure_name)
+        failure_writer.write(screenshot_file, screenshot)
+        template_data['screenshot'] = screenshot_file.relto(log_path)
+    return template_data
+
+
+def pytest_runtest_logreport(report):
+    # Under xdist, the master gets the failures of all slaves
+    template_data = getattr(report, 'failed_browser_test', None)
+    if template_data is None:
+        return
+    if template_data['is_error']:
+        failed_test_tracking['total_errored'] += 1
+    else:
+        failed_test_tracking['total_failed'] += 1
+    if 'full_tb' in template_data and len(failed_test_tracking['tests']) < MAX_TRACKED_FAILURES:
+        failed_test_tracking['tests'].append(template_data)
+    else:
+        failed_test_tracking['untracked'] += 1
 
 
 def pytest_sessionfinish(session, exitstatus):
-    failed_tests_template = template_env.get_template('failed_browser_tests.html')
-    outfile = log_path.join('failed_browser_tests.html')
+    # Slaves wait for their files to be written, the report and stats are written by the master
+    failure_writer.flush()
+    slaveoutput = getattr(session.config, 'slaveoutput', None)
+    if slaveoutput is not None:
+        if browser_stats is not None:
+            webdriver_stats.uninstrument()
+            slaveoutput['browser_stats'] = browser_stats.export()
+        return
+
+    # Generate a new report if needed
+    if failed_test_tracking['tests']:
+        _write_failed_tests_report()
 
-    # Clean out any old reports
-    try:
-        outfile.remove(ignore_errors=True)
-    except ENOENT:
-        pass
+    if browser_stats is not None:
+        webdriver_stats.uninstrument()
+        _write_browser_stats()
 
-    # Generate a new one if needed
-    if failed_test_tracking['tests']:
-        failed_tests_report = failed_tests_template.render(**failed_test_tracking)
-        outfile.write(failed_tests_report)
+
+@pytest.mark.optionalhook
+def pytest_testnodedown(node, error):
+    # xdist master, merge the browser stats of a slave that finished
+    exported = getattr(node, 'slaveoutput', {}).get('browser_stats')
+    if browser_stats is not None and exported:
+        browser_stats.merge(exported)
+
+
+def _report_page_name(page_num):
+    if page_num == 1:
+        return 'failed_browser_tests.html'
+    return 'failed_browser_tests_%d.html' % page_num
+
+
+def _write_failed_tests_report():
+    failed_tests_template = template_env.get_template('failed_browser_tests.html')
+    tests = failed_test_tracking['tests']
+    pages = [tests[i:i + REPORT_PAGE_SIZE] for i in range(0, len(tests), REPORT_PAGE_SIZE)]
+    page_names = [_report_page_name(page_num) for page_num in range(1, len(pages) + 1)]
+    for page_num, page_tests in enumerate(pages, 1):
+        log_path.join(_report_page_name(page_num)).write(failed_tests_template.render(
+            tests=page_tests,
+            page_num=page_num,
+            page_names=page_names,
+            total_failed=failed_test_tracking['total_failed'],
+            total_errored=failed_test_tracking['total_errored'],
+            untracked=failed_test_tracking['untracked'],
+            max_tracked=MAX_TRACKED_FAILURES,
+        ))
+
+
+def _write_browser_stats():
+    browser_stats_template = template_env.get_template('browser_stats.html')
+    outfile = log_path.join('browser_stats.html')
+    tests = browser_stats.report()
+    outfile.write(browser_stats_template.render(
+        tests=tests,
+        functions=browser_stats.totals(),
+        total_count=sum(test['count'] for test in tests),
+        total_seconds=sum(test['seconds'] for test in tests),
+    ))
 
 
 @pytest.fixture(scope='session')
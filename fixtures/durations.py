@@ -0,0 +1,118 @@
+"""Test duration history and duration-aware ordering
+
+The setup, call and teardown durations of every test are recorded to the
+:py:class:`utils.durations.DurationHistory` at the end of each run, against the version of the
+appliance under test. The version is taken from ``appliance_version`` in env.yaml if it's set,
+otherwise it's looked up on the appliance at ``base_url``, if any test of the run used the
+appliance: through the browser, or a ``uses_*`` fixture (see :py:mod:`markers.uses`). Other runs,
+like the ``utils/tests`` unit tests, and runs on an appliance that can't be reached, are recorded
+against an ``unknown`` version.
+
+Tests that took significantly longer than usual on this appliance version are listed in the
+terminal summary and the cfme log.
+
+``--order-by-duration`` runs the longest test modules first, using the recorded durations. Tests
+in a module stay together and in order, so module-scoped fixtures aren't set up again. With
+xdist's load distribution, that also balances the run across slaves, since the long modules are
+started first and the short ones fill in the gaps at the end.
+
+"""
+from urlparse import urlparse
+
+import pytest
+
+from utils import conf
+from utils.durations import DurationHistory, order_by_duration
+from utils.log import logger
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme', 'cfme')
+    group._addoption('--order-by-duration', action='store_true', default=False,
+        dest='order_by_duration', help='Run the longest test modules first, according to the '
+        'test duration history')
+    group._addoption('--no-duration-history', action='store_false', default=True,
+        dest='duration_history', help='Do not record test durations to the test duration history')
+
+
+def pytest_configure(config):
+    # Durations are recorded on the xdist master, which gets every slave's reports
+    if config.getvalue('duration_history') and not hasattr(config, 'slaveinput'):
+        config.pluginmanager.register(DurationRecorder(), 'duration_recorder')
+
+
+# Runs before other reordering, like fixtures.affinity and markers.smoke, so smoke tests still run
+# first and tests needing the same appliance state stay together
+@pytest.mark.tryfirst
+def pytest_collection_modifyitems(session, config, items):
+    if not config.getvalue('order_by_duration'):
+        return
+    history = DurationHistory()
+    try:
+        items[:] = order_by_duration(items, history.estimates())
+    finally:
+        history.close()
+
+
+def _appliance_version(used_appliance):
+    version = conf.env.get('appliance_version')
+    if version:
+        return str(version)
+    if not used_appliance:
+        # Don't hold up runs that never touched the appliance on connecting to it
+        return 'unknown'
+    try:
+        # utils.soap pulls in the appliance DB and SOAP libraries, only import it when needed
+        from utils.soap import appliance_version
+        return appliance_version(urlparse(conf.env['base_url']).hostname)
+    except Exception as ex:
+        logger.info('Recording test durations for an unknown appliance version: %s: %s' %
+            (type(ex).__name__, ex))
+        return 'unknown'
+
+
+def _uses_appliance(keywords):
+    # Tests not marked skip_selenium use the browser
+    return 'skip_selenium' not in keywords or any(kw.startswith('uses_') for kw in keywords)
+
+
+class DurationRecorder(object):
+    def __init__(self):
+        #: A dict of test nodeid to a dict of test phase to duration
+        self.durations = {}
+        #: A dict of test nodeid to outcome, a test only passes if all of its phases passed
+        self.outcomes = {}
+        self.regressions = []
+        #: Whether any test that ran used the appliance
+        self.used_appliance = False
+
+    def pytest_runtest_logreport(self, report):
+        if report.when == 'call' and _uses_appliance(report.keywords):
+            self.used_appliance = True
+        self.durations.setdefault(report.nodeid, {})[report.when] = report.duration
+        if self.outcomes.get(report.nodeid, 'passed') == 'passed':
+            self.outcomes[report.nodeid] = report.outcome
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        if not self.durations:
+            return
+        durations = {nodeid: (self.outcomes[nodeid], phases.get('setup', 0.0),
+                phases.get('call', 0.0), phases.get('teardown', 0.0))
+            for nodeid, phases in self.durations.iteritems()}
+        history = DurationHistory()
+        try:
+            run_id = history.add_run(_appliance_version(self.used_appliance), durations)
+            self.regressions = history.regressions(run_id)
+        finally:
+            history.close()
+        for nodeid, seconds, baseline in self.regressions:
+            logger.warning('%s took %.2fs, usually %.2fs' % (nodeid, seconds, baseline))
+
+    @pytest.mark.trylast
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.regressions:
+            return
+        terminalreporter.write_sep('=', 'Slower than usual: %d tests' % len(self.regressions),
+            yellow=True)
+        for nodeid, seconds, baseline in self.regressions:
+            terminalreporter.write_line('%8.2fs (usually %.2fs) %s' % (seconds, baseline, nodeid))
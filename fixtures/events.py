@@ -8,14 +8,13 @@ from datetime import datetime
 
 import pytest
 
-from utils import providers
+from utils import providers, shared_state
 from utils.db import cfmedb
 from utils.conf import cfme_data
 from utils.datafile import template_env
 from utils.events import setup_for_event_testing
 from utils.log import create_logger
 from utils.path import scripts_path
-from utils.ssh import SSHClient
 from utils.wait import wait_for, TimedOutError
 
 logger = create_logger('events')
@@ -106,6 +105,8 @@ class EventListener(object):
         self.expectations = []
         self.processed_expectations = defaultdict(list)
         self.listener = None
+        # Under xdist, the master runs the listener, and the slaves use it
+        self.listener_on_master = False
 
     @property
     def listener_port(self):
@@ -291,8 +292,16 @@ class EventListener(object):
             }
         )
 
+    @property
+    def running(self):
+        """Whether the listener is running, in this process or on the xdist master"""
+        return self.listener is not None or self.listener_on_master
+
     @property
     def finished(self):
+        if self.listener_on_master:
+            # The master would have stopped the run if it died
+            return False
         if not self.listener:
             return True
         return self.listener.poll() is not None
@@ -317,13 +326,50 @@ class EventListener(object):
         self.listener.wait()
         self.listener = None
 
+    def export_expectations(self):
+        """ Processed expectations as builtin types, to send them to the xdist master
+        """
+        return {node_id: [[exp.sys_type, exp.obj_type, exp.obj, exp.event,
+                           datetime.strftime(exp.time, EventExpectation.TIME_FORMAT),
+                           exp.arrived and datetime.strftime(exp.arrived,
+                                                             EventExpectation.TIME_FORMAT)]
+                          for exp in expectations]
+                for node_id, expectations in self.processed_expectations.items()}
+
+    def merge_expectations(self, exported):
+        """ Add the expectations exported by :py:meth:`export_expectations`
+        """
+        for node_id, expectations in exported.items():
+            for sys_type, obj_type, obj, event, expected_time, arrived in expectations:
+                expectation = EventExpectation(
+                    sys_type, obj_type, obj, event,
+                    datetime.strptime(expected_time, EventExpectation.TIME_FORMAT))
+                if arrived:
+                    expectation.arrived = datetime.strptime(arrived, EventExpectation.TIME_FORMAT)
+                self.processed_expectations[node_id].append(expectation)
+
+    def pytest_sessionfinish(self, session):
+        if self.listener_on_master:
+            # xdist slave, the master reports on the expectations
+            session.config.slaveoutput["event_testing"] = self.export_expectations()
+
+    @pytest.mark.optionalhook
+    def pytest_testnodedown(self, node, error):
+        # xdist master, collect the expectations of a slave that finished
+        self.merge_expectations(getattr(node, "slaveoutput", {}).get("event_testing", {}))
+
+    @pytest.mark.optionalhook
+    def pytest_configure_node(self, node):
+        # xdist master, the slaves use its listener
+        node.slaveinput["event_testing_port"] = self.listener_port
+
     def pytest_unconfigure(self, config):
         """ Collect and clean up the testing.
 
         If the event testing is active, collects results, stops the listener
         and generates the report.
         """
-        if config.getoption("event_testing_enabled"):
+        if config.getoption("event_testing_enabled") and not self.listener_on_master:
             # Collect results
             try:
                 # Generate result report
@@ -364,21 +410,37 @@ def pytest_configure(config):
 
     Sets up and registers the EventListener plugin for py.test.
     If the testing is enabled, listener is started.
+
+    Under xdist, the listener is started by the master, and the slaves use it.
     """
-    plugin = EventListener(config.getoption("event_testing_port"),
+    if hasattr(config, "slaveinput"):
+        listener_port = config.slaveinput["event_testing_port"]
+    else:
+        listener_port = config.getoption("event_testing_port")
+    plugin = EventListener(listener_port,
                            config.getoption("event_testing_verbose_listener"))
     registration = config.pluginmanager.register(plugin, "event_testing")
     assert registration
     if config.getoption("event_testing_enabled"):
-        plugin.start()
+        if hasattr(config, "slaveinput"):
+            plugin.listener_on_master = True
+        else:
+            plugin.start()
 
 
 @pytest.fixture(scope="module")
 def configure_appliance_for_event_testing(listener_info):
     """ This fixture ensures that the appliance is configured for event testing.
+
+    The appliance is configured once per test run, by the first xdist slave to get here.
     """
-    return setup_for_event_testing(
-        SSHClient(), cfmedb, listener_info, providers.list_infra_providers()
+    # paramiko is only imported by tests that use events
+    from utils.ssh import SSHClient
+    return shared_state.run_once(
+        "configure_appliance_for_event_testing",
+        lambda: setup_for_event_testing(
+            SSHClient(), cfmedb, listener_info, providers.list_infra_providers()
+        )
     )
 
 
@@ -424,24 +486,27 @@ def register_event(uses_event_listener, configure_appliance_for_event_testing, r
     self = request.config.pluginmanager.getplugin("event_testing")  # Workaround for bind
     node_id = request.node.nodeid
 
-    if self.listener is not None:
-        logger.info("Clearing the database before testing ...")
-        self._delete_database()
-        self.expectations = []
+    # The listener's database is shared by the xdist slaves, and cleared by each test,
+    # so event tests run one at a time
+    with shared_state.lock("event_testing"):
+        if self.running:
+            logger.info("Clearing the database before testing ...")
+            self._delete_database()
+            self.expectations = []
 
-    yield self  # Run the test and provide the plugin as a fixture
+        yield self  # Run the test and provide the plugin as a fixture
 
-    if self.listener is not None:
-        logger.info("Checking the events ...")
-        try:
-            wait_for(self.check_all_expectations,
-                     delay=5,
-                     num_sec=75,
-                     handle_exception=True)
-        except TimedOutError:
-            pass
-
-        self.processed_expectations[node_id].extend(self.expectations)
-        logger.info("Clearing the database after testing ...")
-        self._delete_database()
-        self.expectations = []
+        if self.running:
+            logger.info("Checking the events ...")
+            try:
+                wait_for(self.check_all_expectations,
+                         delay=5,
+                         num_sec=75,
+                         handle_exception=True)
+            except TimedOutError:
+                pass
+
+            self.processed_expectations[node_id].extend(self.expectations)
+            logger.info("Clearing the database after testing ...")
+            self._delete_database()
+            self.expectations = []
@@ -0,0 +1,115 @@
+"""Incremental test runs, selecting the tests affected by a change
+
+``--record-impact`` traces the project files every test executes, and saves them to the
+:py:class:`utils.impact.ImpactMap`. Tracing slows the run down, so record with a full run every
+now and then, rather than on every run.
+
+``--changed-since REVISION`` deselects the tests that the files changed since a git revision
+(including uncommitted and untracked files) can't affect, according to the recorded map. Every
+test runs if fixtures, plugins or other files that can affect any test changed, see
+:py:func:`utils.impact.full_run_reason`, or if a Python file that no test executed or imported
+while recording changed. Tests that haven't been recorded always run.
+
+Usage::
+
+    py.test --record-impact
+    # change some page objects
+    py.test --changed-since origin/master
+
+"""
+import pytest
+
+from utils import impact, shared_state
+from utils.log import logger
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme', 'cfme')
+    group._addoption('--record-impact', action='store_true', default=False,
+        dest='record_impact', help='Record the project files each test executes, for '
+        '--changed-since')
+    group._addoption('--changed-since', action='store', default=None, dest='changed_since',
+        metavar='REVISION', help='Only run tests affected by the files changed since this git '
+        'revision, according to the tests recorded by --record-impact')
+
+
+def pytest_configure(config):
+    # The xdist master doesn't run tests, the slaves record them
+    is_xdist_master = (getattr(config.option, 'dist', 'no') != 'no'
+        and not hasattr(config, 'slaveinput'))
+    if config.getvalue('record_impact') and not is_xdist_master:
+        config.pluginmanager.register(ImpactRecorder(), 'impact_recorder')
+
+
+@pytest.mark.tryfirst
+def pytest_collection_modifyitems(session, config, items):
+    since = config.getvalue('changed_since')
+    if not since:
+        return
+    reporter = config.pluginmanager.getplugin('terminalreporter')
+    changed = impact.changed_files(since)
+    reason = impact.full_run_reason(changed)
+    impact_map = None
+    if reason is None and impact.impact_map_path.check():
+        impact_map = impact.ImpactMap.load()
+        test_modules = set(item.nodeid.split('::', 1)[0] for item in items)
+        reason = impact_map.unrecorded(changed - test_modules)
+    if reason is not None:
+        message = 'Running all tests, %s changed since %s' % (reason, since)
+    elif impact_map is None:
+        message = 'Running all tests, no impact map has been recorded'
+    else:
+        selected, deselected = [], []
+        for item in items:
+            if impact_map.affected(item.nodeid, changed):
+                selected.append(item)
+            else:
+                deselected.append(item)
+        items[:] = selected
+        config.hook.pytest_deselected(items=deselected)
+        message = 'Running %d of %d tests affected by %d files changed since %s' % (
+            len(selected), len(selected) + len(deselected), len(changed), since)
+    logger.info(message)
+    reporter.write_line(message)
+
+
+class ImpactRecorder(object):
+    def __init__(self):
+        self.tracer = impact.Tracer()
+        self.impact_map = impact.ImpactMap()
+        # Project files executed while setting up, by test module
+        self.setup_files = {}
+        # Project files executed by each test, by test nodeid
+        self.test_files = {}
+
+    def pytest_sessionstart(self, session):
+        self.tracer.start()
+
+    def _test_module(self, item):
+        return item.nodeid.split('::', 1)[0]
+
+    @pytest.mark.hookwrapper
+    def pytest_runtest_setup(self, item):
+        test_module = self._test_module(item)
+        if test_module not in self.setup_files:
+            self.setup_files[test_module] = impact.module_imports(item.module)
+        self.tracer.current = self.setup_files[test_module]
+        yield
+        self.tracer.current = self.test_files[item.nodeid] = set([test_module])
+
+    @pytest.mark.hookwrapper
+    def pytest_runtest_teardown(self, item, nextitem):
+        self.tracer.current = self.test_files.setdefault(item.nodeid, set())
+        yield
+        self.tracer.current = None
+        test_module = self._test_module(item)
+        self.impact_map.add_test(test_module, item.nodeid, self.setup_files[test_module],
+            self.test_files.pop(item.nodeid))
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        self.tracer.stop()
+        if self.impact_map.tests:
+            self.impact_map.add_imports(impact.import_graph(self.tracer.imports))
+            # xdist slaves save their tests one at a time
+            with shared_state.lock('impact_map'):
+                self.impact_map.save()
@@ -3,7 +3,7 @@ import collections
 import pytest
 
 from utils.log import logger as cfme_logger
-from utils.log import format_marker
+from utils.log import format_marker, perflog
 
 #: A dict of tests, and their state at various test phases
 test_tracking = collections.defaultdict(dict)
@@ -34,8 +34,10 @@ def pytest_runtest_logreport(report):
     # e.g. test_tracking['test_name']['setup'] = 'passed'
     #      test_tracking['test_name']['call'] = 'skipped'
     #      test_tracking['test_name']['teardown'] = 'failed'
+    # Under xdist, the master gets the reports of all slaves, and tracks every test for the summary
     test_tracking[_format_nodeid(report.nodeid, False)][report.when] = report.outcome
-    if report.when == 'teardown':
+    # Reports from xdist slaves have a node, those slaves already logged the result
+    if report.when == 'teardown' and not hasattr(report, 'node'):
         path, lineno, domaininfo = report.location
         cfme_logger.info(format_marker('%s result: %s' % (_format_nodeid(report.nodeid),
                 _test_status(_format_nodeid(report.nodeid, False)))),
@@ -54,6 +56,11 @@ def pytest_exception_interact(node, call, report):
 
 
 def pytest_sessionfinish(session, exitstatus):
+    slaveoutput = getattr(session.config, 'slaveoutput', None)
+    if slaveoutput is not None:
+        # This is an xdist slave, send the event histograms to the master to summarize the run
+        slaveoutput['perflog'] = perflog.export()
+        return
     c = collections.Counter()
     for test in test_tracking:
         c[_test_status(test)] += 1
@@ -63,6 +70,14 @@ def pytest_sessionfinish(session, exitstatus):
     summary = ', '.join(results)
     cfme_logger.info(format_marker('Finished test run', mark='='))
     cfme_logger.info(format_marker(str(summary), mark='='))
+    # Event histograms for this run, see utils.log.Perflog
+    perflog.write_summary()
+
+
+@pytest.mark.optionalhook
+def pytest_testnodedown(node, error):
+    # xdist master, merge the event histograms of a slave that finished
+    perflog.merge(getattr(node, 'slaveoutput', {}).get('perflog', {}))
 
 
 def _test_status(test_name):
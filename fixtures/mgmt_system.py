@@ -1,7 +1,7 @@
     # pylint: disable=E1101
 import pytest
 
-from utils import providers
+from utils import providers, shared_state
 
 
 @pytest.fixture
@@ -10,7 +10,9 @@ def setup_providers(uses_providers):
 
     This includes both cloud and infra provider types.
     """
-    providers.setup_providers(validate=True, check_existing=True)
+    # One xdist slave at a time, the others then find the providers already set up
+    with shared_state.lock('providers'):
+        providers.setup_providers(validate=True, check_existing=True)
 
 
 @pytest.fixture
@@ -19,7 +21,8 @@ def setup_infrastructure_providers(uses_infra_providers):
 
     This includes ``rhev`` and ``virtualcenter`` provider types
     """
-    providers.setup_infrastructure_providers(validate=True, check_existing=True)
+    with shared_state.lock('providers'):
+        providers.setup_infrastructure_providers(validate=True, check_existing=True)
 
 
 @pytest.fixture
@@ -28,7 +31,8 @@ def setup_cloud_providers(uses_cloud_providers):
 
     This includes ``ec2`` and ``openstack`` providers types
     """
-    providers.setup_cloud_providers(validate=True, check_existing=True)
+    with shared_state.lock('providers'):
+        providers.setup_cloud_providers(validate=True, check_existing=True)
 
 
 @pytest.fixture(scope='module')  # IGNORE:E1101
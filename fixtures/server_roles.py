@@ -39,6 +39,10 @@ To ensure the appliance has the default roles::
     def test_appliance_roles(server_roles):
         do(test)
 
+Roles are kept set for the whole test. Tests needing the same roles share them, even across
+xdist slaves, and the roles are only set again once no running test needs the ones set. See
+:py:func:`utils.shared_state.hold`.
+
 List of server role names currently exposed in the CFME interface:
 
     - automate
@@ -63,12 +67,32 @@ import pytest
 from pages.configuration_subpages.settings_subpages.server_settings_subpages.server_roles import (
     RoleChangesRequired
 )
+from utils import shared_state
 from utils.conf import cfme_data
 
 
-@pytest.fixture
+@pytest.yield_fixture
 def server_roles(fixtureconf, cnf_configuration_pg):
     """The fixture that does the work. See usage in :py:mod:`fixtures.server_roles`"""
+    if 'clear_roles' in fixtureconf:
+        key = 'clear_roles'
+    elif 'set_default_roles' in fixtureconf:
+        key = 'set_default_roles'
+    elif 'server_roles' in fixtureconf:
+        key = 'server_roles=%r' % (fixtureconf['server_roles'],)
+    elif 'server_roles_cfmedata' in fixtureconf:
+        key = 'server_roles_cfmedata=%r' % (tuple(fixtureconf['server_roles_cfmedata']),)
+    else:
+        raise RoleChangesRequired('No server role changes defined.')
+
+    # Server roles are appliance-wide: tests needing the same roles run alongside each other on
+    # xdist slaves, and roles are only changed once no test needs the ones set
+    with shared_state.hold('server_roles', key, _set_server_roles, fixtureconf,
+            cnf_configuration_pg):
+        yield
+
+
+def _set_server_roles(fixtureconf, cnf_configuration_pg):
     # Nav to the settings tab
     settings_pg = cnf_configuration_pg.click_on_settings()
     # Workaround to rudely bypass a popup that sometimes appears for
@@ -94,5 +118,3 @@ def server_roles(fixtureconf, cnf_configuration_pg):
         for selector in fixtureconf['server_roles_cfmedata']:
             roles_list = roles_list[selector]
         sst.set_server_roles(roles_list)
-    else:
-        raise RoleChangesRequired('No server role changes defined.')
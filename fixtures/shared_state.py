@@ -0,0 +1,29 @@
+"""Shares the :py:mod:`utils.shared_state` of a test run with its xdist slaves
+
+The master picks an id for the run, and passes it to the slaves, so they all use the same locks.
+The run's lock files are removed when the run ends.
+
+"""
+import uuid
+
+import pytest
+
+from utils import shared_state
+
+
+def pytest_configure(config):
+    if hasattr(config, 'slaveinput'):
+        shared_state.set_run(config.slaveinput['shared_state_run'])
+    else:
+        shared_state.set_run(uuid.uuid4().hex)
+
+
+@pytest.mark.optionalhook
+def pytest_configure_node(node):
+    # xdist master, configuring a slave
+    node.slaveinput['shared_state_run'] = shared_state.run_path().basename
+
+
+def pytest_unconfigure(config):
+    if not hasattr(config, 'slaveinput'):
+        shared_state.run_path().remove(ignore_errors=True)
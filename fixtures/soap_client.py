@@ -1,8 +1,8 @@
 import pytest
 
-import utils.soap
-
 
 @pytest.fixture()  # IGNORE:E1101
 def soap_client(uses_soap):
+    # suds is only imported by tests that use soap
+    import utils.soap
     return utils.soap.soap_client()
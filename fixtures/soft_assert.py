@@ -19,19 +19,28 @@ No effort is made to clear the thread-local store; rather it's explicitly overwr
 list by the context manager. Because the store is a :py:func:`list <python:list>`, failed assertions
 will be reported in the order that they failed.
 
+The failed assertions of every test are also attached to its test report, so they reach the xdist
+master in parallel runs, and recorded in :py:data:`failed_soft_asserts`. A summary of all failed
+soft assertions is logged at the end of the run.
+
 """
 import inspect
+from collections import OrderedDict
 from contextlib import contextmanager
 from threading import local
 
 import pytest
 
+from utils.log import logger
 from utils.path import get_rel_path
 
 # Use a thread-local store for failed soft asserts, making it thread-safe
 # in parallel testing and shared among the functions in this module.
 _thread_locals = local()
 
+#: Ordered dict of test nodeid to the failed soft assertion messages of that test, for this run
+failed_soft_asserts = OrderedDict()
+
 
 def pytest_runtest_call(__multicall__, item):
     """pytest hook to handle :py:func:`soft_assert` fixture usage"""
@@ -44,6 +53,29 @@ def pytest_runtest_call(__multicall__, item):
         __multicall__.execute()
 
 
+@pytest.mark.hookwrapper
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    if call.excinfo is not None and call.excinfo.errisinstance(SoftAssertionError):
+        # Report attributes are sent to the xdist master along with the report
+        outcome.get_result().soft_asserts = list(call.excinfo.value.failed_assertions)
+
+
+def pytest_runtest_logreport(report):
+    # Tests expected to fail (xfail) don't count
+    if report.failed and getattr(report, 'soft_asserts', None):
+        failed_soft_asserts[report.nodeid] = report.soft_asserts
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # xdist slaves' failures are summarized by the master
+    if failed_soft_asserts and not hasattr(session.config, 'slaveinput'):
+        logger.info('%d soft assertions failed in %d tests' % (
+            sum(map(len, failed_soft_asserts.values())), len(failed_soft_asserts)))
+        for nodeid, failed_assertions in failed_soft_asserts.items():
+            logger.info('%s:\n    %s' % (nodeid, '\n    '.join(failed_assertions)))
+
+
 class SoftAssertionError(AssertionError):
     """exception class containing failed assertions
 
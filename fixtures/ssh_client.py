@@ -1,7 +1,5 @@
 import pytest
 
-from utils.ssh import SSHClient
-
 
 @pytest.fixture
 def ssh_client(uses_ssh):
@@ -47,4 +45,6 @@ def ssh_client(uses_ssh):
 
 
     """
+    # paramiko is only imported by tests that use ssh
+    from utils.ssh import SSHClient
     return SSHClient()
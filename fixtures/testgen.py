@@ -0,0 +1,22 @@
+"""Fixtures building the provider objects for tests parametrized by :py:mod:`utils.testgen`
+
+:py:func:`utils.testgen.provider_by_type` only parametrizes ``provider_key`` (and friends), so
+nothing is built during collection. These fixtures build objects from the key when the test
+runs. Each test gets its own objects, so tests are free to modify them.
+
+"""
+import pytest
+
+from utils import testgen
+
+
+@pytest.fixture
+def provider_crud(provider_key):
+    """The provider's CRUD object, see :py:func:`utils.testgen.get_provider_crud`"""
+    return testgen.get_provider_crud(provider_key)
+
+
+@pytest.fixture
+def provider_mgmt(provider_key):
+    """The provider's management system, see :py:func:`utils.testgen.get_provider_mgmt`"""
+    return testgen.get_provider_mgmt(provider_key)
@@ -1,58 +1,79 @@
-"""requires_test(test_name_or_nodeid): Mark a test as requiring another test
+"""requires_test(*test_names_or_nodeids): Mark a test as requiring other tests
 
 If another test is required to have run and passed before a suite of tests has
 any hope of succeeding, such as a smoke test, apply this mark to those tests.
 
-It takes a test name as the only positional argument. In the event that the
-test name is ambiguous, a full py.test nodeid can be used. A test's nodeid can
-be found by inspecting the request.node.nodeid attribute inside the required
-test item.
+It takes test names as positional arguments, and the marked test is skipped unless
+all of them passed. In the event that a test name is ambiguous, a full py.test
+nodeid can be used. A test's nodeid can be found by inspecting the
+request.node.nodeid attribute inside the required test item.
 
 """
+import re
 
 import pytest
 
 _no_mark_arg_err = '%s mark required test name or nodeid as first argument'
 
+# Outcomes of the tests that have run, for each suffix of their nodeids that can be required
+_outcomes = {}
+
+
 def pytest_configure(config):
     config.addinivalue_line("markers", __doc__)
 
-def _find_test_in_reports(test_id, reports):
-    # nodeids end with the test name, so the description of this mark
-    # oversimplifies things a little bit. The actual check for a test
-    # match is that any preceding test nodeid ends with the arg passed
-    # to the mark, so we can easily match the test name, test nodeid, and
-    # anything in between.
 
-    return any([report.nodeid.endswith(test_id) for report in reports])
+def nodeid_suffixes(nodeid):
+    """Yields the suffixes of a nodeid that a test can be required by
 
-def pytest_runtest_setup(item):
-    mark = 'requires_test'
-    if mark not in item.keywords:
-        # mark wasn't invoked, short out
-        return
+    nodeids end with the test name, so the description of this mark oversimplifies things a
+    little bit. A test can be required by its whole nodeid, or any part of it following a
+    ``/`` or ``::`` separator, so we can easily match the test name, test nodeid, and anything
+    in between.
+    """
+    yield nodeid
+    for separator in re.finditer('/|::', nodeid):
+        yield nodeid[separator.end():]
+
+
+def required_tests(item):
+    """Returns the tests required by an item's ``requires_test`` mark, or an empty list"""
+    mark = item.get_marker('requires_test')
+    if mark is None:
+        return []
+    if not mark.args:
+        # mark called incorrectly, explode
+        raise Exception(_no_mark_arg_err % 'requires_test')
+    return list(mark.args)
+
+
+def pytest_runtest_logreport(report):
+    if report.passed and report.when == 'call':
+        outcome = 'passed'
+    elif report.failed:
+        outcome = 'failed'
+    elif report.skipped:
+        outcome = 'skipped'
     else:
-        try:
-            test_id = item.keywords[mark].args[0]
-        except IndexError:
-            # mark called incorrectly, explode
-            raise Exception(_no_mark_arg_err % mark)
-
-    reporter = item.config.pluginmanager.getplugin('terminalreporter')
-    passed = reporter.stats.get('passed', [])
-    failed = reporter.stats.get('failed', [])
-    skipped = reporter.stats.get('skipped', [])
-
-    if _find_test_in_reports(test_id, passed):
-        # Required test passed, short out
         return
+    for suffix in nodeid_suffixes(report.nodeid):
+        _outcomes.setdefault(suffix, set()).add(outcome)
 
-    if _find_test_in_reports(test_id, failed):
-        error_verb = 'failed' 
-    elif _find_test_in_reports(test_id, skipped):
-        error_verb = 'was skipped'
-    else:
-        error_verb = 'not yet run or does not exist'
 
-    errmsg = 'required test %s %s' % (test_id, error_verb)
-    pytest.skip(errmsg)
+def pytest_runtest_setup(item):
+    errors = []
+    for test_id in required_tests(item):
+        outcomes = _outcomes.get(test_id, ())
+        if 'passed' in outcomes:
+            # Required test passed
+            continue
+        elif 'failed' in outcomes:
+            error_verb = 'failed'
+        elif 'skipped' in outcomes:
+            error_verb = 'was skipped'
+        else:
+            error_verb = 'not yet run or does not exist'
+        errors.append('required test %s %s' % (test_id, error_verb))
+
+    if errors:
+        pytest.skip(', '.join(errors))
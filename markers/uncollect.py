@@ -19,7 +19,7 @@ for adding a test that won't run...), e.g. ``@pytest.mark.uncollect`` before the
 
 def pytest_collection_modifyitems(session, config, items):
     len_collected = len(items)
-    items[:] = filter(lambda item: not item.get_marker('uncollect'), items)
+    items[:] = [item for item in items if item.get_marker('uncollect') is None]
     len_filtered = len(items)
     filtered_count = len_collected - len_filtered
     if filtered_count:
@@ -1,9 +1,26 @@
+import cPickle
+import os
+from tempfile import NamedTemporaryFile
 from warnings import catch_warnings, warn
 
 import yaml
-from yaml.loader import Loader
 
-from utils.path import conf_path
+from utils.path import cache_path, conf_path
+
+# libyaml's parser is many times faster than the pure-python one, use it if it's available
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+#: Compiled (pickled) yaml files, keyed on the name of the source yaml
+compiled_path = cache_path.join('conf')
+
+#: Yamls holding secrets, and their local overrides, are only compiled in-process, never on disk
+secret_yamls = ['credentials']
+
+# In-process compiled yaml, {yaml path: (file stamp, pickled data)}
+_compiled = {}
 
 
 class YamlConfigLoader(Loader):
@@ -94,6 +111,16 @@ class Config(dict):
     ``utils.conf`` at runtime. :py:func:`clear` is particularly useful as a means to trigger
     a reload of config files.
 
+    Compiled Config Cache
+    ^^^^^^^^^^^^^^^^^^^^^
+
+    Parsing large YAML files is slow, so each parsed file is also stored in a compiled (pickled)
+    form in ``cache/conf/``, stamped with the modification time and size of the YAML file it
+    came from. Files are only parsed again when their stamp changes, so reloading after a
+    :py:func:`clear` only re-parses the files (or local overrides) that were actually edited.
+    The cache is safe to delete at any time. Secrets (``credentials.yaml``) are kept out of it,
+    and only cached in-process.
+
     """
     def __init__(self, path):
         # stash a path to better impersonate a module
@@ -170,14 +197,69 @@ class RecursiveUpdateDict(dict):
                 self[key] = new_data[key]
 
 
+def compiled_file(filename):
+    """Returns the path of the compiled cache for the named yaml file"""
+    return compiled_path.join('%s.pickle' % filename)
+
+
+def _file_stamp(path):
+    # mtime alone can miss edits made within the filesystem's timestamp resolution
+    stat = path.stat()
+    return stat.mtime, stat.size
+
+
+def _load_compiled(filename, stamp):
+    try:
+        with compiled_file(filename).open('rb') as compiled_fh:
+            compiled_stamp, data = cPickle.load(compiled_fh)
+    except Exception:
+        # Missing, unreadable or stale compiled files just mean parsing the yaml again
+        return None
+    if compiled_stamp != stamp:
+        return None
+    return data
+
+
+def _store_compiled(filename, stamp, data):
+    try:
+        compiled_path.ensure(dir=True)
+        # Write to a temp file and rename it into place, so concurrent loaders never see
+        # a partially written file
+        with NamedTemporaryFile(dir=str(compiled_path), delete=False) as compiled_fh:
+            cPickle.dump((stamp, data), compiled_fh, cPickle.HIGHEST_PROTOCOL)
+        os.rename(compiled_fh.name, str(compiled_file(filename)))
+    except Exception:
+        # The cache is only an optimization, e.g. a read-only checkout still loads its yamls
+        pass
+
+
 def load_yaml(filename=None, warn_on_fail=True):
     # Find the requested yaml in the config dir, relative to this file's location
     # (aiming for cfme_tests/config)
     path = conf_path.join('%s.yaml' % filename)
 
     if path.check():
-        with path.open() as config_fh:
-            return yaml.load(config_fh, Loader=YamlConfigLoader)
+        stamp = _file_stamp(path)
+        try:
+            compiled_stamp, pickled_data = _compiled[str(path)]
+        except KeyError:
+            compiled_stamp = None
+        if compiled_stamp != stamp:
+            secret = filename.split('.', 1)[0] in secret_yamls
+            data = None if secret else _load_compiled(filename, stamp)
+            if data is None:
+                with path.open() as config_fh:
+                    data = yaml.load(config_fh.read(), Loader=YamlConfigLoader)
+                if secret:
+                    # Earlier versions did write secrets to the cache
+                    if compiled_file(filename).check():
+                        compiled_file(filename).remove()
+                else:
+                    _store_compiled(filename, stamp, data)
+            pickled_data = cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+            _compiled[str(path)] = stamp, pickled_data
+        # Unpickle a fresh copy every time, local overrides get merged into what's returned
+        return cPickle.loads(pickled_data)
 
     if warn_on_fail:
         msg = 'Unable to load configuration file at %s' % path
@@ -0,0 +1,218 @@
+"""Asynchronous orchestration helpers, built on tornado coroutines
+
+Waiting on appliances and providers mostly means sleeping between polls, and doing that in a
+thread (or process) per operation doesn't scale to dozens of operations at once. The helpers in
+this module are tornado coroutines instead, so one thread can drive many of them concurrently.
+
+Usage:
+
+.. code-block:: python
+
+    from tornado import gen
+    from utils import aio
+
+    @gen.coroutine
+    def start_and_wait(mgmt, vm_name):
+        yield aio.run_blocking(mgmt.start_vm, vm_name)
+        yield aio.poll_provider(mgmt.is_vm_running, vm_name, num_sec=600)
+
+    @gen.coroutine
+    def start_all(mgmt, vm_names):
+        # Yielding a list of futures waits for all of them
+        yield [start_and_wait(mgmt, vm_name) for vm_name in vm_names]
+
+    aio.run(start_all, mgmt, vm_names)
+
+Provider SDKs (and database drivers) only have blocking calls; :py:func:`run_blocking` runs
+those in a shared thread pool, and hands the result back to the coroutine. SSH commands and HTTP
+requests are done without blocking the loop at all.
+
+"""
+import json
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from tornado import gen
+from tornado.concurrent import Future, is_future
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+from utils.log import logger, perflog
+from utils.wait import TimedOutError, _Wait
+
+#: Threads available to :py:func:`run_blocking`
+BLOCKING_THREADS = 16
+
+_blocking_pool = None
+_tornado_logging = False
+_setup_lock = threading.Lock()
+
+
+def _setup_tornado_logging():
+    # Send tornado's logging to the cfme log. Without any handlers there, IOLoop would configure
+    # the root logger itself, echoing every log record to the console.
+    global _tornado_logging
+    with _setup_lock:
+        if not _tornado_logging:
+            tornado_logger = logging.getLogger('tornado')
+            tornado_logger.propagate = False
+            for handler in logger.handlers:
+                tornado_logger.addHandler(handler)
+            _tornado_logging = True
+
+
+def _get_blocking_pool():
+    global _blocking_pool
+    with _setup_lock:
+        if _blocking_pool is None:
+            _blocking_pool = ThreadPool(BLOCKING_THREADS)
+        return _blocking_pool
+
+
+def run(coroutine_func, *args, **kwargs):
+    """Run a coroutine function to completion on a fresh IOLoop, returning its result
+
+    Args:
+        coroutine_func: A function decorated with ``tornado.gen.coroutine``
+        *args: Positional arguments for coroutine_func
+        **kwargs: Keyword arguments for coroutine_func
+    """
+    _setup_tornado_logging()
+    io_loop = IOLoop()
+    try:
+        return io_loop.run_sync(lambda: coroutine_func(*args, **kwargs))
+    finally:
+        io_loop.close()
+
+
+def run_blocking(func, *args, **kwargs):
+    """Run a blocking function in a shared thread pool
+
+    Returns: A future, resolved on the calling thread's IOLoop with func's result
+    """
+    future = Future()
+    io_loop = IOLoop.current()
+
+    def callback(result):
+        io_loop.add_callback(future.set_result, result)
+
+    def call():
+        try:
+            callback(func(*args, **kwargs))
+        except Exception as ex:
+            io_loop.add_callback(future.set_exception, ex)
+
+    _get_blocking_pool().apply_async(call)
+    return future
+
+
+@gen.coroutine
+def wait_for(func, func_args=[], func_kwargs={}, **kwargs):
+    """Coroutine counterpart to :py:func:`utils.wait.wait_for`
+
+    Takes the same arguments, and func may be either a plain function or a coroutine function.
+    Sleeping between checks doesn't block the IOLoop, so many waits can run concurrently.
+
+    Returns:
+        A future, resolved with a tuple containing the output from func() and a float detailing
+        the total wait time.
+
+    Raises:
+        TimedOutError: If num_sec is exceeded after an unsuccessful func() invocation.
+    """
+    wait = _Wait(func, kwargs)
+    message = wait.message
+    while True:
+        wait.checks += 1
+        try:
+            out = func(*func_args, **func_kwargs)
+            if is_future(out):
+                out = yield out
+        except Exception:
+            if wait.handle_exception:
+                out = wait.fail_condition
+            else:
+                raise
+        if out != wait.fail_condition:
+            duration = time.time() - wait.start_time
+            logger.info('Took %f to do %s' % (duration, message))
+            perflog.record('aio.wait_for', duration, message=message, checks=wait.checks,
+                timed_out=False)
+            raise gen.Return((out, duration))
+
+        sleep_time = wait.next_delay()
+        if sleep_time is None:
+            break
+        yield gen.sleep(sleep_time)
+        if wait.fail_func:
+            wait.fail_func()
+
+    t_delta = time.time() - wait.start_time
+    perflog.record('aio.wait_for', t_delta, message=message, checks=wait.checks, timed_out=True)
+    logger.error('Could not complete %s in time, took %f' % (message, t_delta))
+    raise TimedOutError("Could not do %s in time" % message)
+
+
+def poll_provider(method, *args, **wait_kwargs):
+    """Wait for a blocking provider call to return something other than ``fail_condition``
+
+    Each call to the provider runs through :py:func:`run_blocking`.
+
+    Args:
+        method: A :py:class:`utils.mgmt_system.MgmtSystemAPIBase` method, like
+            ``mgmt.is_vm_running``
+        *args: Arguments for method
+        **wait_kwargs: Keyword arguments for :py:func:`wait_for`
+
+    Returns: A future, resolved like :py:func:`wait_for`
+    """
+    wait_kwargs.setdefault('message', '%s%r' % (method.__name__, args))
+    return wait_for(lambda: run_blocking(method, *args), **wait_kwargs)
+
+
+@gen.coroutine
+def run_command(ssh_client, command, poll_interval=0.1):
+    """Coroutine to run a command over ssh, without blocking while it runs
+
+    Args:
+        ssh_client: A :py:class:`utils.ssh.SSHClient`
+        command: Command to run
+        poll_interval: Seconds between checks for output and exit status
+
+    Returns: A future, resolved with an (exit status, output) tuple, like
+        :py:meth:`utils.ssh.SSHClient.run_command`
+    """
+    # Connecting is quick and blocking in paramiko, running the command is what takes time
+    with ssh_client as ctx:
+        session = ctx.get_transport().open_session()
+        try:
+            session.exec_command('%s\n' % command)
+            output = []
+            while True:
+                while session.recv_ready():
+                    output.append(session.recv(4096))
+                while session.recv_stderr_ready():
+                    output.append(session.recv_stderr(4096))
+                if session.exit_status_ready() and not session.recv_ready() \
+                        and not session.recv_stderr_ready():
+                    break
+                yield gen.sleep(poll_interval)
+            raise gen.Return((session.recv_exit_status(), ''.join(output)))
+        finally:
+            session.close()
+
+
+@gen.coroutine
+def http_get_json(url, **request_kwargs):
+    """Coroutine to GET a url and decode its JSON response, e.g. to query the event listener
+
+    Args:
+        url: URL to get
+        **request_kwargs: Keyword arguments for ``tornado.httpclient.HTTPRequest``
+
+    Returns: A future, resolved with the decoded response
+    """
+    response = yield AsyncHTTPClient().fetch(url, **request_kwargs)
+    raise gen.Return(json.loads(response.body))
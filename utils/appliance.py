@@ -1,10 +1,14 @@
 import os
 import subprocess
+import threading
+import time
 
 import requests
 
-from utils import async, conf, db, lazycache
+from utils import conf, db, ip_discovery, lazycache
+from utils.async import StreamingPool
 from utils.browser import browser_session
+from utils.log import logger
 from utils.path import scripts_path
 from utils.providers import provider_factory
 from utils.randomness import generate_random_string
@@ -46,17 +50,11 @@ class Appliance(object):
 
     @lazycache
     def address(self):
-        def is_ip_available():
-            try:
-                return self._provider.get_ip_address(self._vm_name)
-            except AttributeError:
-                return False
-
-        if self._address is None:
-            ec, tc = wait_for(is_ip_available,
-                              delay=5,
-                              num_sec=30)
-        return self.ec
+        """The appliance's IP address, waiting for the provider to report it if needed
+
+        See :py:mod:`utils.ip_discovery`
+        """
+        return ip_discovery.get_ip_address(self._provider_name, self._vm_name)
 
     @lazycache
     def db_address(self):
@@ -275,6 +273,7 @@ class ApplianceSet(object):
     def __init__(self, primary_appliance=None, secondary_appliances=None):
         self.primary = primary_appliance
         self.secondary = secondary_appliances or list()
+        self.timings = dict()
 
     @property
     def all_appliances(self):
@@ -293,7 +292,12 @@ class ApplianceSet(object):
         return None
 
 
-def provision_appliance(version, vm_name_prefix='cfme'):
+def _generate_vm_name(version, vm_name_prefix):
+    version_digits = ''.join([letter for letter in version if letter.isdigit()])
+    return '{}_{}_{}'.format(vm_name_prefix, version_digits, generate_random_string())
+
+
+def provision_appliance(version, vm_name_prefix='cfme', provider_name=None, vm_name=None):
     """Provisions fresh, unconfigured appliance of a specific version
 
     Note:
@@ -303,6 +307,10 @@ def provision_appliance(version, vm_name_prefix='cfme'):
     Args:
         version: version of appliance to provision
         vm_name_prefix: name prefix to use when deploying the appliance vm
+        provider_name: key of the provider to deploy on, defaults to
+            ``appliance_provisioning > provider`` in ``cfme_data.yaml``
+        vm_name: name of the appliance vm, generated from ``vm_name_prefix`` and ``version``
+            if not set
 
     Returns: Unconfigured appliance; instance of :py:class:`Appliance`
 
@@ -316,17 +324,14 @@ def provision_appliance(version, vm_name_prefix='cfme'):
         my_appliance.configure(patch_ajax_wait=False)
         (identical outcome)
     """
-
-    def _generate_vm_name():
-        version_digits = ''.join([letter for letter in version if letter.isdigit()])
-        return '{}_{}_{}'.format(vm_name_prefix, version_digits, generate_random_string())
-
     templates_by_version = conf.cfme_data['appliance_provisioning']['versions']
-    provider_name = conf.cfme_data['appliance_provisioning']['provider']
+    if provider_name is None:
+        provider_name = conf.cfme_data['appliance_provisioning']['provider']
     prov_data = conf.cfme_data['management_systems'][provider_name]
 
     provider = provider_factory(provider_name)
-    vm_name = _generate_vm_name()
+    if vm_name is None:
+        vm_name = _generate_vm_name(version, vm_name_prefix)
 
     try:
         template_name = templates_by_version[version]
@@ -344,7 +349,8 @@ def provision_appliance(version, vm_name_prefix='cfme'):
     return Appliance(provider_name, vm_name)
 
 
-def provision_appliance_set(appliance_set_data, vm_name_prefix='cfme'):
+def provision_appliance_set(appliance_set_data, vm_name_prefix='cfme',
+                            concurrency=None, retries=None):
     """Provisions configured appliance set according to appliance_set_data dict
 
     This provides complete working appliance set - with DBs enabled and names set.
@@ -352,8 +358,17 @@ def provision_appliance_set(appliance_set_data, vm_name_prefix='cfme'):
     Primary appliance will have internal database enabled and secondary appliances
     will be connected to the database on primary.
 
+    Provisioning is a pipeline: appliance templates are deployed concurrently, and each
+    appliance moves on to its configuration as soon as its own deployment finishes. The primary
+    appliance is configured right away, secondary appliances are configured as soon as the
+    primary's database is up.
+
     Args:
         vm_name_prefix: name prefix to use when deploying the appliance vms
+        concurrency: maximum number of templates deployed at once on each provider, defaults to
+            ``appliance_provisioning > concurrency`` in ``cfme_data.yaml``, or ``2``
+        retries: number of times a failed deployment is cleaned up and tried again, defaults to
+            ``appliance_provisioning > retries`` in ``cfme_data.yaml``, or ``2``
         appliance_set_data: dict that corresponds to the following yaml structure:
 
     .. code-block:: yaml
@@ -366,54 +381,150 @@ def provision_appliance_set(appliance_set_data, vm_name_prefix='cfme'):
               version: 1.2.3
             - name: name_secondary_2
               version: 1.3.3
+              # optional, defaults to appliance_provisioning > provider
+              provider: other_provider_name
 
     Warning:
         Secondary appliances must be of the same or lower version than the primary one.
         Otherwise, there is a risk that the secondary of higher version will try to
         migrate the primary's database (and fail at it).
 
-    Returns: Configured appliance set; instance of :py:class:`ApplianceSet`
-    """
-
-    primary_data = appliance_set_data['primary_appliance']
-    secondary_data = appliance_set_data.get('secondary_appliances') or []
-    all_appliances_data = [primary_data] + secondary_data
+    Returns: Configured appliance set; instance of :py:class:`ApplianceSet`. Per-appliance
+        timings are stored in its ``timings`` dict, keyed by appliance name.
 
-    # --- Provisioning stage
-    # Provisioning runs asynchronously, out of order; results are returned in order (crucial)
-    prov_args = []
-    for appliance_data in all_appliances_data:
-        prov_args.append((appliance_data['version'], vm_name_prefix))
-
-    try:
-        # This can raise very cryptic exceptions
-        with async.ResultsPool() as res_pool:
-            res_pool.map_async(_provision_appliance_wrapped, prov_args)
-    except:
-        raise ApplianceException(
-            'Failed to provision appliance set - error in provisioning stage\n'
-            'Check cfme_data yaml for errors in template names and provider setup')
-
-    provisioned_appliances = res_pool.results[0].get()
-    # ---
-
-    # --- Configuration stage
-    appliance_set = ApplianceSet(provisioned_appliances[0], provisioned_appliances[1:])
-    appliance_set.primary.configure(name_to_set=primary_data['name'])
-    for i, appliance in enumerate(appliance_set.secondary):
-        appliance.configure(db_address=appliance_set.primary.address,
-                            name_to_set=secondary_data[i]['name'])
-    # ---
-
-    return appliance_set
+    Raises:
+        ApplianceException: If any appliance failed to provision or configure, listing
+            the failure of each appliance. The appliances that did deploy are destroyed first.
+    """
+    prov_conf = conf.cfme_data['appliance_provisioning']
+    if concurrency is None:
+        concurrency = prov_conf.get('concurrency', 2)
+    if retries is None:
+        retries = prov_conf.get('retries', 2)
 
+    pipeline = _ApplianceSetPipeline(appliance_set_data, vm_name_prefix, concurrency, retries)
+    return pipeline.run()
 
-def _provision_appliance_wrapped(args):
-    """A wrapper to use for async provisioning
 
-    Needed, because map_async only accepts a single iterable.
+class _ApplianceSetPipeline(object):
+    """Deploys and configures the appliances of an appliance set, one pooled thread per appliance
 
-    Note:
-        Must be defined in top level.
+    Used by :py:func:`provision_appliance_set`
     """
-    return provision_appliance(*args)
+    def __init__(self, appliance_set_data, vm_name_prefix, concurrency, retries):
+        primary_data = appliance_set_data['primary_appliance']
+        secondary_data = appliance_set_data.get('secondary_appliances') or []
+        self.all_appliances_data = [primary_data] + secondary_data
+        self.vm_name_prefix = vm_name_prefix
+        self.retries = retries
+
+        default_provider = conf.cfme_data['appliance_provisioning']['provider']
+        self._providers = [data.get('provider', default_provider)
+            for data in self.all_appliances_data]
+        self._deploy_slots = {provider_name: threading.BoundedSemaphore(concurrency)
+            for provider_name in set(self._providers)}
+
+        self._primary_configured = threading.Event()
+        self._lock = threading.Lock()
+        self.appliances = [None] * len(self.all_appliances_data)
+        # Appliances whose template deployed, configured or not
+        self.deployed = [None] * len(self.all_appliances_data)
+        self.timings = {}
+        self.errors = {}
+
+    def run(self):
+        with StreamingPool(len(self.all_appliances_data)) as pool:
+            pool.map_async(self._provision, range(len(self.all_appliances_data)))
+            for task in pool.as_completed():
+                name = self.all_appliances_data[task.args[0]]['name']
+                logger.info('Appliance {} provisioning timings: {}'.format(
+                    name, self.timings[name]))
+
+        if self.errors:
+            # Don't leave the appliances that did deploy running on their providers
+            for appliance in self.deployed:
+                if appliance is not None:
+                    _cleanup_vm(appliance._provider_name, appliance._vm_name)
+            raise ApplianceException('Failed to provision appliance set\n{}'.format(
+                '\n'.join('{}: {}'.format(name, error)
+                    for name, error in sorted(self.errors.iteritems()))))
+
+        appliance_set = ApplianceSet(self.appliances[0], self.appliances[1:])
+        appliance_set.timings = self.timings
+        return appliance_set
+
+    def _provision(self, index):
+        appliance_data = self.all_appliances_data[index]
+        name = appliance_data['name']
+        timing = {'attempts': 0}
+        with self._lock:
+            self.timings[name] = timing
+        start_time = time.time()
+        stage = 'deploy'
+        try:
+            appliance = self.deployed[index] = self._deploy(index, timing)
+            timing['deploy'] = time.time() - start_time
+
+            if index == 0:
+                stage = 'configure'
+                appliance.configure(name_to_set=name)
+            else:
+                stage = 'wait for primary'
+                self._primary_configured.wait()
+                primary = self.appliances[0]
+                if primary is None:
+                    raise ApplianceException('Primary appliance failed, not configuring')
+                timing['wait_for_primary'] = time.time() - start_time - timing['deploy']
+                stage = 'configure'
+                appliance.configure(db_address=primary.address, name_to_set=name)
+            timing['total'] = time.time() - start_time
+            timing['configure'] = timing['total'] - timing['deploy'] - \
+                timing.get('wait_for_primary', 0)
+            self.appliances[index] = appliance
+        except Exception as ex:
+            logger.error('Appliance {} failed in {} stage'.format(name, stage))
+            logger.exception(ex)
+            vm_name = timing.get('vm_name')
+            with self._lock:
+                self.errors[name] = '{} stage failed on vm {}: {}: {}'.format(
+                    stage, vm_name, type(ex).__name__, ex)
+        finally:
+            if index == 0:
+                # Release the secondaries, whether or not the primary made it
+                self._primary_configured.set()
+
+    def _deploy(self, index, timing):
+        """Deploys an appliance template, cleaning up and retrying on provider failures"""
+        appliance_data = self.all_appliances_data[index]
+        version = appliance_data['version']
+        provider_name = self._providers[index]
+
+        with self._deploy_slots[provider_name]:
+            for attempt in range(self.retries + 1):
+                vm_name = _generate_vm_name(version, self.vm_name_prefix)
+                timing['attempts'] += 1
+                timing['vm_name'] = vm_name
+                try:
+                    return provision_appliance(version, self.vm_name_prefix,
+                        provider_name=provider_name, vm_name=vm_name)
+                except ApplianceException:
+                    # Configuration errors, like a missing template, won't go away on retry
+                    raise
+                except Exception as ex:
+                    logger.warning('Deploying {} on {} failed ({}: {})'.format(
+                        vm_name, provider_name, type(ex).__name__, ex))
+                    # Half-provisioned vms are cleaned up on the last attempt too
+                    _cleanup_vm(provider_name, vm_name)
+                    if attempt == self.retries:
+                        raise
+                    logger.info('Retrying deployment on {}'.format(provider_name))
+
+
+def _cleanup_vm(provider_name, vm_name):
+    """Deletes a vm left behind by a failed deployment, if there is one"""
+    try:
+        provider = provider_factory(provider_name)
+        if provider.does_vm_exist(vm_name):
+            provider.delete_vm(vm_name)
+    except Exception as ex:
+        logger.warning('Failed to clean up vm {} on {}: {}'.format(vm_name, provider_name, ex))
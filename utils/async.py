@@ -1,4 +1,9 @@
-from multiprocessing.pool import CLOSE, Pool
+import Queue
+import threading
+import time
+import traceback
+from multiprocessing import TimeoutError
+from multiprocessing.pool import CLOSE, Pool, ThreadPool
 
 class ResultsPool(Pool):
     """multiprocessing.Pool boilerplate wrapper
@@ -34,3 +39,287 @@ class ResultsPool(Pool):
     def __exit__(self, *args, **kwargs):
         self.close()
         self.join()
+
+
+class Task(object):
+    """A task submitted to a :py:class:`StreamingPool`
+
+    Attributes:
+        func: The function called
+        args: Positional arguments passed to func
+        kwargs: Keyword arguments passed to func
+        start_time: When func started running, ``None`` if it hasn't yet
+        end_time: When func finished running, ``None`` if it hasn't yet
+        result: What func returned
+        exception: The exception func raised, if any
+        traceback: Formatted traceback of the exception, if any
+
+    """
+    def __init__(self, func, args, kwargs, cancellable=True):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.start_time = None
+        self.end_time = None
+        self.result = None
+        self.exception = None
+        self.traceback = None
+        self.cancelled = False
+        self._cancellable = cancellable
+        self._event = threading.Event()
+        # Guards cancelling against starting and finishing
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        """Seconds func took to run, ``None`` if it hasn't finished"""
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def ready(self):
+        """``True`` if the task finished, or was cancelled"""
+        return self._event.is_set()
+
+    def successful(self):
+        """``True`` if func finished without raising an exception"""
+        return self.ready() and not self.cancelled and self.exception is None
+
+    def wait(self, timeout=None):
+        """Wait for the task to finish, returns ``True`` if it did"""
+        return self._event.wait(timeout)
+
+    def get(self, timeout=None):
+        """Wait for the task to finish, and return its result
+
+        Raises:
+            TimeoutError: If the task didn't finish in time
+            CancelledError: If the task was cancelled
+            Exception: Whatever func raised
+        """
+        if not self.wait(timeout):
+            raise TimeoutError
+        if self.cancelled:
+            raise CancelledError
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def cancel(self):
+        """Cancel the task, if it hasn't started yet
+
+        Tasks running in processes can't be cancelled.
+
+        Returns: ``True`` if the task was cancelled
+        """
+        if not self._cancellable:
+            return False
+        return self._cancel()
+
+    def _cancel(self):
+        with self._lock:
+            if self.start_time is not None or self.cancelled or self.ready():
+                return False
+            self.cancelled = True
+        self._event.set()
+        return True
+
+    def _start(self):
+        """Marks the task as started, so it can no longer be cancelled
+
+        Returns: ``False`` if the task was cancelled before it could start
+        """
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.start_time = time.time()
+            return True
+
+    def _finish(self, outcome):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.start_time, self.end_time, self.result, self.exception, self.traceback = \
+                outcome
+        self._event.set()
+
+    def __repr__(self):
+        return '<Task %s%r>' % (getattr(self.func, '__name__', self.func), tuple(self.args))
+
+
+def _timed_call(func, args, kwargs):
+    """Calls func, returns a (start_time, end_time, result, exception, traceback) tuple"""
+    start_time = time.time()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as ex:
+        return start_time, time.time(), None, ex, traceback.format_exc()
+    return start_time, time.time(), result, None, None
+
+
+def _run_task(task):
+    """Thread pool counterpart to :py:func:`_timed_call`, which can skip cancelled tasks"""
+    if not task._start():
+        return None
+    return _timed_call(task.func, task.args, task.kwargs)
+
+
+class StreamingPool(object):
+    """Pool of threads (or processes), handing out results as soon as each task finishes
+
+    Unlike :py:class:`ResultsPool`, tasks run in threads by default, so they can be any
+    callable (lambdas, bound methods, closures) and take or return objects that can't be
+    pickled. This suits I/O bound work, like provider calls and SSH commands.
+
+    Every task is a :py:class:`Task`, recording its timing, result or exception.
+
+    Args:
+        processes: Number of worker threads (or processes), defaults to the number of cpus
+        use_processes: Run tasks in processes instead of threads; their functions, arguments
+            and results must then be picklable, and tasks can't be cancelled
+
+    Usage:
+
+        with StreamingPool(4) as pool:
+            for vm_name in vm_names:
+                pool.apply_async(mgmt.start_vm, [vm_name])
+            for task in pool.as_completed(timeout=600):
+                print task.args, task.duration, task.exception
+
+    """
+    def __init__(self, processes=None, use_processes=False):
+        self.use_processes = use_processes
+        if use_processes:
+            self._pool = Pool(processes)
+        else:
+            self._pool = ThreadPool(processes)
+        self.results = []
+        self._completed = Queue.Queue()
+
+    def apply_async(self, func, args=(), kwds={}):
+        """Submit a task
+
+        Returns: A :py:class:`Task`
+        """
+        task = Task(func, args, kwds, cancellable=not self.use_processes)
+        self.results.append(task)
+
+        def callback(outcome):
+            if outcome is not None:
+                task._finish(outcome)
+                self._completed.put(task)
+
+        if self.use_processes:
+            self._pool.apply_async(_timed_call, [func, args, kwds], callback=callback)
+        else:
+            self._pool.apply_async(_run_task, [task], callback=callback)
+        return task
+
+    def map_async(self, func, iterable):
+        """Submit a task per item of iterable
+
+        Returns: A list of :py:class:`Task`
+        """
+        return [self.apply_async(func, [item]) for item in iterable]
+
+    def as_completed(self, timeout=None, task_timeout=None):
+        """Yield tasks as they finish, until all tasks not cancelled have been yielded
+
+        Tasks submitted while iterating are included.
+
+        Args:
+            timeout: Seconds to wait for all tasks, no limit by default
+            task_timeout: Seconds each task may run, counted from when it started. Tasks still
+                running after that are yielded unfinished, with ``ready()`` ``False``, and not
+                yielded again when they finish. Tasks running in processes don't report when
+                they start, so they never time out.
+
+        Raises:
+            TimeoutError: If tasks are still running after timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        yielded = set()
+        while True:
+            if all(task.cancelled or task in yielded for task in self.results):
+                return
+            # A timeout on get keeps KeyboardInterrupt working while waiting
+            waits = [60 if deadline is None else deadline - time.time()]
+            if task_timeout is not None:
+                now = time.time()
+                timed_out = []
+                for task in self.results:
+                    if task in yielded or task.ready() or task.cancelled:
+                        continue
+                    if task.start_time is None:
+                        # Check back soon, for when it starts
+                        if not self.use_processes:
+                            waits.append(min(task_timeout, 1))
+                        continue
+                    task_wait = task.start_time + task_timeout - now
+                    if task_wait <= 0:
+                        timed_out.append(task)
+                    else:
+                        waits.append(task_wait)
+                if timed_out:
+                    for task in timed_out:
+                        yielded.add(task)
+                        yield task
+                    continue
+            try:
+                task = self._completed.get(timeout=max(min(waits), 0))
+            except Queue.Empty:
+                if deadline is not None and time.time() >= deadline:
+                    raise TimeoutError
+                continue
+            if task not in yielded:
+                yielded.add(task)
+                yield task
+
+    def cancel(self):
+        """Cancel all tasks that haven't started yet
+
+        Worker processes don't report when a task starts, so tasks running in processes can't be
+        cancelled, and nothing is.
+
+        Returns: The list of cancelled tasks
+        """
+        return [task for task in self.results if task.cancel()]
+
+    @property
+    def successful(self):
+        if self.results:
+            return all([task.successful() for task in self.results if not task.cancelled])
+        else:
+            return None
+
+    def close(self):
+        self._pool.close()
+
+    def join(self):
+        self._pool.join()
+
+    def terminate(self):
+        """Stop the pool without waiting for running tasks
+
+        Worker processes are killed, and their unfinished tasks cancelled; worker threads can't
+        be, so they're left to finish.
+        """
+        if self.use_processes:
+            self._pool.terminate()
+            for task in self.results:
+                task._cancel()
+        else:
+            self.cancel()
+            self._pool.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+        self.join()
+
+
+class CancelledError(Exception):
+    """Raised when getting the result of a cancelled :py:class:`Task`"""
+    pass
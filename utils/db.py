@@ -3,18 +3,14 @@ from contextlib import contextmanager
 from itertools import izip
 from urlparse import urlparse
 from tempfile import NamedTemporaryFile
+from time import time
 
 import yaml
-from sqlalchemy import MetaData, create_engine, inspect
-from sqlalchemy.exc import ArgumentError, InvalidRequestError
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 from utils import conf, lazycache
 from utils.datafile import load_data_file
-from utils.log import logger
+from utils.log import logger, perflog
 from utils.path import data_path
-from utils.ssh import SSHClient
 
 
 class Db(Mapping):
@@ -54,16 +50,27 @@ class Db(Mapping):
         a slow connection, this can be extremely slow, which will affect methods that return
         tables, like the mapping interface or :py:meth:`values`.
 
+    Nothing is read from the conf yamls, and sqlalchemy isn't imported, until the database
+    is actually used, so creating a Db (and importing this module) is cheap.
+
     '''
     _table_cache = dict()
 
     def __init__(self, hostname=None, credentials=None):
-        if hostname is None:
-            self.hostname = urlparse(conf.env['base_url']).hostname
-        else:
+        if hostname is not None:
             self.hostname = hostname
+        if credentials:
+            self.credentials = credentials
 
-        self.credentials = credentials or conf.credentials['database']
+    @lazycache
+    def hostname(self):
+        """Database hostname, from ``conf.env['base_url']`` if not given"""
+        return urlparse(conf.env['base_url']).hostname
+
+    @lazycache
+    def credentials(self):
+        """Database credentials, ``conf.credentials['database']`` if not given"""
+        return conf.credentials['database']
 
     def __getitem__(self, table_name):
         """Access tables as items contained in this db
@@ -76,6 +83,7 @@ class Db(Mapping):
         This may return ``None`` in the case where a table is found but reflection fails.
 
         """
+        from sqlalchemy.exc import InvalidRequestError
         try:
             return self._table(table_name)
         except InvalidRequestError:
@@ -137,8 +145,23 @@ class Db(Mapping):
 
     @lazycache
     def engine(self):
-        """The :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>` for this database"""
-        return create_engine(self.db_url)
+        """The :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>` for this database
+
+        Query times are recorded to the perflog as ``db.query`` events.
+
+        """
+        from sqlalchemy import create_engine, event
+        engine = create_engine(self.db_url)
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._perflog_start = time()
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            perflog.record('db.query', time() - context._perflog_start, host=self.hostname)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        return engine
 
     @lazycache
     def sessionmaker(self):
@@ -147,6 +170,7 @@ class Db(Mapping):
         Used to make new sessions with this database, as needed.
 
         """
+        from sqlalchemy.orm import sessionmaker
         return sessionmaker(bind=self.engine)
 
     @lazycache
@@ -156,6 +180,7 @@ class Db(Mapping):
         This base class is created using
         :py:class:`declarative_base <sqlalchemy:sqlalchemy.ext.declarative.declarative_base>`.
         """
+        from sqlalchemy.ext.declarative import declarative_base
         return declarative_base(metadata=self.metadata)
 
     @lazycache
@@ -170,6 +195,7 @@ class Db(Mapping):
             use :py:meth:`reflect_table`.
 
         """
+        from sqlalchemy import MetaData
         return MetaData(bind=self.engine)
 
     @lazycache
@@ -181,6 +207,7 @@ class Db(Mapping):
     @lazycache
     def table_names(self):
         """A sorted list of table names available in this database."""
+        from sqlalchemy import inspect
         # rails table names follow similar rules as pep8 identifiers; expose them as such
         return sorted(inspect(self.engine).get_table_names())
 
@@ -237,6 +264,7 @@ class Db(Mapping):
 
         Actual implementation of __getitem__
         """
+        from sqlalchemy.exc import ArgumentError
         try:
             return self._table_cache[table_name]
         except KeyError:
@@ -322,6 +350,8 @@ def set_yaml_config(config_name, data_dict, hostname=None):
         set_yaml_config('vmdb', vmdb_yaml, '1.2.3.4')
 
     """
+    # paramiko is only imported when it's needed
+    from utils.ssh import SSHClient
     # CFME does a lot of things when loading a configfile, so
     # let their native conf loader handle the job
     # If hostname is defined, connect to the specified server
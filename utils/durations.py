@@ -0,0 +1,189 @@
+"""Test duration history
+
+Setup, call and teardown durations of every test are kept in a local SQLite database,
+``cache/durations.sqlite`` by default, along with the appliance version they were run against.
+:py:mod:`fixtures.durations` records to it, and uses it to order test runs and flag tests that
+got slower.
+
+Usage:
+
+.. code-block:: python
+
+    from utils.durations import DurationHistory
+
+    history = DurationHistory()
+    run_id = history.add_run('5.2.3.2', {
+        'cfme/tests/test_login.py::test_login': ('passed', 1.0, 5.2, 0.1),
+    })
+    history.estimates()
+    history.regressions(run_id)
+
+"""
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+
+from utils.path import cache_path
+
+#: Runs used to estimate test durations and baselines
+BASELINE_RUNS = 10
+
+#: Runs kept in the history, older runs are pruned
+KEEP_RUNS = 50
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT,
+    version TEXT
+);
+CREATE TABLE IF NOT EXISTS durations (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    nodeid TEXT,
+    outcome TEXT,
+    setup REAL,
+    call REAL,
+    teardown REAL
+);
+CREATE INDEX IF NOT EXISTS durations_nodeid ON durations (nodeid, run_id);
+'''
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class DurationHistory(object):
+    """SQLite history of test durations
+
+    Only passed tests are used for estimates and baselines, since failures tend to be much
+    faster (or slower) than the test normally is.
+
+    Args:
+        path: Path to the SQLite database, created if needed
+
+    """
+    def __init__(self, path=None):
+        self.path = path or cache_path.join('durations.sqlite')
+        self.path.dirpath().ensure(dir=True)
+        self._connection = sqlite3.connect(str(self.path))
+        self._connection.executescript(_schema)
+
+    def close(self):
+        self._connection.close()
+
+    def add_run(self, version, durations):
+        """Record the durations of a test run
+
+        Args:
+            version: Version of the appliance the tests ran against
+            durations: A dict of test nodeid to an ``(outcome, setup, call, teardown)`` tuple,
+                with durations in seconds
+
+        Returns: The id of the new run
+        """
+        with self._connection as connection:
+            cursor = connection.execute('INSERT INTO runs (started, version) VALUES (?, ?)',
+                (datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), version))
+            run_id = cursor.lastrowid
+            connection.executemany('INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?)',
+                ((run_id, nodeid) + tuple(duration)
+                    for nodeid, duration in durations.iteritems()))
+            # Prune old runs, keeping the history (and the time it takes to read it) bounded
+            connection.execute('DELETE FROM durations WHERE run_id <= ?', (run_id - KEEP_RUNS,))
+            connection.execute('DELETE FROM runs WHERE id <= ?', (run_id - KEEP_RUNS,))
+        return run_id
+
+    def _recent_durations(self, version=None, before_run=None):
+        # {nodeid: [total durations]} for passed tests, newest first, up to BASELINE_RUNS each
+        query = ('SELECT nodeid, setup + call + teardown FROM durations JOIN runs ON run_id = id'
+            ' WHERE outcome = "passed"')
+        params = []
+        if version is not None:
+            query += ' AND version = ?'
+            params.append(version)
+        if before_run is not None:
+            query += ' AND run_id < ?'
+            params.append(before_run)
+        query += ' ORDER BY run_id DESC'
+
+        durations = defaultdict(list)
+        for nodeid, duration in self._connection.execute(query, params):
+            if len(durations[nodeid]) < BASELINE_RUNS:
+                durations[nodeid].append(duration)
+        return durations
+
+    def estimates(self, version=None):
+        """Estimated duration of each test, the median of its recent runs
+
+        Args:
+            version: Only use runs against this appliance version, defaults to all versions
+
+        Returns: A dict of test nodeid to estimated seconds
+        """
+        return {nodeid: _median(durations)
+            for nodeid, durations in self._recent_durations(version).iteritems()}
+
+    def regressions(self, run_id, factor=2.0, min_seconds=1.0, min_runs=3):
+        """Tests in a run that took significantly longer than their baseline
+
+        A test's baseline is the median duration of its recent passed runs against the same
+        appliance version.
+
+        Args:
+            run_id: Id of the run to check, from :py:meth:`add_run`
+            factor: How many times longer than its baseline a test must take to be flagged
+            min_seconds: How many seconds longer than its baseline a test must take to be flagged
+            min_runs: Tests with fewer recent runs than this have no baseline, and aren't flagged
+
+        Returns: A list of ``(nodeid, seconds, baseline seconds)`` tuples, largest slowdown first
+        """
+        version, = self._connection.execute(
+            'SELECT version FROM runs WHERE id = ?', (run_id,)).fetchone()
+        history = self._recent_durations(version, before_run=run_id)
+        run_durations = self._connection.execute('SELECT nodeid, setup + call + teardown'
+            ' FROM durations WHERE run_id = ? AND outcome = "passed"', (run_id,))
+
+        regressions = []
+        for nodeid, seconds in run_durations:
+            if len(history.get(nodeid, [])) < min_runs:
+                continue
+            baseline = _median(history[nodeid])
+            if seconds > baseline * factor and seconds - baseline > min_seconds:
+                regressions.append((nodeid, seconds, baseline))
+        return sorted(regressions, key=lambda r: r[1] - r[2], reverse=True)
+
+
+def order_by_duration(items, estimates):
+    """Order test items longest module first, keeping the order of tests within modules
+
+    Tests are kept together by module, so module-scoped fixtures are still only set up once per
+    module. Modules with no history are estimated at the average duration of tests that have
+    one, per test.
+
+    Args:
+        items: Test items, as collected by py.test
+        estimates: A dict of test nodeid to estimated seconds, from
+            :py:meth:`DurationHistory.estimates`
+
+    Returns: The reordered list of items
+    """
+    default = sum(estimates.values()) / len(estimates) if estimates else 0
+    modules = []
+    module_items = {}
+    for item in items:
+        module = item.nodeid.split('::', 1)[0]
+        if module not in module_items:
+            modules.append(module)
+            module_items[module] = []
+        module_items[module].append(item)
+
+    def module_duration(module):
+        return sum(estimates.get(item.nodeid, default) for item in module_items[module])
+    # sorted is stable, so modules of equal duration stay in collection order
+    modules = sorted(modules, key=module_duration, reverse=True)
+    return [item for name in modules for item in module_items[name]]
@@ -0,0 +1,372 @@
+"""Test impact map, used to run only the tests affected by a change
+
+While recording, every Python function called by a test is traced, and the project files the
+test executed (page objects, locators, utilities) are stored in the impact map, along with the
+project modules its test module imports. Every import made while recording is traced too, and
+the project files each module imports are stored, so a data-only module (a locator table, a
+menu dict) reached through other modules' imports still affects the tests importing them. Given
+the files changed in git, the map tells which tests could be affected.
+
+Setup is traced per test module rather than per test, since module-scoped fixtures are only set
+up by the first test of a module. Changes to files executed during setup select every test in
+the module.
+
+Some changes, like fixtures, plugins and non-Python files, can affect any test. See
+:py:func:`full_run_reason`. So can Python files that no test executed or imported while
+recording, see :py:meth:`ImpactMap.unrecorded`.
+
+Usage:
+
+.. code-block:: python
+
+    from utils import impact
+
+    tracer = impact.Tracer()
+    tracer.start()
+    tracer.current = files = set()
+    # run a test
+    tracer.stop()
+
+    impact_map = impact.ImpactMap.load()
+    impact_map.add_test('cfme/tests/test_login.py', 'cfme/tests/test_login.py::test_login',
+        setup_files=set(), test_files=files)
+    impact_map.add_imports(impact.import_graph(tracer.imports))
+    impact_map.save()
+    impact_map.affected('cfme/tests/test_login.py::test_login',
+        impact.changed_files('origin/master'))
+
+With pytest, ``--record-impact`` records the map, and ``--changed-since`` selects tests with it,
+see :py:mod:`fixtures.impact`.
+
+"""
+import __builtin__
+import json
+import os
+import subprocess
+import sys
+import threading
+import types
+from fnmatch import fnmatch
+
+from utils.path import cache_path, project_path
+
+#: Where the impact map is stored
+impact_map_path = cache_path.join('impact_map.json')
+
+#: Changed files matching these patterns can affect any test, and select all of them
+full_run_patterns = [
+    'conftest.py',
+    'cfme/fixtures/*',
+    'fixtures/*',
+    'markers/*',
+    'requirements.txt',
+]
+
+#: Changed files matching these patterns don't affect any test
+ignored_patterns = [
+    'docs/*',
+    '*.md',
+    '*.rst',
+]
+
+
+def _project_file(filename):
+    # Path of a source file relative to the project, or None if it isn't part of the project
+    filename = os.path.abspath(filename)
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    relpath = os.path.relpath(filename, project_path.strpath)
+    if relpath.startswith(os.pardir):
+        return None
+    return relpath
+
+
+class Tracer(object):
+    """Records the project files executed while it's running
+
+    Only function calls are traced, not lines, so the overhead on the traced code is kept down.
+    The tracer replaces any other trace function, like a debugger or coverage, while it runs.
+
+    Imports are traced as well, by wrapping ``__import__``. Unlike calls, they're recorded even
+    when the imported module was already loaded.
+
+    Attributes:
+        current: The set the project files executed are added to, ``None`` to record nothing
+        imports: A dict of project file to the set of project files it imported
+    """
+    def __init__(self):
+        self.current = None
+        self.imports = {}
+        self._files = {}
+        self._import = None
+
+    def start(self):
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self._traced_import
+        sys.settrace(self._trace)
+        threading.settrace(self._trace)
+
+    def stop(self):
+        sys.settrace(None)
+        threading.settrace(None)
+        if self._import is not None:
+            __builtin__.__import__ = self._import
+            self._import = None
+
+    def _project_file(self, filename):
+        try:
+            return self._files[filename]
+        except KeyError:
+            project_file = self._files[filename] = _project_file(filename)
+            return project_file
+
+    def _trace(self, frame, event, arg):
+        current = self.current
+        if event == 'call' and current is not None:
+            filename = frame.f_code.co_filename
+            try:
+                project_file = self._files[filename]
+            except KeyError:
+                project_file = self._files[filename] = _project_file(filename)
+            if project_file is not None:
+                current.add(project_file)
+        # Don't trace the lines of the called function
+        return None
+
+    def _traced_import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        module = self._import(name, globals, locals, fromlist, level)
+        importer = globals and globals.get('__file__')
+        importer = importer and self._project_file(importer)
+        if importer is not None:
+            imported = self.imports.setdefault(importer, set())
+            for imported_module in _imported_modules(name, globals, fromlist, level, module):
+                filename = getattr(imported_module, '__file__', None)
+                project_file = filename and self._project_file(filename)
+                if project_file is not None and project_file != importer:
+                    imported.add(project_file)
+        return module
+
+
+def _imported_modules(name, globals, fromlist, level, module):
+    # __import__ returns the top level package for "import a.b", so the module imported is looked
+    # up by name, relative to the importing package first like Python 2 does
+    package = globals.get('__package__')
+    if not package:
+        package = globals.get('__name__', '')
+        if '__path__' not in globals:
+            package = package.rpartition('.')[0]
+    if level > 0:
+        package = '.'.join(package.split('.')[:len(package.split('.')) - level + 1])
+        imported = sys.modules.get('.'.join(filter(None, [package, name])))
+    else:
+        imported = None
+        if level == -1 and package:
+            imported = sys.modules.get('%s.%s' % (package, name))
+        imported = imported or sys.modules.get(name)
+    imported = imported or module
+    modules = [imported]
+    # Submodules imported with "from package import module"
+    for attr in fromlist or ():
+        value = getattr(imported, attr, None)
+        if isinstance(value, types.ModuleType):
+            modules.append(value)
+    return modules
+
+
+def module_imports(module):
+    """Returns the project files of the modules a module imports, and its own file
+
+    Only the modules, and the modules of the functions and classes, in the module's namespace
+    are included, not what those modules import in turn. A package's submodules are left out,
+    since importing a submodule adds it to the package's namespace; the :py:class:`Tracer`
+    records the submodules a package does import.
+    """
+    files = set()
+    submodule_prefix = '%s.' % module.__name__
+    for name, value in vars(module).items():
+        if isinstance(value, types.ModuleType) and value.__name__.startswith(submodule_prefix):
+            continue
+        # Attribute dicts, like the conf yamls, answer __file__ and __module__ with anything
+        if not isinstance(value, types.ModuleType):
+            module_name = getattr(value, '__module__', None)
+            value = sys.modules.get(module_name) if isinstance(module_name, basestring) else None
+        filename = getattr(value, '__file__', None)
+        if isinstance(value, types.ModuleType) and filename is not None:
+            project_file = _project_file(filename)
+            if project_file is not None:
+                files.add(project_file)
+    return files
+
+
+def import_graph(traced_imports):
+    """Returns a dict of project file to the set of project files it imports
+
+    The imports traced by a :py:class:`Tracer` are combined with the :py:func:`module_imports`
+    of every loaded project module, which covers modules imported before the tracer started.
+
+    Args:
+        traced_imports: :py:attr:`Tracer.imports`
+    """
+    graph = {}
+    for module in sys.modules.values():
+        # Python 2 leaves None in sys.modules for failed relative imports, and some libraries
+        # put proxy objects there
+        if not isinstance(module, types.ModuleType):
+            continue
+        filename = getattr(module, '__file__', None)
+        project_file = filename and _project_file(filename)
+        if project_file is not None:
+            imported = module_imports(module) - set([project_file])
+            graph.setdefault(project_file, set()).update(imported)
+    for importer, imported in traced_imports.items():
+        graph.setdefault(importer, set()).update(imported)
+    return graph
+
+
+def changed_files(since):
+    """Returns the project files changed since a git revision, including untracked files
+
+    Args:
+        since: A git revision, like ``origin/master`` or ``HEAD~3``
+    """
+    def git(*args):
+        return subprocess.check_output(('git',) + args, cwd=project_path.strpath).splitlines()
+    # Changes since the revision, committed or not
+    changed = git('diff', '--name-only', '--relative', since)
+    changed.extend(git('ls-files', '--others', '--exclude-standard'))
+    return set(changed)
+
+
+def _affects_all_tests(changed_file):
+    return any(fnmatch(changed_file, pattern) for pattern in full_run_patterns)
+
+
+def full_run_reason(changed):
+    """Returns a changed file that can affect any test, or None
+
+    Args:
+        changed: Changed project files, from :py:func:`changed_files`
+    """
+    for changed_file in sorted(changed):
+        if any(fnmatch(changed_file, pattern) for pattern in ignored_patterns):
+            continue
+        if _affects_all_tests(changed_file) or not changed_file.endswith('.py'):
+            return changed_file
+    return None
+
+
+class ImpactMap(object):
+    """Map of the project files each test executed
+
+    Attributes:
+        tests: A dict of test nodeid to a list of the project files it executed
+        setup: A dict of test module to a list of the project files executed while setting up
+            its tests
+        imports: A dict of project file to a list of the project files it imports
+    """
+    def __init__(self, tests=None, setup=None, imports=None):
+        self.tests = tests or {}
+        self.setup = setup or {}
+        self.imports = imports or {}
+        # The changed files last given to affected, and the files they affect
+        self._affecting = (None, None)
+
+    @classmethod
+    def load(cls, path=None):
+        """Loads the impact map, or returns an empty one if it hasn't been recorded yet"""
+        path = path or impact_map_path
+        if not path.check():
+            return cls()
+        impact_map = json.loads(path.read())
+        return cls(impact_map['tests'], impact_map['setup'], impact_map.get('imports'))
+
+    def save(self, path=None):
+        """Saves the impact map, merging it into the saved map
+
+        Tests recorded in both are replaced with this map's recording, imports are combined.
+        """
+        path = path or impact_map_path
+        saved = type(self).load(path)
+        saved.tests.update(self.tests)
+        for test_module, files in self.setup.items():
+            saved.setup[test_module] = sorted(set(saved.setup.get(test_module, [])) | set(files))
+        saved.add_imports(self.imports)
+        path.dirpath().ensure(dir=True)
+        path.write(json.dumps({'tests': saved.tests, 'setup': saved.setup,
+            'imports': saved.imports}, sort_keys=True))
+
+    def add_test(self, test_module, nodeid, setup_files, test_files):
+        """Record the files executed by a test
+
+        Files that select every test when they change, like plugins, aren't recorded.
+
+        Args:
+            test_module: The test's module, relative to the project
+            nodeid: The test's nodeid
+            setup_files: Project files executed while setting up the test module's tests
+            test_files: Project files executed while running the test
+        """
+        setup_files = set(self.setup.get(test_module, [])) | setup_files
+        self.setup[test_module] = sorted(f for f in setup_files if not _affects_all_tests(f))
+        self.tests[nodeid] = sorted(f for f in test_files if not _affects_all_tests(f))
+
+    def add_imports(self, imports):
+        """Record the project files imported by project files, from :py:func:`import_graph`"""
+        for importer, imported in imports.items():
+            self.imports[importer] = sorted(set(self.imports.get(importer, [])) | set(imported))
+
+    def affected(self, nodeid, changed):
+        """Whether a test could be affected by the changed files
+
+        A test is affected if it executed a changed file, or a file importing one, directly or
+        not. Tests that haven't been recorded are always affected.
+
+        Args:
+            nodeid: The test's nodeid
+            changed: A set of changed project files, from :py:func:`changed_files`
+        """
+        if nodeid not in self.tests:
+            return True
+        affecting = self._affecting_files(changed)
+        test_module = nodeid.split('::', 1)[0]
+        return bool(affecting.intersection(self.tests[nodeid])
+            or affecting.intersection(self.setup.get(test_module, ()))
+            or test_module in affecting)
+
+    def _affecting_files(self, changed):
+        # The changed files, and the files importing them, directly or not
+        changed = frozenset(changed)
+        if self._affecting[0] == changed:
+            return self._affecting[1]
+        importers = {}
+        for importer, imported in self.imports.items():
+            for project_file in imported:
+                importers.setdefault(project_file, []).append(importer)
+        affecting = set(changed)
+        pending = list(changed)
+        while pending:
+            for importer in importers.get(pending.pop(), ()):
+                if importer not in affecting:
+                    affecting.add(importer)
+                    pending.append(importer)
+        self._affecting = (changed, affecting)
+        return affecting
+
+    def unrecorded(self, changed):
+        """Returns a changed Python file that no recorded test executed or imported, or None
+
+        How such a file affects tests is unknown, e.g. a module only read from by modules
+        imported before recording started, so any test could be.
+
+        Args:
+            changed: Changed project files, from :py:func:`changed_files`, without the test modules
+                being run, which are selected by :py:meth:`affected` whether recorded or not
+        """
+        recorded = set(self.imports)
+        for files in self.tests.values() + self.setup.values() + self.imports.values():
+            recorded.update(files)
+        recorded.update(self.setup)
+        for changed_file in sorted(changed):
+            if changed_file.endswith('.py') and changed_file not in recorded:
+                return changed_file
+        return None
@@ -0,0 +1,209 @@
+"""Shared VM IP address discovery
+
+Waiting for a freshly deployed VM to report its IP address usually means polling the provider
+for that one VM until it shows up. With many VMs coming up at once, that's one polling loop per
+VM, each hitting the provider on its own.
+
+Instead, this module runs one discovery service per provider. VMs are added to a watch list,
+and a single background thread asks the provider for the addresses of every watched VM at
+once (see :py:meth:`utils.mgmt_system.MgmtSystemAPIBase.get_ip_addresses`), resolving the
+waiting callers as addresses come in.
+
+Usage:
+
+.. code-block:: python
+
+    from utils import ip_discovery
+
+    # Blocks until the address is known
+    address = ip_discovery.get_ip_address('vsphere5', 'my_vm')
+
+    # Or, for many VMs in parallel
+    discovery = ip_discovery.discovery_for('vsphere5')
+    futures = [discovery.watch(vm_name) for vm_name in vm_names]
+    addresses = [future.result() for future in futures]
+
+"""
+import threading
+import time
+from functools import partial
+
+from utils.log import logger
+from utils.providers import provider_factory
+from utils.wait import TimedOutError
+
+#: Seconds between polls of the provider
+POLL_INTERVAL = 5
+
+#: Seconds to wait for an address, by default
+DEFAULT_TIMEOUT = 600
+
+_discoveries = {}
+_discoveries_lock = threading.Lock()
+
+
+class AddressFuture(object):
+    """The IP address of a watched VM, which may not be known yet
+
+    Args:
+        vm_name: Name of the watched VM
+        timeout: Seconds to wait for the address before giving up
+    """
+    def __init__(self, vm_name, timeout):
+        self.vm_name = vm_name
+        self.deadline = time.time() + timeout
+        self._event = threading.Event()
+        self._address = None
+        self._error = None
+
+    def done(self):
+        """``True`` if the address was found, or discovery failed"""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the address, and return it
+
+        Args:
+            timeout: Seconds to wait, defaults to the timeout given to
+                :py:meth:`IPDiscovery.watch`
+
+        Raises:
+            TimedOutError: If no address was found in time
+        """
+        if timeout is None:
+            timeout = max(self.deadline - time.time(), 0)
+        # Allow the poller a moment to report its own timeout first
+        if not self._event.wait(timeout + 1):
+            raise TimedOutError('Could not get an ip address for %s in time' % self.vm_name)
+        if self._error is not None:
+            raise self._error
+        return self._address
+
+    def _set_result(self, address):
+        self._address = address
+        self._event.set()
+
+    def _set_error(self, error):
+        self._error = error
+        self._event.set()
+
+
+class IPDiscovery(object):
+    """IP address discovery service for one provider
+
+    The background poller starts when the first VM is watched, and stops once all watched VMs
+    have an address (or timed out), so idle services cost nothing.
+
+    Args:
+        mgmt_factory: Callable returning a new :py:class:`utils.mgmt_system.MgmtSystemAPIBase`
+            instance for the poller to use
+        poll_interval: Seconds between polls of the provider
+    """
+    def __init__(self, mgmt_factory, poll_interval=POLL_INTERVAL):
+        self.mgmt_factory = mgmt_factory
+        self.poll_interval = poll_interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def watch(self, vm_name, timeout=DEFAULT_TIMEOUT):
+        """Start watching a VM for its IP address
+
+        Watching a VM that's already watched returns the existing future.
+
+        Args:
+            vm_name: Name of the VM
+            timeout: Seconds to wait for the address
+
+        Returns: An :py:class:`AddressFuture`
+        """
+        with self._lock:
+            future = self._watched.get(vm_name)
+            if future is None:
+                future = AddressFuture(vm_name, timeout)
+                self._watched[vm_name] = future
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll)
+                self._poller.daemon = True
+                self._poller.start()
+        return future
+
+    def _poll(self):
+        mgmt = None
+        try:
+            while True:
+                with self._lock:
+                    self._expire_watched()
+                    if not self._watched:
+                        self._poller = None
+                        return
+
+                try:
+                    if mgmt is None:
+                        mgmt = self.mgmt_factory()
+                    # Taken after connecting, so VMs watched meanwhile are in the first poll
+                    with self._lock:
+                        vm_names = self._watched.keys()
+                    ip_addresses = mgmt.get_ip_addresses(vm_names)
+                except Exception as ex:
+                    # Provider hiccups shouldn't fail the watchers, just try again next time
+                    logger.warning('IP discovery poll failed: %s: %s' % (type(ex).__name__, ex))
+                    ip_addresses = {}
+
+                with self._lock:
+                    for vm_name, address in ip_addresses.iteritems():
+                        if address and vm_name in self._watched:
+                            logger.info('Discovered ip address %s for %s' % (address, vm_name))
+                            self._watched.pop(vm_name)._set_result(address)
+                    if not self._watched:
+                        self._poller = None
+                        return
+
+                time.sleep(self.poll_interval)
+        except Exception as ex:
+            # Unexpected failures fail everyone that's waiting, rather than leaving them hanging
+            with self._lock:
+                for future in self._watched.values():
+                    future._set_error(ex)
+                self._watched.clear()
+                self._poller = None
+        finally:
+            if mgmt is not None:
+                try:
+                    mgmt.disconnect()
+                except Exception:
+                    pass
+
+    def _expire_watched(self):
+        now = time.time()
+        for vm_name, future in self._watched.items():
+            if now > future.deadline:
+                future._set_error(
+                    TimedOutError('Could not get an ip address for %s in time' % vm_name))
+                del self._watched[vm_name]
+
+
+def discovery_for(provider_key):
+    """Returns the shared :py:class:`IPDiscovery` service for a provider
+
+    Args:
+        provider_key: Provider key name from cfme_data
+    """
+    with _discoveries_lock:
+        if provider_key not in _discoveries:
+            _discoveries[provider_key] = IPDiscovery(partial(provider_factory, provider_key))
+        return _discoveries[provider_key]
+
+
+def get_ip_address(provider_key, vm_name, timeout=DEFAULT_TIMEOUT):
+    """Waits for a VM's IP address, using the provider's shared discovery service
+
+    Args:
+        provider_key: Provider key name from cfme_data
+        vm_name: Name of the VM
+        timeout: Seconds to wait for the address
+
+    Raises:
+        TimedOutError: If no address was found in time
+    """
+    return discovery_for(provider_key).watch(vm_name, timeout).result()
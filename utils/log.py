@@ -130,14 +130,21 @@ Members
 ^^^^^^^
 
 """
+import atexit
+import json
 import logging
+import math
 import sys
+import threading
 import warnings
 import datetime as dt
 
+from collections import defaultdict
+from itertools import count
 from logging.handlers import RotatingFileHandler, SysLogHandler
+from Queue import Queue
 from time import time
-from traceback import extract_tb
+from traceback import extract_tb, print_exc
 
 from utils import conf
 from utils.path import get_rel_path, log_path
@@ -145,6 +152,11 @@ from utils.randomness import generate_random_string
 
 MARKER_LEN = 80
 
+# Running QueueListeners, by logger name
+_listeners = {}
+
+_exception_formatter = logging.Formatter()
+
 # set logging defaults
 _default_conf = {
     'level': 'INFO',
@@ -210,14 +222,24 @@ class _RelpathFilter(logging.Filter):
     looks for 'source_file' and 'source_lineno' on the log record, falls back to builtin
     record attributes if they aren't found.
 
+    Relative paths are cached per filename, since most records come from a handful of files.
+
     """
+    def __init__(self):
+        super(_RelpathFilter, self).__init__()
+        self._relpaths = {}
+
     def filter(self, record):
         try:
-            relpath = get_rel_path(record.source_file) or record.source_file
+            filename = record.source_file
             lineno = record.source_lineno
         except AttributeError:
-            relpath = get_rel_path(record.pathname) or record.pathname
+            filename = record.pathname
             lineno = record.lineno
+        try:
+            relpath = self._relpaths[filename]
+        except KeyError:
+            relpath = self._relpaths[filename] = get_rel_path(filename) or filename
         if lineno:
             record.source = "%s:%d" % (relpath, lineno)
         else:
@@ -226,53 +248,391 @@ class _RelpathFilter(logging.Filter):
         return True
 
 
+class QueueHandler(logging.Handler):
+    """Handler that puts records on a queue, for a :py:class:`QueueListener` to handle
+
+    A backport of the python 3 ``logging.handlers.QueueHandler``, so that the only cost of
+    logging on the calling thread is preparing the record and putting it on the queue. If the
+    listener isn't running (e.g. it was stopped at exit, or this is a forked process), records
+    are handled directly instead.
+
+    Args:
+        listener: The :py:class:`QueueListener` handling this handler's records
+
+    """
+    def __init__(self, listener):
+        super(QueueHandler, self).__init__()
+        self.listener = listener
+
+    def prepare(self, record):
+        # Merge args into the message now, they could be changed before the listener gets to
+        # them, and format exceptions now, rather than keeping their tracebacks alive
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            record = self.prepare(record)
+            if self.listener.is_alive():
+                self.listener.queue.put_nowait(record)
+            else:
+                self.listener.handle(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Handles records put on a queue by a :py:class:`QueueHandler`, in a background thread
+
+    A backport of the python 3 ``logging.handlers.QueueListener``. Handler levels are respected.
+
+    Args:
+        *handlers: Handlers for the records taken from the queue
+
+    """
+    _sentinel = None
+
+    def __init__(self, *handlers):
+        self.queue = Queue()
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        """Start the background thread handling records"""
+        self._thread = threading.Thread(target=self._monitor, name='QueueListener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def is_alive(self):
+        """Whether or not the background thread is handling records"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Handle the records already queued, then stop the background thread"""
+        if self.is_alive():
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+        self._thread = None
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                return
+            try:
+                self.handle(record)
+            except Exception:
+                # Handler errors are reported by the handlers themselves, this guards against
+                # anything else stopping the thread and leaving records piling up in the queue.
+                # Report it like logging.Handler.handleError does, logging it could fail again.
+                if logging.raiseExceptions:
+                    sys.stderr.write('Error handling log record from %s\n' % record.name)
+                    print_exc(file=sys.stderr)
+
+
+class Histogram(object):
+    """Fixed-memory histogram of event durations
+
+    Durations are counted in logarithmic buckets, each :py:attr:`BUCKET_RATIO` times wider than
+    the last, so percentiles are accurate to within that ratio no matter how many events are
+    recorded.
+
+    """
+    #: Smallest duration with its own bucket, in seconds
+    BUCKET_MIN = 0.0001
+    #: Ratio between the bounds of consecutive buckets
+    BUCKET_RATIO = 1.05
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = defaultdict(int)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[self._bucket(seconds)] += 1
+
+    def _bucket(self, seconds):
+        if seconds <= self.BUCKET_MIN:
+            return 0
+        return int(math.ceil(math.log(seconds / self.BUCKET_MIN, self.BUCKET_RATIO)))
+
+    def percentile(self, percent):
+        """Estimated duration that ``percent`` percent of events took at most"""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # The upper bound of the bucket, but never more than the slowest event
+                return min(self.BUCKET_MIN * self.BUCKET_RATIO ** bucket, self.max)
+        return self.max
+
+    def export(self):
+        """Returns the histogram's state as builtin types, for :py:meth:`merge`"""
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'buckets': sorted(self.buckets.items()),
+        }
+
+    def merge(self, exported):
+        """Add the events of an exported histogram, e.g. from another process, to this one"""
+        self.count += exported['count']
+        self.total += exported['total']
+        self.max = max(self.max, exported['max'])
+        for bucket, bucket_count in exported['buckets']:
+            self.buckets[bucket] += bucket_count
+
+    def summary(self):
+        """Returns a dict of count, total, p50, p95 and max durations"""
+        return {
+            'count': self.count,
+            'total': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+        }
+
+
+class Span(object):
+    """A timed event, created by :py:meth:`Perflog.span`
+
+    Spans started while another span is open on the same thread are its children.
+
+    Attributes:
+        name: Name of the event
+        span_id: Unique (in this process) id of the span
+        parent_id: span_id of the enclosing span, or ``None``
+        details: Extra information about the event
+        duration: Seconds the event took, ``None`` until it's stopped
+
+    """
+    def __init__(self, perflog, name, parent_id, details):
+        self.perflog = perflog
+        self.name = name
+        self.span_id = next(perflog._span_ids)
+        self.parent_id = parent_id
+        self.details = details
+        self.start_time = time()
+        self.duration = None
+
+    def stop(self, **details):
+        """Stop the span, recording it to the perflog
+
+        Args:
+            **details: Extra information about the event, added to the span's details
+
+        Returns: The span's duration in seconds
+        """
+        if self.duration is None:
+            self.duration = time() - self.start_time
+            self.details.update(details)
+            self.perflog._finish(self)
+        return self.duration
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.details['error'] = exc_type.__name__
+        self.stop()
+
+
 class Perflog(object):
     """Performance logger, useful for timing arbitrary events by name
 
     Logged events will be written to ``log/perf.log`` by default, unless
     a different log file name is passed to the Perflog initializer.
 
+    Events are tracked as spans. Spans are tracked per thread, so events with the same name in
+    different threads don't interfere with each other, and spans started inside another span
+    record it as their parent. Durations are also aggregated into a :py:class:`Histogram` per
+    event name, which is written as JSON lines to ``log/perf_summary.jsonl`` by
+    :py:meth:`write_summary` at the end of each test run, and to the log.
+
+    Recording an event only adds it to its histogram. Every event (its duration, span and
+    details) is written to the log as well only when the perf logger's level is ``DEBUG``, see
+    :py:mod:`utils.log` for its configuration. Hot paths like database queries and waits record
+    events, so writing them all has a cost.
+
     Usage:
 
         from utils.log import perflog
+
+        with perflog.span('event_name', some_detail='value'):
+            # do stuff
+            with perflog.span('nested_event_name'):
+                # do more stuff
+
+        # or
         perflog.start('event_name')
         # do stuff
         seconds_taken = perflog.stop('event_name')
-        # seconds_taken is also written to perf.log for later analysis
+        # seconds_taken is also added to the event's histogram, for later analysis
 
     """
-    tracking_events = {}
-
     def __init__(self, perflog_name='perf'):
         self.logger = create_logger(perflog_name)
+        self.summary_file = log_path.join('%s_summary.jsonl' % perflog_name)
+        self._span_ids = count(1)
+        self._local = threading.local()
+        self._histograms = defaultdict(Histogram)
+        self._histograms_lock = threading.Lock()
+
+    @property
+    def _stack(self):
+        # Open spans on this thread, innermost last
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    @property
+    def current_span(self):
+        """The innermost open :py:class:`Span` on this thread, or ``None``"""
+        stack = self._stack
+        return stack[-1] if stack else None
+
+    def span(self, event_name, **details):
+        """Start a :py:class:`Span`, the child of the current span on this thread (if any)
+
+        Use as a context manager, or call :py:meth:`Span.stop` when the event is done.
+
+        Args:
+            event_name: Name of the event
+            **details: Extra information about the event, written to the log as key=value pairs
+
+        """
+        current_span = self.current_span
+        parent_id = current_span.span_id if current_span else None
+        span = Span(self, event_name, parent_id, details)
+        self._stack.append(span)
+        return span
 
     def start(self, event_name):
         """Start tracking the named event
 
-        Will reset the start time if the event is already being tracked
+        Equivalent to :py:meth:`span`, for events that can't be wrapped in a with statement.
 
         """
-        if event_name in self.tracking_events:
-            self.logger.warning('"%s" event already started, resetting start time', event_name)
-        else:
-            self.logger.debug('"%s" event tracking started', event_name)
-        self.tracking_events[event_name] = time()
+        self.logger.debug('"%s" event tracking started', event_name)
+        self.span(event_name)
 
     def stop(self, event_name):
         """Stop tracking the named event
 
+        Stops the innermost span with this name on this thread.
+
         Returns:
             A float value of the time passed since ``start`` was last called, in seconds,
             *or* ``None`` if ``start`` was never called.
 
         """
-        if event_name in self.tracking_events:
-            seconds_taken = time() - self.tracking_events.pop(event_name)
-            self.logger.info('"%s" event took %f seconds', event_name, seconds_taken)
-            return seconds_taken
-        else:
-            self.logger.error('"%s" not being tracked, call .start first', event_name)
-            return None
+        for span in reversed(self._stack):
+            if span.name == event_name:
+                return span.stop()
+        self.logger.error('"%s" not being tracked, call .start first', event_name)
+        return None
+
+    def record(self, event_name, seconds_taken, **details):
+        """Record an event that was timed elsewhere
+
+        The event is recorded as a child of the current span on this thread (if any).
+
+        Args:
+            event_name: Name of the event
+            seconds_taken: How long the event took
+            **details: Extra information about the event, written to the log as key=value pairs
+
+        """
+        current_span = self.current_span
+        parent_id = current_span.span_id if current_span else None
+        span = Span(self, event_name, parent_id, details)
+        span.duration = seconds_taken
+        self._finish(span)
+
+    def _finish(self, span):
+        stack = self._stack
+        if span in stack:
+            # Children still open are taken off the stack along with their parent
+            del stack[stack.index(span):]
+        with self._histograms_lock:
+            self._histograms[span.name].add(span.duration)
+        # Don't even format the details unless they're going to be written
+        if self.logger.isEnabledFor(logging.DEBUG):
+            details = ' '.join('%s=%r' % item for item in sorted(span.details.items()))
+            self.logger.debug('"%s" event took %f seconds [span %d%s] %s', span.name,
+                span.duration, span.span_id, ' < %d' % span.parent_id if span.parent_id else '',
+                details)
+
+    def histograms(self):
+        """Returns a dict of event name to :py:meth:`Histogram.summary` for all recorded events"""
+        with self._histograms_lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def export(self):
+        """Returns a dict of event name to :py:meth:`Histogram.export` for all recorded events
+
+        Histograms are exported as builtin types, so they can be sent to other processes (like
+        the xdist master) and merged there with :py:meth:`merge`.
+        """
+        with self._histograms_lock:
+            return {name: histogram.export() for name, histogram in self._histograms.items()}
+
+    def merge(self, exported):
+        """Merge histograms exported by :py:meth:`export` into this perflog's histograms"""
+        with self._histograms_lock:
+            for name, histogram in exported.items():
+                self._histograms[name].merge(histogram)
+
+    def write_summary(self, **run_details):
+        """Append the event histograms to the summary file as JSON lines, and log them
+
+        Each line is the summary of one event name for this run. Lines are appended, so the
+        summary file collects the histograms of every run, for comparison across runs.
+
+        Args:
+            **run_details: Extra information about the run, added to every line
+
+        """
+        histograms = self.histograms()
+        if not histograms:
+            return
+        run = dt.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self.summary_file.open('a') as summary_file:
+            for name in sorted(histograms):
+                line = dict(run_details, run=run, name=name, **histograms[name])
+                summary_file.write(json.dumps(line, sort_keys=True) + '\n')
+
+        slowest = sorted(histograms.items(), key=lambda item: item[1]['total'], reverse=True)
+        self.logger.info(format_marker('Event summary, by total time', mark='='))
+        for name, histogram in slowest:
+            self.logger.info('"%s": count=%d total=%.3f p50=%.3f p95=%.3f max=%.3f', name,
+                histogram['count'], histogram['total'], histogram['p50'], histogram['p95'],
+                histogram['max'])
+
+    def reset(self):
+        """Forget all recorded histograms"""
+        with self._histograms_lock:
+            self._histograms.clear()
 
 
 def create_logger(logger_name):
@@ -281,10 +641,16 @@ def create_logger(logger_name):
     If the logger already exists, it will be destroyed and recreated
     with the current config in env.yaml
 
+    The logger's only handler is a :py:class:`QueueHandler`. Records are written to the log file
+    (and syslog, and the console) by a :py:class:`QueueListener` in a background thread, so
+    logging doesn't wait on I/O.
+
     """
     # If the logger already exists, destroy it
     if logger_name in logging.root.manager.loggerDict:
         del(logging.root.manager.loggerDict[logger_name])
+    if logger_name in _listeners:
+        _listeners.pop(logger_name).stop()
 
     # Grab the logging conf
     conf = _load_conf(logger_name)
@@ -302,9 +668,7 @@ def create_logger(logger_name):
     file_handler = RotatingFileHandler(log_file, maxBytes=conf['max_file_size'],
         backupCount=conf['max_file_backups'], encoding='utf8')
     file_handler.setFormatter(file_formatter)
-
-    logger = logging.getLogger(logger_name)
-    logger.addHandler(file_handler)
+    handlers = [file_handler]
 
     syslog_settings = _get_syslog_settings()
     if syslog_settings:
@@ -313,20 +677,33 @@ def create_logger(logger_name):
         syslog_formatter = SyslogMsecFormatter(fmt=fmt)
         syslog_handler = SysLogHandler(address=syslog_settings)
         syslog_handler.setFormatter(syslog_formatter)
-        logger.addHandler(syslog_handler)
-    logger.setLevel(conf['level'])
+        handlers.append(syslog_handler)
     if conf['errors_to_console']:
         stream_formatter = logging.Formatter(conf['stream_format'])
         stream_handler = logging.StreamHandler()
         stream_handler.setLevel(logging.ERROR)
         stream_handler.setFormatter(stream_formatter)
+        handlers.append(stream_handler)
+
+    # The source attr is added by the listener thread, rather than the logging thread
+    for handler in handlers:
+        handler.addFilter(relpath_filter)
 
-        logger.addHandler(stream_handler)
+    listener = _listeners[logger_name] = QueueListener(*handlers)
+    listener.start()
 
-    logger.addFilter(relpath_filter)
+    logger = logging.getLogger(logger_name)
+    logger.addHandler(QueueHandler(listener))
+    logger.setLevel(conf['level'])
     return logger
 
 
+def _stop_listeners():
+    # Write out everything still queued before exiting
+    for listener in _listeners.values():
+        listener.stop()
+
+
 def _showwarning(message, category, filename, lineno, file=None, line=None):
     relpath = get_rel_path(filename)
     if relpath:
@@ -372,6 +749,7 @@ if '_original_excepthook' not in globals():
 
 logger = create_logger('cfme')
 perflog = Perflog()
+atexit.register(_stop_listeners)
 
 # Capture warnings to the cfme logger using the warnings.showwarning hook
 warnings.showwarning = _showwarning
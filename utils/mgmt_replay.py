@@ -0,0 +1,310 @@
+"""Record and replay management system calls
+
+Every class in :py:mod:`utils.mgmt_system` talks to a live provider, which makes the code
+built on top of them impossible to benchmark or regression-test offline. This module provides
+a recording proxy that captures calls to a live management system, and a fake management system
+that replays those recordings deterministically.
+
+Recording a session against a live provider:
+
+.. code-block:: python
+
+    from utils.mgmt_replay import RecordingSystem
+    from utils.providers import provider_factory
+
+    mgmt = RecordingSystem(provider_factory('vsphere5'))
+    mgmt.list_vm()
+    mgmt.stats('num_vm', 'num_template')
+    mgmt.save('data/recordings/vsphere5.yaml')
+
+Replaying it, by adding a ``replay`` provider to ``cfme_data``:
+
+.. code-block:: yaml
+
+    management_systems:
+        vsphere5-replay:
+            name: vsphere5 replay
+            type: replay
+            # relative to the project root
+            recording: data/recordings/vsphere5.yaml
+            # optional, multiplies recorded latencies (0 disables sleeping entirely)
+            latency_scale: 1.0
+            # optional, multiplies the size of inventory lists (list_vm, list_template, ...)
+            inventory_scale: 1.0
+
+``provider_factory('vsphere5-replay')`` will then return a :py:class:`ReplaySystem`.
+
+Replay rules:
+
+* Calls are matched on method name and arguments. Repeated calls with the same arguments are
+  replayed in recorded order, and the last recorded result is repeated once they run out.
+* Recorded exceptions are re-raised. Exceptions defined in :py:mod:`utils.mgmt_system` are
+  reconstructed as their original type; anything else is raised as :py:class:`ReplayedError`.
+* Calling a method with arguments that were never recorded raises :py:class:`ReplayMiss`.
+
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+import yaml
+from py.path import local
+
+from utils import mgmt_system
+from utils.log import logger
+from utils.path import project_path
+
+
+def _sanitize(value):
+    """Reduce a value to types that can be safely dumped to (and loaded from) yaml"""
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return value
+    elif isinstance(value, basestring):
+        return unicode(value) if isinstance(value, unicode) else str(value)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return [_sanitize(item) for item in value]
+    elif isinstance(value, dict):
+        return {str(key): _sanitize(item) for key, item in value.iteritems()}
+    else:
+        # Provider SDK objects (boto images, ovirtsdk brokers, etc) are recorded as strings
+        return str(value)
+
+
+def _call_key(method, args, kwargs):
+    # yaml round-trips lists, not tuples, so keys are built from sanitized args
+    return repr((method, _sanitize(args), sorted(_sanitize(kwargs).items())))
+
+
+class RecordingSystem(object):
+    """Proxy around a management system that records every public method call
+
+    Records the method name, arguments, result (or raised exception) and latency of each call.
+    Non-callable attributes and private methods are passed through without recording.
+
+    Args:
+        system: A :py:class:`utils.mgmt_system.MgmtSystemAPIBase` instance to record
+        filename: Optional default filename for :py:meth:`save`
+
+    """
+    def __init__(self, system, filename=None):
+        self._system = system
+        self._filename = filename
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._system, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def recorded_call(*args, **kwargs):
+            call = {
+                'method': name,
+                'args': _sanitize(args),
+                'kwargs': _sanitize(kwargs),
+            }
+            start = time.time()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as ex:
+                call['error'] = {
+                    'type': type(ex).__name__,
+                    'args': _sanitize(ex.args),
+                    # Some exceptions keep their state in attributes instead of args
+                    'attributes': _sanitize(vars(ex)),
+                }
+                raise
+            else:
+                call['result'] = _sanitize(result)
+                return result
+            finally:
+                call['latency'] = time.time() - start
+                with self._lock:
+                    self.calls.append(call)
+        return recorded_call
+
+    def save(self, filename=None):
+        """Write the recorded calls to a yaml file
+
+        Args:
+            filename: Destination file, defaults to the filename passed to the initializer
+
+        """
+        filename = filename or self._filename
+        assert filename, 'No filename given to save the recording to'
+        recording = {
+            'system': type(self._system).__name__,
+            'recorded': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'calls': self.calls,
+        }
+        with open(str(filename), 'w') as recording_file:
+            yaml.safe_dump(recording, recording_file, default_flow_style=False)
+        logger.info('Recorded %d %s calls to %s' %
+            (len(self.calls), recording['system'], filename))
+
+
+def _replayed(method, scaled=False):
+    """Creates a :py:class:`ReplaySystem` method that replays the named method"""
+    def replay_method(self, *args, **kwargs):
+        result = self._replay(method, args, kwargs)
+        if scaled:
+            result = self._scale_inventory(result)
+        return result
+    replay_method.__name__ = method
+    replay_method.__doc__ = 'Replays recorded ``%s`` calls' % method
+    return replay_method
+
+
+class ReplaySystem(mgmt_system.MgmtSystemAPIBase):
+    """Fake management system, replaying calls recorded by :py:class:`RecordingSystem`
+
+    Args:
+        recording: Path to a recording yaml file, absolute or relative to the project root
+        latency_scale: Multiplier for recorded call latencies, ``0`` disables sleeping
+        inventory_scale: Multiplier for the length of inventory lists
+
+    Returns: A :py:class:`ReplaySystem` object.
+    """
+    _stats_available = {
+        'num_vm': lambda self: len(self.list_vm()),
+        'num_host': lambda self: len(self.list_host()),
+        'num_cluster': lambda self: len(self.list_cluster()),
+        'num_template': lambda self: len(self.list_template()),
+        'num_datastore': lambda self: len(self.list_datastore()),
+    }
+
+    def __init__(self, recording, latency_scale=1.0, inventory_scale=1.0, **kwargs):
+        if os.path.isabs(recording):
+            self.recording = local(recording)
+        else:
+            self.recording = project_path.join(recording)
+        self.latency_scale = float(latency_scale)
+        self.inventory_scale = float(inventory_scale)
+        self._lock = threading.Lock()
+
+        with self.recording.open() as recording_file:
+            recording_data = yaml.safe_load(recording_file)
+        self.recorded_system = recording_data.get('system')
+
+        # Queues of calls matched on method and args, plus the last seen call for each key
+        self._calls = defaultdict(deque)
+        self._last_call = {}
+        for call in recording_data.get('calls', []):
+            key = _call_key(call['method'], call.get('args', []), call.get('kwargs', {}))
+            self._calls[key].append(call)
+
+    def _replay(self, method, args, kwargs):
+        key = _call_key(method, args, kwargs)
+        with self._lock:
+            if self._calls[key]:
+                call = self._calls[key].popleft()
+                self._last_call[key] = call
+            elif key in self._last_call:
+                call = self._last_call[key]
+            else:
+                raise ReplayMiss(method, args, kwargs)
+
+        if self.latency_scale:
+            time.sleep(call.get('latency', 0) * self.latency_scale)
+
+        if 'error' in call:
+            raise _rebuild_error(call['error'])
+        return call.get('result')
+
+    def _scale_inventory(self, inventory):
+        """Grow or shrink an inventory list according to ``inventory_scale``
+
+        Synthetic entries are named after the recorded ones, with a numeric suffix.
+        """
+        if self.inventory_scale == 1 or not isinstance(inventory, list) or not inventory:
+            return inventory
+        size = int(round(len(inventory) * self.inventory_scale))
+        scaled = inventory[:size]
+        copy_num = 1
+        while len(scaled) < size:
+            for item in inventory[:size - len(scaled)]:
+                scaled.append('%s-%d' % (item, copy_num))
+            copy_num += 1
+        return scaled
+
+    def stats(self, *requested_stats):
+        """Replays a recorded ``stats`` call, or calculates stats from replayed inventory lists
+
+        Recorded stats are multiplied by ``inventory_scale``.
+        """
+        try:
+            recorded_stats = self._replay('stats', requested_stats, {})
+        except ReplayMiss:
+            return super(ReplaySystem, self).stats(*requested_stats)
+
+        host_stats = {stat: int(round(value * self.inventory_scale))
+            for stat, value in recorded_stats.iteritems()
+            if not requested_stats or stat in requested_stats}
+        # Fill in anything the recorded call didn't ask for from the inventory lists
+        missing_stats = [stat for stat in requested_stats if stat not in host_stats]
+        if missing_stats:
+            host_stats.update(super(ReplaySystem, self).stats(*missing_stats))
+        return host_stats
+
+    def disconnect(self):
+        """Nothing to disconnect from"""
+        pass
+
+    start_vm = _replayed('start_vm')
+    stop_vm = _replayed('stop_vm')
+    create_vm = _replayed('create_vm')
+    delete_vm = _replayed('delete_vm')
+    restart_vm = _replayed('restart_vm')
+    suspend_vm = _replayed('suspend_vm')
+    clone_vm = _replayed('clone_vm')
+    deploy_template = _replayed('deploy_template')
+    info = _replayed('info')
+    vm_status = _replayed('vm_status')
+    is_vm_running = _replayed('is_vm_running')
+    is_vm_stopped = _replayed('is_vm_stopped')
+    is_vm_suspended = _replayed('is_vm_suspended')
+    does_vm_exist = _replayed('does_vm_exist')
+    get_ip_address = _replayed('get_ip_address')
+    remove_host_from_cluster = _replayed('remove_host_from_cluster')
+    list_vm = _replayed('list_vm', scaled=True)
+    list_template = _replayed('list_template', scaled=True)
+    list_host = _replayed('list_host', scaled=True)
+    list_datastore = _replayed('list_datastore', scaled=True)
+    list_cluster = _replayed('list_cluster', scaled=True)
+    list_flavor = _replayed('list_flavor', scaled=True)
+    list_network = _replayed('list_network', scaled=True)
+
+
+def _rebuild_error(error):
+    exc_class = getattr(mgmt_system, error['type'], None)
+    error_args = error.get('args', [])
+    if isinstance(exc_class, type) and issubclass(exc_class, Exception):
+        # Bypass __init__, since the mgmt_system exceptions don't agree on a signature
+        exc = exc_class.__new__(exc_class)
+        exc.args = tuple(error_args)
+        exc.__dict__.update(error.get('attributes', {}))
+        return exc
+    return ReplayedError(error['type'], error_args)
+
+
+class ReplayMiss(Exception):
+    """Raised when replaying a method that was never recorded with the given arguments"""
+    def __init__(self, method, args, kwargs):
+        super(ReplayMiss, self).__init__(method, args, kwargs)
+        self.method = method
+
+    def __str__(self):
+        return 'No recorded calls to "%s" with args %r, kwargs %r' % self.args
+
+
+class ReplayedError(Exception):
+    """Stand-in for recorded exceptions that can't be reconstructed as their original type"""
+    def __init__(self, error_type, error_args):
+        super(ReplayedError, self).__init__(error_type, error_args)
+        self.error_type = error_type
+        self.error_args = error_args
+
+    def __str__(self):
+        return '%s%r' % (self.error_type, tuple(self.error_args))
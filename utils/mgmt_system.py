@@ -2,19 +2,14 @@
 """Backend management system classes
 
 Used to communicate with providers without using CFME facilities
+
+Provider SDKs are slow to import, so each class imports its SDK when it's used, rather than
+this module importing all of them up front.
 """
 import re
 import time
-import boto
 from abc import ABCMeta, abstractmethod
-from boto.ec2 import EC2Connection, get_region
 from functools import partial
-from ovirtsdk.api import API
-from ovirtsdk.xml import params
-from pysphere import VIServer, MORTypes, VITask, VIMor
-from pysphere.resources import VimService_services as VI
-from pysphere.resources.vi_exception import VIException
-from novaclient.v1_1 import client as osclient
 from utils.log import logger
 from utils.wait import wait_for, TimedOutError
 
@@ -225,6 +220,24 @@ class MgmtSystemAPIBase(object):
         """
         raise NotImplementedError('get_ip_address not implemented.')
 
+    def get_ip_addresses(self, vm_names):
+        """get ip addresses of many VMs at once, without waiting for them
+
+        Subclasses should override this to use as few API calls as possible; this default
+        asks for each VM in turn.
+
+        Args:
+            vm_names: A list of VM names
+        Returns: A dict of vm name to ip address, ``None`` for VMs with no address (yet)
+        """
+        ip_addresses = {}
+        for vm_name in vm_names:
+            try:
+                ip_addresses[vm_name] = self.get_ip_address(vm_name)
+            except VMInstanceNotFound:
+                ip_addresses[vm_name] = None
+        return ip_addresses
+
     @abstractmethod
     def remove_host_from_cluster(self, hostname):
         """remove a host from it's cluster
@@ -276,6 +289,7 @@ class VMWareSystem(MgmtSystemAPIBase):
     }
 
     def __init__(self, hostname, username, password, **kwargs):
+        from pysphere import VIServer
         self.hostname = hostname
         self.username = username
         self.password = password
@@ -283,6 +297,7 @@ class VMWareSystem(MgmtSystemAPIBase):
 
     @property
     def api(self):
+        from pysphere.resources.vi_exception import VIException
         # wrap calls to the API with a keepalive check, reconnect if needed
         try:
             keepalive = self._api.keep_session_alive()
@@ -367,12 +382,38 @@ class VMWareSystem(MgmtSystemAPIBase):
             net_info = None
 
         if net_info:
-            ipv4_re = r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}'
-            for ip in net_info[0]['ip_addresses']:
-                if re.match(ipv4_re, ip) and ip != '127.0.0.1':
-                    return ip
+            return _first_ipv4(net_info[0]['ip_addresses'])
         return None
 
+    def get_ip_addresses(self, vm_names):
+        """ Returns the first IP address of many VMs, in one property collector call
+
+        Args:
+            vm_names: A list of vm names
+        Returns: A dict of vm name to the first IP that isn't the loopback device, or ``None``
+        """
+        from pysphere import MORTypes
+        ip_addresses = dict.fromkeys(vm_names)
+        props = self.api._retrieve_properties_traversal(property_names=['name', 'guest.net'],
+                                                        from_node=None,
+                                                        obj_type=MORTypes.VirtualMachine)
+        for prop in props:
+            vm = None
+            nics = []
+            for elem in prop.PropSet:
+                if elem.Name == "name":
+                    vm = elem.Val
+                elif elem.Name == "guest.net":
+                    nics = getattr(elem.Val, 'GuestNicInfo', [])
+            if vm not in ip_addresses:
+                continue
+            for nic in nics:
+                ip = _first_ipv4(getattr(nic, 'IpAddress', []))
+                if ip is not None:
+                    ip_addresses[vm] = ip
+                    break
+        return ip_addresses
+
     def _get_list_vms(self, get_template=False):
         """ Obtains a list of all VMs on the system.
 
@@ -382,6 +423,7 @@ class VMWareSystem(MgmtSystemAPIBase):
             get_template: A boolean describing if it should return template names also.
         Returns: A list of VMs.
         """
+        from pysphere import MORTypes
         template_or_vm_list = []
 
         props = self.api._retrieve_properties_traversal(property_names=['name', 'config.template'],
@@ -425,6 +467,8 @@ class VMWareSystem(MgmtSystemAPIBase):
         return False
 
     def delete_vm(self, vm_name):
+        from pysphere import VITask
+        from pysphere.resources import VimService_services as VI
         vm = self._get_vm(vm_name)
 
         if vm.is_powered_on():
@@ -518,6 +562,8 @@ class VMWareSystem(MgmtSystemAPIBase):
             raise VMInstanceNotCloned(template)
 
     def remove_host_from_cluster(self, hostname):
+        from pysphere import VIMor, VITask
+        from pysphere.resources import VimService_services as VI
         req = VI.DisconnectHost_TaskRequestMsg()
         mor = (key for key, value in self.api.get_hosts().items() if value == hostname).next()
         sys = VIMor(mor, 'HostSystem')
@@ -530,6 +576,8 @@ class VMWareSystem(MgmtSystemAPIBase):
         self._destroy_host(hostname)
 
     def _destroy_host(self, hostname):
+        from pysphere import VIMor, VITask
+        from pysphere.resources import VimService_services as VI
         req = VI.Destroy_TaskRequestMsg()
         mor = (key for key, value in self.api.get_hosts().items() if value == hostname).next()
         sys = VIMor(mor, 'HostSystem')
@@ -632,6 +680,7 @@ class RHEVMSystem(MgmtSystemAPIBase):
     @property
     def api(self):
         if self._api is None:
+            from ovirtsdk.api import API
             self._api = API(**self._api_kwargs)
         return self._api
 
@@ -655,6 +704,25 @@ class RHEVMSystem(MgmtSystemAPIBase):
         vm = self._get_vm(vm_name)
         return vm.get_guest_info().get_ips().get_ip()[0].get_address()
 
+    def get_ip_addresses(self, vm_names):
+        """ Returns the first guest IP address of many VMs, from one list of all VMs
+
+        Args:
+            vm_names: A list of vm names
+        Returns: A dict of vm name to ip address, or ``None`` if the guest agent hasn't
+            reported one
+        """
+        ip_addresses = dict.fromkeys(vm_names)
+        for vm in self.api.vms.list():
+            if vm.name not in ip_addresses:
+                continue
+            try:
+                ip_addresses[vm.name] = vm.get_guest_info().get_ips().get_ip()[0].get_address()
+            except (AttributeError, IndexError):
+                # No guest info yet
+                pass
+        return ip_addresses
+
     def does_vm_exist(self, name):
         try:
             self._get_vm(name)
@@ -795,6 +863,7 @@ class RHEVMSystem(MgmtSystemAPIBase):
         raise NotImplementedError('This function has not yet been implemented.')
 
     def deploy_template(self, template, *args, **kwargs):
+        from ovirtsdk.xml import params
         self.api.vms.add(params.VM(
             name=kwargs['vm_name'],
             cluster=self.api.clusters.get(kwargs['cluster_name']),
@@ -845,6 +914,7 @@ class EC2System(MgmtSystemAPIBase):
     can_suspend = False
 
     def __init__(self, **kwargs):
+        from boto.ec2 import EC2Connection, get_region
         username = kwargs.get('username')
         password = kwargs.get('password')
 
@@ -860,6 +930,7 @@ class EC2System(MgmtSystemAPIBase):
 
     def info(self):
         """Returns the current versions of boto and the EC2 API being used"""
+        import boto
         return '%s %s' % (boto.UserAgent, self.api.APIVersion)
 
     def list_vm(self):
@@ -1035,6 +1106,22 @@ class EC2System(MgmtSystemAPIBase):
     def get_ip_address(self, id):
         return str(self._get_instance_by_id(id).ip_address)
 
+    def get_ip_addresses(self, vm_names):
+        """Returns the public ip addresses of many instances, in one filtered describe call
+
+        Args:
+            vm_names: A list of instance IDs
+        Returns: A dict of instance ID to ip address, or ``None`` if not assigned yet
+        """
+        ip_addresses = dict.fromkeys(vm_names)
+        if not vm_names:
+            return ip_addresses
+        reservations = self.api.get_all_instances(filters={'instance-id': list(vm_names)})
+        for instance in self._get_instances_from_reservations(reservations):
+            if instance.id in ip_addresses:
+                ip_addresses[instance.id] = instance.ip_address and str(instance.ip_address)
+        return ip_addresses
+
     def _get_instance_id_by_name(self, instance_name):
         # Quick validation that the instance name isn't actually an ID
         # If people start naming their instances in such a way to break this,
@@ -1124,6 +1211,7 @@ class OpenstackSystem(MgmtSystemAPIBase):
     can_suspend = True
 
     def __init__(self, **kwargs):
+        from novaclient.v1_1 import client as osclient
         tenant = kwargs['tenant']
         username = kwargs['username']
         password = kwargs['password']
@@ -1274,6 +1362,23 @@ class OpenstackSystem(MgmtSystemAPIBase):
                 if nic['OS-EXT-IPS:type'] == 'floating':
                     return str(nic['addr'])
 
+    def get_ip_addresses(self, vm_names):
+        """Returns the floating ip addresses of many instances, from one list of all instances
+
+        Args:
+            vm_names: A list of instance names
+        Returns: A dict of instance name to ip address, or ``None`` if not assigned yet
+        """
+        ip_addresses = dict.fromkeys(vm_names)
+        for instance in self._get_all_instances():
+            if instance.name not in ip_addresses:
+                continue
+            for nics in instance._info['addresses'].values():
+                for nic in nics:
+                    if nic['OS-EXT-IPS:type'] == 'floating':
+                        ip_addresses[instance.name] = str(nic['addr'])
+        return ip_addresses
+
     def _get_all_instances(self):
         instances = self.api.servers.list(True, {'all_tenants': True})
         return instances
@@ -1302,6 +1407,15 @@ class OpenstackSystem(MgmtSystemAPIBase):
         raise NotImplementedError('remove_host_from_cluster not implemented')
 
 
+def _first_ipv4(ip_addresses):
+    """Returns the first ipv4 address that isn't the loopback device, or ``None``"""
+    ipv4_re = r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}'
+    for ip in ip_addresses:
+        if re.match(ipv4_re, ip) and ip != '127.0.0.1':
+            return ip
+    return None
+
+
 class ActionNotSupported(Exception):
     """
     Raised when an action is not supported.
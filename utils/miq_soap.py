@@ -3,19 +3,109 @@
 """SOAP wrapper for CFME.
 
 Enables to operate Infrastructure objects. It has better VM provisioning code. OOP encapsulated.
+
+Objects keep a snapshot of what they fetched over SOAP (the object itself, its tags, ...), so
+reading several attributes doesn't cost a SOAP call each. Snapshots expire after
+:py:attr:`MiqInfraObject.CACHE_TTL` seconds, or can be dropped explicitly with
+:py:meth:`MiqInfraObject.invalidate` and :py:meth:`MiqInfraObject.refresh`. Actions done through
+these objects (power operations, tagging) invalidate what they change. To wait for a change made
+by the appliance, poll with :py:meth:`MiqInfraObject.wait_for`, which fetches the snapshots it
+polls again before every check.
+
+Related objects (``hosts``, ``datastores``, ...) are only fetched when they're first read. Code
+that reads many of them can fetch them together, concurrently, with :py:func:`prefetch`.
 """
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
 from suds import WebFault
 
 from utils import lazycache
 from utils.conf import cfme_data
 from utils.db import cfmedb
 from utils.log import logger
-from utils.soap import soap_client
-from utils.wait import wait_for
+from utils.soap import MiqClient, SoapClientPool
+from utils.wait import TimedOutError, wait_for
+
+
+#: Shared by all objects in this module, each thread gets its own client on first use
+client = SoapClientPool()
+
+#: Maximum number of concurrent SOAP calls made by :py:func:`prefetch` and
+#: :py:func:`prepare_provider_for_provisioning`
+PREFETCH_THREADS = 8
+
+
+def prefetch(objects, *fields):
+    """Fill the snapshots of many objects concurrently
+
+    Args:
+        objects: An iterable of :py:class:`MiqInfraObject`
+        *fields: Snapshot fields to fetch, ``object`` by default. See
+            :py:meth:`MiqInfraObject.refresh`
+    Returns: The objects, as a list
+    """
+    objects = list(objects)
+    if objects:
+        pool = ThreadPool(min(len(objects), PREFETCH_THREADS))
+        try:
+            pool.map(lambda obj: obj.refresh(*fields), objects)
+        finally:
+            pool.close()
+            pool.join()
+    return objects
+
+
+def prepare_provider_for_provisioning(provider, tag=("prov_scope", "all")):
+    """Tag a provider, its hosts and its datastores so they can be used for provisioning
 
+    Tag state of all the objects is read from the VMDB in one query, and the missing tags are
+    then added concurrently. Banned datastores (see :py:func:`is_datastore_banned`) are skipped.
 
-if "client" not in globals():
-    client = soap_client()  # Ugly, but easiest to use :/
+    Args:
+        provider: :py:class:`MiqEms` to prepare
+        tag: Tuple of (category, tag name) to tag the objects with
+    """
+    ems_table = cfmedb['ext_management_systems']
+    hosts_table = cfmedb['hosts']
+    storages_table = cfmedb['storages']
+    tags_table = cfmedb['tags']
+    taggings_table = cfmedb['taggings']
+
+    ems_id = cfmedb.session.query(ems_table.id)\
+        .filter(ems_table.guid == provider.id).one().id
+    hosts = cfmedb.session.query(hosts_table.id, hosts_table.guid, hosts_table.name)\
+        .filter(hosts_table.ems_id == ems_id).all()
+    # The provider's own datastores, including those no host is attached to
+    storage_ids = [int(store.id) for store in provider.object.datastores]
+    storages = cfmedb.session.query(storages_table.id, storages_table.name)\
+        .filter(storages_table.id.in_(storage_ids or [None])).all()
+    tagged = set(cfmedb.session.query(taggings_table.taggable_type, taggings_table.taggable_id)
+        .join(tags_table, taggings_table.tag_id == tags_table.id)
+        .filter(tags_table.name == "/managed/%s/%s" % tag)
+        .filter(taggings_table.taggable_type.in_(["ExtManagementSystem", "Host", "Storage"])))
+
+    to_tag = []
+    if ("ExtManagementSystem", ems_id) not in tagged:
+        to_tag.append(provider)
+    for host in hosts:
+        if ("Host", host.id) not in tagged:
+            to_tag.append(MiqHost(host.guid))
+    for storage in storages:
+        if is_datastore_banned(storage.name):
+            logger.info("Skipping datastore %s" % storage.name)
+        elif ("Storage", storage.id) not in tagged:
+            to_tag.append(MiqDatastore(storage.id))
+
+    if to_tag:
+        logger.info("Tagging %s with %s/%s" % (", ".join(map(repr, to_tag)), tag[0], tag[1]))
+        pool = ThreadPool(min(len(to_tag), PREFETCH_THREADS))
+        try:
+            pool.map(lambda obj: obj.add_tag(tag), to_tag)
+        finally:
+            pool.close()
+            pool.join()
 
 
 def is_datastore_banned(datastore_name):
@@ -41,9 +131,12 @@ class MiqInfraObject(object):
     """
     GETTER_FUNC = None
     TAG_PREFIX = None
+    #: Seconds before a snapshot is considered stale and fetched again
+    CACHE_TTL = 30
 
     def __init__(self, id):
         self._id = str(id)
+        self._snapshots = {}
         assert self.GETTER_FUNC is not None, "You must specify GETTER_FUNC in the class!"
         assert self.TAG_PREFIX is not None, "You must specify TAG_PREFIX in the class!"
 
@@ -51,16 +144,70 @@ class MiqInfraObject(object):
     def id(self):
         return self._id
 
+    def _snapshot(self, field, fetch):
+        """Returns the snapshot of field, calling fetch to (re)create it if missing or stale"""
+        try:
+            fetched_at, value = self._snapshots[field]
+            if time.time() - fetched_at < self.CACHE_TTL:
+                return value
+        except KeyError:
+            pass
+        value = fetch()
+        self._snapshots[field] = (time.time(), value)
+        return value
+
+    def _fetch_object(self):
+        obj = getattr(client.service, self.GETTER_FUNC)(self.id)
+        self._snapshots['object'] = (time.time(), obj)
+        return obj
+
+    def invalidate(self, *fields):
+        """Drop snapshots, so they're fetched again on next access
+
+        Args:
+            *fields: Names of the snapshots to drop (``object``, ``tags``, ...); all of them
+                if none are given
+        """
+        if fields:
+            for field in fields:
+                self._snapshots.pop(field, None)
+        else:
+            self._snapshots.clear()
+
+    def refresh(self, *fields):
+        """Fetch snapshots again right away
+
+        Args:
+            *fields: Names of the attributes backed by the snapshots to fetch, ``object`` if
+                none are given
+        """
+        fields = fields or ('object',)
+        self.invalidate(*fields)
+        for field in fields:
+            getattr(self, field)
+
+    def wait_for(self, func, *fields, **kwargs):
+        """Waits for a condition on this object, fetching the snapshots it reads on every check
+
+        Args:
+            func: A function to check, taking no arguments
+            *fields: Names of the snapshots ``func`` reads (``object``, ``tags``, ...); all of
+                them if none are given
+            **kwargs: Any :py:func:`utils.wait.wait_for` keyword arguments
+        Returns: Same as :py:func:`utils.wait.wait_for`
+        """
+        def check():
+            self.invalidate(*fields)
+            return func()
+        return wait_for(check, **kwargs)
+
     @property
     def object(self):
         """Accesses SOAP object
 
-        Accesses network.
-
-        Todo:
-            * cache?
+        Accesses network if there is no fresh snapshot of the object.
         """
-        return getattr(client.service, self.GETTER_FUNC)(self.id)
+        return self._snapshot('object', self._fetch_object)
 
     @lazycache
     def name(self):
@@ -69,7 +216,7 @@ class MiqInfraObject(object):
     @property
     def exists(self):
         try:
-            self.object
+            self._fetch_object()
             return True
         except WebFault:
             return False
@@ -94,6 +241,9 @@ class MiqInfraObject(object):
     @property
     def tags(self):
         """Return tags as an array of :py:class:`MiqTag` objects."""
+        return self._snapshot('tags', self._fetch_tags)
+
+    def _fetch_tags(self):
         fname = "%sGetTags" % self.TAG_PREFIX
         return [
             MiqTag(tag.category, tag.category_display_name, tag.tag_name, tag.tag_display_name,
@@ -109,6 +259,7 @@ class MiqInfraObject(object):
             tag: Tuple with tag specification.
         """
         fname = "%sSetTag" % self.TAG_PREFIX
+        self.invalidate('tags')
         if (isinstance(tag, tuple) or isinstance(tag, list)) and len(tag) == 2:
             return getattr(client.service, fname)(self.id, tag[0], tag[1])
         elif isinstance(tag, MiqTag):
@@ -254,41 +405,46 @@ class MiqVM(HasManyDatastores, BelongsToCluster):
     def host(self):
         return MiqHost(self.object.host.guid)
 
+    @property
+    def power_state(self):
+        return self._snapshot(
+            'power_state', lambda: self._fetch_object().power_state.strip().lower())
+
     @property
     def is_powered_on(self):
-        return self.object.power_state.strip().lower() == "on"
+        return self.power_state == "on"
 
     @property
     def is_powered_off(self):
-        return self.object.power_state.strip().lower() == "off"
+        return self.power_state == "off"
 
     @property
     def is_suspended(self):
-        return self.object.power_state.strip().lower() == "suspended"
+        return self.power_state == "suspended"
 
     def power_on(self):
+        self.invalidate('power_state')
         return client.service.EVMSmartStart(self.id).result == "true"
 
     def wait_powered_on(self, wait_time=120):
-        return wait_for(
-            lambda: self.is_powered_on, num_sec=wait_time, message="wait for power on", delay=5
-        )
+        return self.wait_for(lambda: self.is_powered_on, 'power_state', num_sec=wait_time,
+            message="wait for power on", delay=5)
 
     def power_off(self):
+        self.invalidate('power_state')
         return client.service.EVMSmartStop(self.id).result == "true"
 
     def wait_powered_off(self, wait_time=120):
-        return wait_for(
-            lambda: self.is_powered_off, num_sec=wait_time, message="wait for power off", delay=5
-        )
+        return self.wait_for(lambda: self.is_powered_off, 'power_state', num_sec=wait_time,
+            message="wait for power off", delay=5)
 
     def suspend(self):
+        self.invalidate('power_state')
         return client.service.EVMSmartSuspend(self.id).result == "true"
 
     def wait_suspended(self, wait_time=160):
-        return wait_for(
-            lambda: self.is_suspended, num_sec=wait_time, message="wait for suspend", delay=5
-        )
+        return self.wait_for(lambda: self.is_suspended, 'power_state', num_sec=wait_time,
+            message="wait for suspend", delay=5)
 
     def delete(self):
         """Delete the VM from VMDB. To completely delete, use direct_connection."""
@@ -301,6 +457,28 @@ class MiqVM(HasManyDatastores, BelongsToCluster):
             raise Exception("Could not delete vm %s" % name)
         wait_for(lambda: not self.exists, num_sec=60, delay=4, message="wait for VM removed")
 
+    @classmethod
+    def find_template_guid(cls, template_name):
+        """Look up a template's GUID by name in the VMDB
+
+        Args:
+            template_name: Name of the template
+        Returns: GUID of the template
+        """
+        from sqlalchemy import func
+        vm_table = cfmedb['vms']
+        template_name = template_name.strip()
+        templates = cfmedb.session.query(vm_table.guid)\
+            .filter(vm_table.template == True)  # NOQA
+        # Previous line is ok, if you change it to `is`, it won't work!
+        template = templates.filter(vm_table.name == template_name).first()
+        if template is None:
+            # Names in the VMDB may have stray whitespace, fall back to the slower comparison
+            template = templates.filter(func.trim(vm_table.name) == template_name).first()
+        if template is None:
+            raise Exception("Template %s not found!" % template_name)
+        return template.guid
+
     @classmethod
     def provision_from_template(cls, template_name, vm_name, wait_min=None, cpus=1, memory=1024,
             vlan=None, first_name="Shadowman", last_name="RedHat", email="shadowm@n.redhat.com"):
@@ -321,93 +499,195 @@ class MiqVM(HasManyDatastores, BelongsToCluster):
             email: Email of the requestee
         Returns: :py:class:`MiqVM` object with freshly provisioned VM.
         """
-        vm_table = cfmedb['vms']
-        for vm in cfmedb.session.query(vm_table.name, vm_table.guid)\
-            .filter(vm_table.template == True):  # NOQA
-            # Previous line is ok, if you change it to `is`, it won't work!
-            if vm.name.strip() == template_name.strip():
-                template_guid = vm.guid
-                break
-        else:
-            raise Exception("Template %s not found!" % template_name)
-        template = cls(template_guid)
-        # Tag provider
-        for tag in template.provider.tags:
-            if tag.category == "prov_scope" and tag.tag_name == "all":
-                break
-        else:
-            logger.info("Tagging provider %s" % template.provider.name)
-            template.provider.add_tag(("prov_scope", "all"))
-        # Tag all provider's hosts
-        for host in template.provider.hosts:
-            for tag in host.tags:
-                if tag.category == "prov_scope" and tag.tag_name == "all":
-                    break
-            else:
-                logger.info("Tagging host %s" % host.name)
-                host.add_tag(("prov_scope", "all"))
-        # Tag all provider's datastores
-        for datastore in template.provider.datastores:
-            ds_name = datastore.name
-            if is_datastore_banned(ds_name):
-                logger.info("Skipping datastore %s" % ds_name)
+        provisioner = BulkProvisioner(concurrency=1, timeout=(wait_min * 60 if wait_min else 300),
+            first_name=first_name, last_name=last_name, email=email)
+        provisioner.add(template_name, vm_name, cpus=cpus, memory=memory, vlan=vlan)
+        for new_vm in provisioner.provision():
+            return new_vm
+        raise provisioner.failures[vm_name]
+
+
+class BulkProvisioner(object):
+    """Provisions many VMs from templates, with their requests in flight at the same time
+
+    Requests are submitted up to ``concurrency`` at a time. All outstanding requests are
+    polled together every ``poll_delay`` seconds, and new requests are submitted as others
+    finish. Provisioned VMs are yielded by :py:meth:`provision` as soon as they're ready.
+
+    A failed request doesn't stop the others; its exception is stored in :py:attr:`failures`,
+    keyed by VM name.
+
+    Args:
+        concurrency: Maximum number of provisioning requests in flight
+        poll_delay: Seconds between polls of the outstanding requests
+        approval_timeout: Seconds to wait for a request to be approved
+        timeout: Seconds to wait for an approved request to finish
+        first_name: Name of the requestee
+        last_name: Surname of the requestee
+        email: Email of the requestee
+
+    Usage:
+        provisioner = BulkProvisioner(concurrency=5)
+        for i in range(20):
+            provisioner.add('my_template', 'scale_vm_%d' % i)
+        for vm in provisioner.provision():
+            vm.power_on()
+        assert not provisioner.failures
+    """
+    def __init__(self, concurrency=10, poll_delay=5, approval_timeout=180, timeout=300,
+            first_name="Shadowman", last_name="RedHat", email="shadowm@n.redhat.com"):
+        self.concurrency = concurrency
+        self.poll_delay = poll_delay
+        self.approval_timeout = approval_timeout
+        self.timeout = timeout
+        self.requester = MiqClient.pipeoptions(dict(
+            owner_first_name=first_name,
+            owner_last_name=last_name,
+            owner_email=email
+        ))
+        #: Exceptions of failed provisioning requests, keyed by VM name
+        self.failures = {}
+        self._queue = deque()
+        self._template_guids = {}
+        self._prepared_providers = set()
+
+    def add(self, template_name, vm_name, cpus=1, memory=1024, vlan=None):
+        """Queue a VM to be provisioned
+
+        Args:
+            template_name: Name of the template to use.
+            vm_name: VM Name.
+            cpus: How many CPUs should the VM have.
+            memory: How much memory (in MB) should the VM have.
+            vlan: Where to connect the VM. Obligatory for RHEV
+        """
+        self._queue.append(dict(
+            template_name=template_name, vm_name=vm_name, cpus=cpus, memory=memory, vlan=vlan))
+
+    def provision(self):
+        """Provision all queued VMs
+
+        Yields: :py:class:`MiqVM` objects, in the order they finish provisioning
+        """
+        outstanding = {}
+        pool = ThreadPool(self.concurrency)
+        try:
+            while self._queue or outstanding:
+                self._submit_queued(pool, outstanding)
+                if not outstanding:
+                    continue
+
+                time.sleep(self.poll_delay)
+                req_ids = outstanding.keys()
+                for req_id, request in zip(req_ids, pool.map(self._get_request, req_ids)):
+                    vm_request = outstanding[req_id]
+                    try:
+                        new_vm = self._check_request(vm_request, request)
+                    except Exception as e:
+                        del outstanding[req_id]
+                        self._fail(vm_request['vm_name'], e)
+                        continue
+                    if new_vm is not None:
+                        del outstanding[req_id]
+                        logger.info("VM %s has been provisioned" % vm_request['vm_name'])
+                        yield new_vm
+        finally:
+            pool.terminate()
+
+    def _submit_queued(self, pool, outstanding):
+        """Submit queued requests, until there are ``concurrency`` of them in flight"""
+        vm_requests = []
+        while self._queue and len(outstanding) + len(vm_requests) < self.concurrency:
+            vm_request = self._queue.popleft()
+            # Template lookup and provider tagging hit the DB, so they stay in this thread
+            try:
+                vm_request['template_guid'] = self._prepare_template(vm_request['template_name'])
+            except Exception as e:
+                self._fail(vm_request['vm_name'], e)
                 continue
-            for tag in datastore.tags:
-                if tag.category == "prov_scope" and tag.tag_name == "all":
-                    break
+            vm_requests.append(vm_request)
+
+        for vm_request, req_id in zip(vm_requests, pool.map(self._submit, vm_requests)):
+            if isinstance(req_id, Exception):
+                self._fail(vm_request['vm_name'], req_id)
             else:
-                logger.info("Tagging datastore %s" % ds_name)
-                datastore.add_tag(("prov_scope", "all"))
-        # Create request
-        template_fields = client.pipeoptions(dict(guid=template_guid))
+                vm_request['submitted'] = time.time()
+                vm_request['approved'] = None
+                outstanding[req_id] = vm_request
+
+    def _prepare_template(self, template_name):
+        """Returns the template's GUID, tagging its provider for provisioning on first use"""
+        if template_name not in self._template_guids:
+            template_guid = MiqVM.find_template_guid(template_name)
+            provider = MiqVM(template_guid).provider
+            if provider.id not in self._prepared_providers:
+                prepare_provider_for_provisioning(provider)
+                self._prepared_providers.add(provider.id)
+            self._template_guids[template_name] = template_guid
+        return self._template_guids[template_name]
+
+    def _submit(self, vm_request):
+        """Submit a provisioning request, returns its id (or the exception raised)"""
+        template_fields = client.pipeoptions(dict(guid=vm_request['template_guid']))
         vm_fields = dict(
-            number_of_cpu=cpus,
-            vm_memory=memory,
-            vm_name=vm_name
+            number_of_cpu=vm_request['cpus'],
+            vm_memory=vm_request['memory'],
+            vm_name=vm_request['vm_name']
         )
-        if vlan:    # RHEV-M requires this field
-            vm_fields["vlan"] = vlan
+        if vm_request['vlan']:    # RHEV-M requires this field
+            vm_fields["vlan"] = vm_request['vlan']
         vm_fields = client.pipeoptions(vm_fields)
-        requester = client.pipeoptions(dict(
-            owner_first_name=first_name,
-            owner_last_name=last_name,
-            owner_email=email
-        ))
         try:
-            req_id = client.service.VmProvisionRequest(
-                "1.1", template_fields, vm_fields, requester, "", ""
+            return client.service.VmProvisionRequest(
+                "1.1", template_fields, vm_fields, self.requester, "", ""
             ).id
         except WebFault as e:
             if "'Network/vLan' is required" in e.message:
-                raise TypeError("You have to specify `vlan` parameter for this function! (RHEV-M?)")
-            else:
-                raise
-        logger.info("Waiting for VM provisioning request approval")
-        wait_for(
-            lambda: client.service.GetVmProvisionRequest(req_id).approval_state == "approved",
-            num_sec=180,
-            delay=5,
-            message="VM provision approval"
-        )
+                return TypeError(
+                    "You have to specify `vlan` parameter for this function! (RHEV-M?)")
+            return e
+        except Exception as e:
+            return e
+
+    def _get_request(self, req_id):
+        """Fetch a provisioning request (or the exception raised)"""
+        try:
+            return client.service.GetVmProvisionRequest(req_id)
+        except Exception as e:
+            return e
 
-        def check_whether_provisioning_finished():
-            request = client.service.GetVmProvisionRequest(req_id)
-            if request.status.lower().strip() == "error":
-                raise Exception(request.message)    # change the exception class here
-            return request.status.lower().strip() == "ok" and len(request.vms) > 0
+    def _check_request(self, vm_request, request):
+        """Returns the provisioned :py:class:`MiqVM` if the request is done, ``None`` if not
 
-        logger.info("Waiting for VM provisioning to be done")
-        wait_for(
-            check_whether_provisioning_finished,
-            num_sec=(wait_min * 60 if wait_min else 300), delay=5, message="provisioning"
-        )
-        vm_guid = client.service.GetVmProvisionRequest(req_id).vms[0].guid
-        new_vm = MiqVM(client.service.FindVmByGuid(vm_guid).guid)
-        # some basic sanity checks though they should always pass
-        assert new_vm.name == vm_name
-        assert new_vm.object.guid == vm_guid
-        logger.info("VM has been provisioned")
-        return new_vm
+        Raises an exception if the request failed or timed out.
+        """
+        if isinstance(request, Exception):
+            raise request
+        status = request.status.lower().strip()
+        if status == "error":
+            raise Exception(request.message)    # change the exception class here
+        now = time.time()
+        if vm_request['approved'] is None:
+            if request.approval_state == "approved":
+                vm_request['approved'] = now
+            elif now - vm_request['submitted'] > self.approval_timeout:
+                raise TimedOutError("VM provision approval for %s timed out" %
+                    vm_request['vm_name'])
+            else:
+                return None
+
+        if status == "ok" and len(request.vms) > 0:
+            new_vm = MiqVM(request.vms[0].guid)
+            # some basic sanity checks though they should always pass
+            assert new_vm.name == vm_request['vm_name']
+            return new_vm
+        elif now - vm_request['approved'] > self.timeout:
+            raise TimedOutError("Provisioning of %s timed out" % vm_request['vm_name'])
+        return None
+
+    def _fail(self, vm_name, exception):
+        logger.error("Provisioning of VM %s failed: %s" % (vm_name, exception))
+        self.failures[vm_name] = exception
 
 
 class MiqHost(HasManyDatastores, HasManyVMs, HasManyResourcePools, BelongsToCluster):
@@ -16,6 +16,9 @@ _this_file = os.path.abspath(__file__)
 #: The project root, ``cfme_tests/``
 project_path = local(_this_file).new(basename='..')
 
+#: local caches, safe to delete, ``cfme_tests/cache/``
+cache_path = project_path.join('cache')
+
 #: conf yaml storage, ``cfme_tests/conf/``
 conf_path = project_path.join('conf')
 
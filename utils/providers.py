@@ -6,11 +6,11 @@ To quickly add all providers::
 
 """
 from functools import partial
-from operator import methodcaller
 
 import cfme.fixtures.pytest_selenium as sel
 from cfme.web_ui import Quadicon, paginator, toolbar
-from utils import conf, mgmt_system
+from utils import conf, mgmt_replay, mgmt_system
+from utils.async import StreamingPool
 from utils.log import logger, perflog
 from utils.wait import wait_for
 
@@ -31,6 +31,12 @@ provider_type_map = dict(
     infra_provider_type_map.items() + cloud_provider_type_map.items()
 )
 
+#: Seconds to wait for backend stats in :py:func:`validate_providers`
+STATS_TIMEOUT = 300
+
+#: offline stand-in provider, see :py:mod:`utils.mgmt_replay`
+provider_type_map['replay'] = mgmt_replay.ReplaySystem
+
 
 def list_providers(allowed_types):
     """ Returns list of providers of selected type from configuration.
@@ -76,7 +82,11 @@ def provider_factory(provider_name, providers=None, credentials=None):
     provider = providers[provider_name]
 
     if credentials is None:
-        credentials = conf.credentials[provider['credentials']]
+        if 'credentials' in provider:
+            credentials = conf.credentials[provider['credentials']]
+        else:
+            # Providers that don't connect to anything (e.g. replay) don't need credentials
+            credentials = {}
 
     # Munge together provider dict and creds,
     # Let the provider do whatever they need with them
@@ -143,13 +153,74 @@ def setup_providers(validate=True, check_existing=True):
     added_providers.extend(setup_infrastructure_providers(**setup_kwargs))
 
     if validate:
-        map(methodcaller('validate'), added_providers)
+        validate_providers(added_providers)
 
     perflog.stop('utils.providers.setup_providers')
 
     return added_providers
 
 
+def provider_stats(provider_key, stats):
+    """Gather the named stats from a provider's backend management system
+
+    Args:
+        provider_key: Provider key name from cfme_data
+        stats: A list of stat names, see :py:meth:`utils.mgmt_system.MgmtSystemAPIBase.stats`
+
+    Returns: A dict of stats
+
+    """
+    client = provider_factory(provider_key)
+    try:
+        return client.stats(*stats)
+    finally:
+        client.disconnect()
+
+
+def validate_providers(providers, stats_timeout=STATS_TIMEOUT):
+    """Validate providers, gathering their backend stats concurrently
+
+    Backend stats for every provider are requested at once in a thread pool, and each provider's
+    UI side is validated as soon as its stats arrive. Validating several providers then takes
+    about as long as the slowest backend, instead of the sum of all of them.
+
+    Args:
+        providers: A list of :py:class:`cfme.cloud.provider.Provider` or
+            :py:class:`cfme.infrastructure.provider.Provider` instances
+        stats_timeout: Seconds to wait for each provider's stats, counted from when its stats
+            request started. On timeout or error, that provider's ``validate`` will ask its
+            backend for stats itself.
+
+    """
+    if not providers:
+        return
+
+    perflog.start('utils.providers.validate_providers')
+    pool = StreamingPool(len(providers))
+    pending = {pool.apply_async(provider_stats, [provider.key, provider.STATS_TO_MATCH]): provider
+        for provider in providers}
+
+    try:
+        for task in pool.as_completed(task_timeout=stats_timeout):
+            provider = pending.pop(task)
+            if not task.ready():
+                logger.warning('Timed out gathering stats for provider %s' % provider.key)
+                host_stats = None
+            elif task.successful():
+                logger.info('Gathered stats for provider %s in %f seconds' %
+                    (provider.key, task.duration))
+                host_stats = task.result
+            else:
+                logger.warning('Failed gathering stats for provider %s: %s: %s' %
+                    (provider.key, type(task.exception).__name__, task.exception))
+                host_stats = None
+            provider.validate(host_stats=host_stats)
+    finally:
+        # Don't wait on backends that timed out
+        pool.terminate()
+        perflog.stop('utils.providers.validate_providers')
+
+
 def _setup_providers(cloud_or_infra, validate, check_existing):
     """Helper to set up all cloud or infra providers, and then validate them
 
@@ -205,7 +276,7 @@ def _setup_providers(cloud_or_infra, validate, check_existing):
         added_providers.append(provider)
 
     if validate:
-        map(methodcaller('validate'), added_providers)
+        validate_providers(added_providers)
 
     return added_providers
 
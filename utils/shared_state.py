@@ -0,0 +1,141 @@
+"""Coordination of appliance setup between the processes of a test run
+
+When a test run is split across xdist slaves, every slave would otherwise run the same appliance
+setup, at the same time, against the same appliance. These locks and results are shared by all
+the processes of a test run, using lock files in ``cache/shared_state/<run id>``:
+
+* :py:func:`lock` makes appliance changes one process at a time.
+* :py:func:`run_once` runs a setup function in one process, while the others wait and get its
+  result.
+* :py:func:`hold` keeps appliance state, like server roles, set up while tests need it. Tests
+  needing the same state share it, and it's only changed once none of them are running.
+
+:py:mod:`fixtures.shared_state` creates the run directory, and hands it to the xdist slaves.
+
+Usage:
+
+.. code-block:: python
+
+    from utils import shared_state
+
+    with shared_state.lock('providers'):
+        # add providers
+
+    with shared_state.hold('server_roles', 'automate', set_roles, ['automate']):
+        # test needing the automate role
+
+    listener_port = shared_state.run_once('listener', start_listener)
+
+Note:
+    Locks are not reentrant: a process holding a lock, or state, must not take the same one
+    again.
+
+"""
+import atexit
+import cPickle
+import fcntl
+import os
+from contextlib import contextmanager
+
+from utils.path import cache_path
+
+#: Directory holding the lock files of each test run
+shared_state_path = cache_path.join('shared_state')
+
+# The current run's directory, set by set_run
+_run_path = None
+
+
+def set_run(run_id):
+    """Use the lock files of the test run with this id, see :py:mod:`fixtures.shared_state`"""
+    global _run_path
+    _run_path = shared_state_path.join(run_id)
+    _run_path.ensure(dir=True)
+
+
+def run_path():
+    """Directory holding this test run's lock files
+
+    Outside of a test run, every process gets its own directory, removed when it exits.
+    """
+    if _run_path is None:
+        set_run('pid-%d' % os.getpid())
+        atexit.register(_remove_run, _run_path, os.getpid())
+    return _run_path
+
+
+def _remove_run(path, pid):
+    # Forked children inherit exit handlers, only the process that made the directory removes it
+    if os.getpid() == pid and path.check():
+        path.remove(ignore_errors=True)
+
+
+@contextmanager
+def lock(name):
+    """Context manager holding the named lock, shared by all the processes of the test run"""
+    with run_path().join('%s.lock' % name).open('a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def hold(name, key, setup, *args, **kwargs):
+    """Context manager holding the named appliance state, set up as key, for the whole block
+
+    Processes holding the state with the same key share it. A process needing another key waits
+    until none of them hold it anymore, then calls setup to change the state, while the others
+    wait; the key set up last is reused without calling setup again.
+
+    Args:
+        name: Name of the state, shared by all processes of the test run
+        key: A string describing the state that's needed, e.g. the server roles to set
+        setup: Function setting the state up as key
+        *args: Arguments to setup
+        **kwargs: Keyword arguments to setup
+    """
+    key_file = run_path().join('%s.key' % name)
+    with run_path().join('%s.lock' % name).open('a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            if not key_file.check() or key_file.read() != key:
+                # Unlocked first: two processes holding the state and both waiting for exclusive
+                # locks would wait on each other
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Another process may have set it up while this one was waiting
+                if not key_file.check() or key_file.read() != key:
+                    if key_file.check():
+                        # Until setup finishes, the state is unknown
+                        key_file.remove()
+                    setup(*args, **kwargs)
+                    key_file.write(key)
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_once(name, function, *args, **kwargs):
+    """Call a function once per test run, no matter how many processes call this
+
+    The first process to get here calls the function, the others wait for it to finish and get
+    its result. If the function raises an exception, the next process calls it again.
+
+    Args:
+        name: Name of the call, shared by all processes of the test run
+        function: The function to call, its result must be picklable
+        *args: Arguments to the function
+        **kwargs: Keyword arguments to the function
+
+    Returns: The function's result
+    """
+    result_file = run_path().join('%s.result' % name)
+    with lock(name):
+        if result_file.check():
+            return cPickle.loads(result_file.read_binary())
+        result = function(*args, **kwargs)
+        result_file.write_binary(cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL))
+        return result
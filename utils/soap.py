@@ -1,8 +1,35 @@
+"""SOAP clients for the CFME web services API
+
+Creating a suds client means downloading and parsing the vmdbws WSDL, which is slow. To avoid
+paying that on every use:
+
+* The parsed WSDL is cached on disk under ``cache/soap/``, keyed by the appliance hostname and
+  version, so it survives between test runs and is refreshed when the appliance is upgraded.
+* One prototype client is built per appliance, and every client handed out afterwards is a
+  cheap clone of it (see :py:meth:`suds.client.Client.clone`).
+
+suds clients keep per-request state, so they shouldn't be shared between threads.
+:py:class:`SoapClientPool` gives each thread its own clone.
+
+"""
+import threading
+from urlparse import urlparse
+
+from suds.cache import ObjectCache
 from suds.client import Client
 from suds.transport.https import HttpAuthenticated
 from suds.xsd.doctor import ImportDoctor, Import
 
 from utils import conf
+from utils.db import Db
+from utils.log import logger
+from utils.path import cache_path
+
+#: Days before a cached WSDL is downloaded again, even if the appliance version didn't change
+WSDL_CACHE_DAYS = 30
+
+_prototypes = {}
+_prototypes_lock = threading.Lock()
 
 
 class MiqClient(Client):
@@ -22,17 +49,88 @@ class MiqClient(Client):
 
         return '|'.join(pair_list)
 
+    def clone(self):
+        """Shallow clone sharing this client's parsed WSDL, still a :py:class:`MiqClient`"""
+        clone = super(MiqClient, self).clone()
+        clone.__class__ = type(self)
+        return clone
+
+
+def appliance_version(hostname):
+    """Returns the version of the appliance at hostname, as recorded in its database
+
+    Returns ``'unknown'`` if the database can't be queried.
+    """
+    try:
+        db = Db(hostname)
+        version = db.session.query(db['miq_servers'].version).first()
+        if version is not None and version[0]:
+            return str(version[0])
+    except Exception as ex:
+        logger.warning('Could not query appliance version on %s: %s' % (hostname, ex))
+    return 'unknown'
+
+
+def wsdl_cache(hostname):
+    """Returns an on-disk suds document cache for the appliance at hostname"""
+    cache_dir = cache_path.join('soap', '%s_%s' % (hostname, appliance_version(hostname)))
+    return ObjectCache(location=str(cache_dir), days=WSDL_CACHE_DAYS)
+
+
+def _prototype_client(base_url):
+    """Returns the prototype client for an appliance, building it on first use"""
+    with _prototypes_lock:
+        if base_url not in _prototypes:
+            username = conf.credentials['default']['username']
+            password = conf.credentials['default']['password']
+            url = '%s/vmdbws/wsdl/' % base_url
+
+            transport = HttpAuthenticated(username=username, password=password)
+            imp = Import('http://schemas.xmlsoap.org/soap/encoding/')
+            doc = ImportDoctor(imp)
+            cache = wsdl_cache(urlparse(base_url).hostname)
+
+            _prototypes[base_url] = MiqClient(url, transport=transport, doctor=doc, cache=cache)
+        return _prototypes[base_url]
+
+
+def soap_client(base_url=None):
+    """ SoapClient to EVM based on base_url
+
+    Args:
+        base_url: Appliance base url, defaults to ``base_url`` from env.yaml
+
+    Returns: A new :py:class:`MiqClient`, cloned from the appliance's prototype client
+    """
+    return _prototype_client(base_url or conf.env['base_url']).clone()
+
+
+class SoapClientPool(object):
+    """Thread-safe stand-in for a :py:class:`MiqClient`
+
+    Attribute access is delegated to a client belonging to the calling thread, so one pool can
+    be shared by any number of threads. Clients are created on first use in each thread.
+
+    Args:
+        base_url: Appliance base url, defaults to ``base_url`` from env.yaml
 
-def soap_client():
-    """ SoapClient to EVM based on base_url"""
-    username = conf.credentials['default']['username']
-    password = conf.credentials['default']['password']
-    url = '%s/vmdbws/wsdl/' % conf.env['base_url']
+    Usage:
+        client = SoapClientPool()
+        client.service.EVMPing()
 
-    transport = HttpAuthenticated(username=username, password=password)
-    imp = Import('http://schemas.xmlsoap.org/soap/encoding/')
-    doc = ImportDoctor(imp)
+    """
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self._local = threading.local()
 
-    client = MiqClient(url, transport=transport, doctor=doc)
+    @property
+    def client(self):
+        """The calling thread's :py:class:`MiqClient`"""
+        try:
+            return self._local.client
+        except AttributeError:
+            self._local.client = soap_client(self.base_url)
+            return self._local.client
 
-    return client
+    def __getattr__(self, name):
+        return getattr(self.client, name)
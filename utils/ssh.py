@@ -5,6 +5,7 @@ import paramiko
 from scp import SCPClient
 
 from utils import conf
+from utils.log import perflog
 
 
 class SSHClient(paramiko.SSHClient):
@@ -73,7 +74,7 @@ class SSHClient(paramiko.SSHClient):
 def command_runner(client, command, stream_output=False):
     template = '%s\n'
     command = template % command
-    with client as ctx:
+    with client as ctx, perflog.span('ssh.run_command', host=_hostname(client)):
         transport = ctx.get_transport()
         session = transport.open_session()
         session.exec_command(command)
@@ -113,12 +114,16 @@ def rake_runner(client, command, stream_output=False):
 
 
 def scp_putter(client, local_file, remote_file):
-    with client as ctx:
+    with client as ctx, perflog.span('ssh.put_file', host=_hostname(client)):
         transport = ctx.get_transport()
         SCPClient(transport).put(local_file, remote_file)
 
 
 def scp_getter(client, remote_file, local_path):
-    with client as ctx:
+    with client as ctx, perflog.span('ssh.get_file', host=_hostname(client)):
         transport = ctx.get_transport()
         SCPClient(transport).get(remote_file, local_path)
+
+
+def _hostname(client):
+    return client._connect_kwargs.get('hostname')
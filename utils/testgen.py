@@ -79,16 +79,100 @@ More information on ``parametrize`` can be found in pytest's documentation:
 
 * https://pytest.org/latest/parametrize.html#_pytest.python.Metafunc.parametrize
 
+Provider parametrization is generated for every test module (and every test function) during
+collection, so it's kept cheap: the providers in ``cfme_data`` are read into a
+:py:class:`ProviderCatalog` once per session, and provider CRUD and management system objects
+aren't built during collection at all. Instead, ``provider_crud`` and ``provider_mgmt`` are
+fixtures (see :py:mod:`fixtures.testgen`) that depend on the parametrized ``provider_key``, and
+build their objects when a test that uses them runs.
+
 """
+import hashlib
+import json
+from collections import namedtuple
+
 import pytest
 
 from cfme.cloud.provider import get_from_config as get_cloud_provider
 from cfme.infrastructure.provider import get_from_config as get_infra_provider
 from cfme.infrastructure.pxe import get_pxe_server_from_config
+from utils import conf
 from utils.conf import cfme_data
 from utils.log import logger
 from utils.providers import cloud_provider_type_map, infra_provider_type_map, provider_factory
 
+_catalogs = {}
+
+
+class ProviderEntry(namedtuple('ProviderEntry', ['key', 'type', 'data'])):
+    """A provider in the :py:class:`ProviderCatalog`
+
+    Attributes:
+        key: The provider's key in ``cfme_data['management_systems']``
+        type: The provider type, e.g. ``virtualcenter``
+        data: The provider data dict from cfme_data
+    """
+    __slots__ = ()
+
+
+class ProviderCatalog(tuple):
+    """Immutable sequence of the :py:class:`ProviderEntry` for each provider in cfme_data
+
+    Use :py:func:`provider_catalog` to get the catalog for the current cfme_data, rather than
+    creating one.
+
+    Args:
+        management_systems: The ``management_systems`` section of cfme_data
+    """
+    def __new__(cls, management_systems):
+        return super(ProviderCatalog, cls).__new__(cls, (ProviderEntry(key, data['type'], data)
+            for key, data in management_systems.iteritems()))
+
+    def by_type(self, provider_types=None):
+        """Entries for the given provider types, or all entries if provider_types is None"""
+        if provider_types is None:
+            return list(self)
+        return [entry for entry in self if entry.type in provider_types]
+
+
+def provider_catalog():
+    """Returns the :py:class:`ProviderCatalog` for the current cfme_data
+
+    Catalogs are memoized on a hash of the ``management_systems`` content, so they are built
+    once per session, and rebuilt if cfme_data changes.
+    """
+    management_systems = conf.cfme_data.get('management_systems', {})
+    content_hash = hashlib.sha1(
+        json.dumps(management_systems, sort_keys=True, default=repr)).hexdigest()
+    try:
+        return _catalogs[content_hash]
+    except KeyError:
+        catalog = _catalogs[content_hash] = ProviderCatalog(management_systems)
+        return catalog
+
+
+def get_provider_crud(provider_key):
+    """Builds the CRUD object for a provider, cloud or infra as appropriate
+
+    Args:
+        provider_key: The provider's key in ``cfme_data['management_systems']``
+    """
+    prov_type = conf.cfme_data['management_systems'][provider_key]['type']
+    if prov_type in cloud_provider_type_map:
+        return get_cloud_provider(provider_key)
+    elif prov_type in infra_provider_type_map:
+        return get_infra_provider(provider_key)
+    raise ValueError('Provider "%s" has an unknown type "%s"' % (provider_key, prov_type))
+
+
+def get_provider_mgmt(provider_key):
+    """Builds the :py:mod:`utils.mgmt_system` object for a provider
+
+    Args:
+        provider_key: The provider's key in ``cfme_data['management_systems']``
+    """
+    return provider_factory(provider_key)
+
 
 def generate(gen_func, *args, **kwargs):
     """Functional handler for inline pytest_generate_tests definition
@@ -183,10 +267,11 @@ def provider_by_type(metafunc, provider_types, *fields):
 
         ``provider_crud``
             the provider's CRUD object, either a :py:class:`cfme.cloud.provider.Provider`
-            or a :py:class:`cfme.infrastructure.provider.Provider`
+            or a :py:class:`cfme.infrastructure.provider.Provider`, built when the test runs
 
         ``provider_mgmt``
-            the provider's backend manager, from :py:class:`utils.mgmt_system`
+            the provider's backend manager, from :py:class:`utils.mgmt_system`, built when the
+            test runs
 
     Returns:
         An tuple of ``(argnames, argvalues, idlist)`` for use in a pytest_generate_tests hook, or
@@ -217,19 +302,15 @@ def provider_by_type(metafunc, provider_types, *fields):
     argvalues = []
     idlist = []
 
-    special_args = ('provider_key', 'provider_data', 'provider_crud',
-        'provider_mgmt', 'provider_type')
+    # provider_crud and provider_mgmt are fixtures using provider_key, which puts provider_key
+    # in fixturenames for any test that uses them
+    special_args = ('provider_key', 'provider_data', 'provider_type')
     # Hook on special attrs if requested
     for argname in special_args:
         if argname in metafunc.fixturenames and argname not in argnames:
             argnames.append(argname)
 
-    for provider, data in cfme_data['management_systems'].iteritems():
-        prov_type = data['type']
-        if provider_types is not None and prov_type not in provider_types:
-            # Skip unwanted types
-            continue
-
+    for provider, prov_type, data in provider_catalog().by_type(provider_types):
         # Use the provider name for idlist, helps with readable parametrized test output
         idlist.append(provider)
 
@@ -244,15 +325,7 @@ def provider_by_type(metafunc, provider_types, *fields):
                     (field, provider)
                 )
 
-        if prov_type in cloud_provider_type_map:
-            crud = get_cloud_provider(provider)
-        elif prov_type in infra_provider_type_map:
-            crud = get_infra_provider(provider)
-        # else: wat? You deserve the NameError you're about to receive
-
-        mgmt = provider_factory(provider)
-
-        special_args_map = dict(zip(special_args, (provider, data, crud, mgmt, prov_type)))
+        special_args_map = dict(zip(special_args, (provider, data, prov_type)))
         for arg in special_args:
             if arg in argnames:
                 values.append(special_args_map[arg])
@@ -0,0 +1,79 @@
+import pytest
+
+from fixtures.affinity import affinity_order, state_changes
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class Item(object):
+    # Just enough of a py.test item to be ordered
+    def __init__(self, nodeid, fixturenames=(), page_name=None, requires=()):
+        self.nodeid = nodeid
+        self.fspath = nodeid.split('::')[0]
+        self.fixturenames = list(fixturenames)
+        self._marks = {}
+        if page_name is not None:
+            self.fixturenames.append('go_to_fixture')
+            self._marks['fixtureconf'] = pytest.mark.fixtureconf(page_name=page_name)
+        if requires:
+            self._marks['requires_test'] = pytest.mark.requires_test(*requires)
+
+    def get_marker(self, name):
+        return self._marks.get(name)
+
+    def __repr__(self):
+        return self.nodeid
+
+
+def nodeids(items):
+    return [item.nodeid for item in items]
+
+
+def test_modules_grouped_by_state():
+    items = [
+        Item('a.py::test_1', ['setup_infrastructure_providers']),
+        Item('b.py::test_1'),
+        Item('c.py::test_1', ['setup_infrastructure_providers']),
+        Item('c.py::test_2'),
+        Item('d.py::test_1', ['setup_infrastructure_providers']),
+    ]
+    ordered = affinity_order(items)
+    # a and d need the same state, c's tests stay together and in its module
+    assert nodeids(ordered) == ['a.py::test_1', 'd.py::test_1', 'b.py::test_1', 'c.py::test_1',
+        'c.py::test_2']
+    assert state_changes(ordered) < state_changes(items)
+
+
+def test_pages_grouped_in_module():
+    items = [
+        Item('a.py::test_1', page_name='services_catalogs'),
+        Item('a.py::test_2', page_name='infrastructure_providers'),
+        Item('a.py::test_3', page_name='services_catalogs'),
+        Item('b.py::test_1', page_name='services_catalogs'),
+    ]
+    assert nodeids(affinity_order(items)) == ['a.py::test_1', 'a.py::test_3', 'a.py::test_2',
+        'b.py::test_1']
+
+
+def test_requires_test_honoured():
+    items = [
+        Item('a.py::test_add', page_name='infrastructure_providers'),
+        Item('a.py::test_page', page_name='services_catalogs'),
+        Item('a.py::test_edit', page_name='infrastructure_providers', requires=['test_page']),
+    ]
+    # test_edit would be grouped with test_add, but has to wait for test_page
+    assert nodeids(affinity_order(items)) == nodeids(items)
+
+
+def test_multiple_requires_honoured():
+    items = [
+        Item('a.py::test_add', page_name='infrastructure_providers'),
+        Item('b.py::test_page', page_name='services_catalogs'),
+        Item('a.py::test_edit', page_name='infrastructure_providers',
+            requires=['a.py::test_add', 'test_page']),
+    ]
+    ordered = nodeids(affinity_order(items))
+    assert ordered.index('a.py::test_edit') > ordered.index('b.py::test_page')
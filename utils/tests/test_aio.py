@@ -0,0 +1,81 @@
+import time
+from collections import defaultdict
+
+import pytest
+from tornado import gen
+
+from utils import aio
+from utils.log import Histogram, perflog
+from utils.wait import TimedOutError
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class Incrementor(object):
+    def __init__(self):
+        self.value = 0
+
+    def increment(self):
+        self.value += 1
+        return self.value
+
+
+def test_aio_wait_for():
+    incman = Incrementor()
+    out, duration = aio.run(aio.wait_for, lambda: incman.increment() >= 3, delay=.01)
+    assert out
+    assert incman.value == 3
+
+
+def test_aio_wait_for_coroutine_func():
+    incman = Incrementor()
+
+    @gen.coroutine
+    def check():
+        yield gen.sleep(.01)
+        raise gen.Return(incman.increment() >= 2)
+
+    out, duration = aio.run(aio.wait_for, check, delay=.01)
+    assert incman.value == 2
+
+
+def test_aio_wait_for_timeout():
+    with pytest.raises(TimedOutError):
+        aio.run(aio.wait_for, lambda: False, num_sec=.1, delay=.02)
+
+
+def test_aio_concurrent_waits():
+    # Many waits, sleeping between checks, all run at once on one thread
+    @gen.coroutine
+    def wait_many():
+        incmen = [Incrementor() for i in range(20)]
+        results = yield [aio.wait_for(lambda incman=incman: incman.increment() >= 3, delay=.1)
+            for incman in incmen]
+        raise gen.Return(results)
+
+    start = time.time()
+    results = aio.run(wait_many)
+    assert len(results) == 20
+    assert time.time() - start < 1
+
+
+def test_aio_poll_provider():
+    def blocking_check(incman):
+        time.sleep(.01)
+        return incman.increment() >= 2
+
+    incman = Incrementor()
+    out, duration = aio.run(aio.poll_provider, blocking_check, incman, delay=.01)
+    assert incman.value == 2
+
+
+def test_aio_poll_provider_histogram(monkeypatch):
+    # Polls with different arguments are recorded under the same event
+    monkeypatch.setattr(perflog, '_histograms', defaultdict(Histogram))
+    for vm_name in ('vm1', 'vm2'):
+        aio.run(aio.poll_provider, lambda vm_name: True, vm_name)
+    assert perflog.histograms().keys() == ['aio.wait_for']
+    assert perflog.histograms()['aio.wait_for']['count'] == 2
@@ -1,9 +1,11 @@
 import string
+import time
+from multiprocessing import TimeoutError
 
 import pytest
 from unittestzero import Assert
 
-from utils.async import ResultsPool
+from utils.async import CancelledError, ResultsPool, StreamingPool
 
 def async_task(arg1, arg2):
     # Task to reverse argument. Asynchronously...
@@ -23,3 +25,99 @@ def test_async():
         digit, letter = result.get()
         Assert.contains(digit, string.digits)
         Assert.contains(letter, string.letters)
+
+
+def sleepy_task(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def failing_task():
+    raise ValueError('task failed')
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_as_completed():
+    with StreamingPool(3) as pool:
+        for seconds in (.3, .1, .2):
+            pool.apply_async(sleepy_task, [seconds])
+        # Not picklable, but fine in threads
+        pool.apply_async(lambda: 'lambda')
+        completed = [task.result for task in pool.as_completed(timeout=5)]
+    Assert.equal(completed[-1], .3)
+    Assert.equal(sorted(completed[:-1]), [.1, .2, 'lambda'])
+    Assert.true(pool.successful)
+    for task in pool.results:
+        Assert.not_none(task.duration)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_exception():
+    with StreamingPool(1) as pool:
+        task = pool.apply_async(failing_task)
+        list(pool.as_completed())
+    Assert.false(pool.successful)
+    Assert.true(isinstance(task.exception, ValueError))
+    Assert.raises(ValueError, task.get)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_cancel():
+    with StreamingPool(1) as pool:
+        running = pool.apply_async(sleepy_task, [.2])
+        queued = pool.apply_async(sleepy_task, [.2])
+        time.sleep(.05)
+        Assert.equal(pool.cancel(), [queued])
+        Assert.equal(list(pool.as_completed(timeout=5)), [running])
+    Assert.raises(CancelledError, queued.get)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_timeout():
+    pool = StreamingPool(1)
+    pool.apply_async(sleepy_task, [.5])
+    Assert.raises(TimeoutError, list, pool.as_completed(timeout=.1))
+    pool.terminate()
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_processes():
+    with StreamingPool(2, use_processes=True) as pool:
+        pool.map_async(sleepy_task, [.01, .02])
+        pool.apply_async(async_task, ['b', 2])
+        completed = [task.result for task in pool.as_completed(timeout=10)]
+    Assert.true(pool.successful)
+    Assert.equal(sorted(completed), [.01, .02, (2, 'b')])
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_processes_cancel():
+    # Worker processes don't report when a task starts, so nothing can be cancelled
+    with StreamingPool(1, use_processes=True) as pool:
+        pool.apply_async(sleepy_task, [.2])
+        pool.apply_async(sleepy_task, [.2])
+        time.sleep(.05)
+        Assert.equal(pool.cancel(), [])
+        completed = [task.result for task in pool.as_completed(timeout=10)]
+    Assert.equal(completed, [.2, .2])
+    Assert.true(pool.successful)
+
+
+@pytest.mark.nondestructive
+@pytest.mark.skip_selenium
+def test_streaming_pool_task_timeout():
+    with StreamingPool(1) as pool:
+        slow = pool.apply_async(sleepy_task, [.5])
+        # Queued behind the slow task, its timeout only starts when it does
+        queued = pool.apply_async(sleepy_task, [.1])
+        completed = [(task, task.ready())
+            for task in pool.as_completed(timeout=5, task_timeout=.2)]
+    # The slow task was yielded unfinished, and not again once it finished
+    Assert.equal(completed, [(slow, False), (queued, True)])
+    Assert.true(queued.successful())
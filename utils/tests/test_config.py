@@ -3,7 +3,7 @@ from warnings import catch_warnings
 
 import pytest
 
-from utils import conf
+from utils import conf, _conf
 from utils._conf import Config, ConfigNotFound, RecursiveUpdateDict
 
 test_yaml_contents = '''
@@ -46,6 +46,8 @@ def create_test_yaml(request, contents, filename, local=False):
 
     request.addfinalizer(lambda: os.remove(full_path))
     request.addfinalizer(lambda: conf.clear())
+    compiled_file = _conf.compiled_file(filename[:-5])
+    request.addfinalizer(lambda: compiled_file.check() and compiled_file.remove())
 
     return test_yaml
 
@@ -92,3 +94,54 @@ def test_conf_yamls_not_found(random_string):
     # The warning we caught should be the correct type, and contain random_string
     assert issubclass(ConfigNotFound, warnings[0].category)
     assert random_string in str(warnings[0].message)
+
+
+def test_conf_yamls_compiled(test_yaml, monkeypatch):
+    conf[test_yaml]
+    assert _conf.compiled_file(test_yaml).check()
+
+    # Unchanged yamls are loaded from the compiled cache, in this process or a new one
+    def fail_load(*args, **kwargs):
+        raise AssertionError('yaml was parsed again')
+    monkeypatch.setattr(_conf.yaml, 'load', fail_load)
+    conf.clear()
+    assert conf[test_yaml]['test_key'] == 'test_value'
+    _conf._compiled.clear()
+    conf.clear()
+    assert conf[test_yaml]['test_key'] == 'test_value'
+
+
+def test_conf_yamls_secret_not_compiled(test_yaml, monkeypatch):
+    monkeypatch.setattr(_conf, 'secret_yamls', [test_yaml])
+    assert conf[test_yaml]['test_key'] == 'test_value'
+    assert not _conf.compiled_file(test_yaml).check()
+    # Still compiled in-process
+    monkeypatch.setattr(_conf.yaml, 'load', None)
+    conf.clear()
+    assert conf[test_yaml]['test_key'] == 'test_value'
+
+
+def test_conf_yamls_compiled_reload(request, test_yaml):
+    assert conf[test_yaml]['test_key'] == 'test_value'
+    with create_test_yaml(request, local_test_yaml_contents, test_yaml, local=True):
+        # Only the new local override is parsed, the base yaml comes from the cache
+        conf.clear()
+        assert conf[test_yaml]['test_key'] == 'test_overridden_value'
+        assert conf[test_yaml]['nested_test_root']['nested_test_key_2'] == 'nested_test_value_2'
+
+
+def test_conf_yamls_compiled_edited(test_yaml):
+    assert conf[test_yaml]['test_key'] == 'test_value'
+    # Edits invalidate the compiled yaml
+    with _conf.conf_path.join('%s.yaml' % test_yaml).open('w') as test_yaml_fh:
+        test_yaml_fh.write('test_key: edited_value')
+    conf.clear()
+    assert conf[test_yaml]['test_key'] == 'edited_value'
+
+
+def test_conf_yamls_compiled_corrupt(test_yaml):
+    conf[test_yaml]
+    _conf.compiled_file(test_yaml).write('not a pickle')
+    _conf._compiled.clear()
+    conf.clear()
+    assert conf[test_yaml]['test_key'] == 'test_value'
@@ -0,0 +1,107 @@
+import sys
+import types
+from collections import namedtuple
+
+import pytest
+
+from utils import durations
+from utils.durations import DurationHistory, order_by_duration
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+Item = namedtuple('Item', 'nodeid')
+
+
+@pytest.fixture
+def history(request, tmpdir):
+    history = DurationHistory(tmpdir.join('durations.sqlite'))
+    request.addfinalizer(history.close)
+    return history
+
+
+def test_estimates(history):
+    for call in (1.0, 2.0, 9.0):
+        history.add_run('5.2', {
+            'test_a': ('passed', 0.5, call, 0.5),
+            'test_b': ('failed', 0.0, 100.0, 0.0),
+        })
+    # Median of the passed runs, failures are left out
+    assert history.estimates() == {'test_a': 3.0}
+    assert history.estimates('5.3') == {}
+
+
+def test_regressions(history):
+    for call in (1.0, 1.1, 0.9):
+        history.add_run('5.2', {'test_a': ('passed', 0.0, call, 0.0)})
+    # Runs against other versions don't count toward the baseline
+    history.add_run('5.3', {'test_a': ('passed', 0.0, 100.0, 0.0)})
+
+    run_id = history.add_run('5.2', {'test_a': ('passed', 0.0, 1.5, 0.0)})
+    assert history.regressions(run_id) == []
+
+    run_id = history.add_run('5.2', {'test_a': ('passed', 0.0, 5.0, 0.0)})
+    assert history.regressions(run_id) == [('test_a', 5.0, 1.05)]
+
+
+def test_regressions_need_history(history):
+    history.add_run('5.2', {'test_a': ('passed', 0.0, 1.0, 0.0)})
+    run_id = history.add_run('5.2', {'test_a': ('passed', 0.0, 50.0, 0.0)})
+    assert history.regressions(run_id) == []
+
+
+def test_pruning(history, monkeypatch):
+    monkeypatch.setattr(durations, 'KEEP_RUNS', 3)
+    for i in range(5):
+        history.add_run('5.2', {'test_%d' % i: ('passed', 0.0, 1.0, 0.0)})
+    assert sorted(history.estimates()) == ['test_2', 'test_3', 'test_4']
+
+
+def test_order_by_duration():
+    items = [Item(nodeid) for nodeid in ('short.py::test_1', 'long.py::test_1',
+        'long.py::test_2', 'new.py::test_1', 'short.py::test_2')]
+    estimates = {
+        'short.py::test_1': 1.0,
+        'short.py::test_2': 1.0,
+        'long.py::test_1': 10.0,
+        'long.py::test_2': 2.0,
+    }
+    ordered = [item.nodeid for item in order_by_duration(items, estimates)]
+    # Modules are kept together and in order, the unknown module is estimated at the average
+    assert ordered == ['long.py::test_1', 'long.py::test_2', 'new.py::test_1',
+        'short.py::test_1', 'short.py::test_2']
+
+
+def test_appliance_version_without_appliance(monkeypatch):
+    from fixtures import durations as durations_plugin
+    monkeypatch.setattr(durations_plugin.conf, 'env', {})
+    assert durations_plugin._appliance_version(used_appliance=True) == 'unknown'
+
+
+def test_appliance_version_looked_up_if_used(monkeypatch):
+    from fixtures import durations as durations_plugin
+    lookups = []
+
+    def appliance_version(hostname):
+        lookups.append(hostname)
+        return '5.2'
+    soap = types.ModuleType('utils.soap')
+    soap.appliance_version = appliance_version
+    monkeypatch.setitem(sys.modules, 'utils.soap', soap)
+    monkeypatch.setattr(durations_plugin.conf, 'env', {'base_url': 'https://appliance'})
+    assert durations_plugin._appliance_version(used_appliance=False) == 'unknown'
+    assert lookups == []
+    assert durations_plugin._appliance_version(used_appliance=True) == '5.2'
+    assert lookups == ['appliance']
+
+
+@pytest.mark.parametrize(('keywords', 'used'), [
+    ({'test_a': 1, 'skip_selenium': 1}, False),
+    ({'test_a': 1, 'skip_selenium': 1, 'uses_ssh': 1}, True),
+    ({'test_a': 1}, True),
+])
+def test_uses_appliance(keywords, used):
+    from fixtures import durations as durations_plugin
+    assert durations_plugin._uses_appliance(keywords) == used
@@ -0,0 +1,82 @@
+import pytest
+
+from fixtures import browser
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+def test_background_writer(tmpdir):
+    writer = browser.BackgroundWriter(maxsize=2)
+    for i in range(5):
+        writer.write(tmpdir.join('failures', '%d.png' % i), 'image %d' % i)
+    writer.flush()
+    assert [path.basename for path in sorted(tmpdir.join('failures').listdir())] == \
+        ['0.png', '1.png', '2.png', '3.png', '4.png']
+    assert tmpdir.join('failures', '4.png').read_binary() == 'image 4'
+
+
+def test_report_pages(tmpdir, monkeypatch):
+    tests = [{
+        'name': 'test_%d' % i,
+        'file': 'test_file.py',
+        'is_error': False,
+        'fail_stage': 'call',
+        'short_tb': 'AssertionError',
+        'full_tb': 'failed_browser_tests/%d.txt' % i,
+        'screenshot': 'failed_browser_tests/%d.png' % i,
+    } for i in range(5)]
+    monkeypatch.setattr(browser, 'log_path', tmpdir)
+    monkeypatch.setattr(browser, 'REPORT_PAGE_SIZE', 2)
+    monkeypatch.setattr(browser, 'failed_test_tracking',
+        {'tests': tests, 'total_failed': 7, 'total_errored': 0, 'untracked': 2})
+    browser._write_failed_tests_report()
+
+    assert sorted(path.basename for path in tmpdir.listdir()) == ['failed_browser_tests.html',
+        'failed_browser_tests_2.html', 'failed_browser_tests_3.html']
+    last_page = tmpdir.join('failed_browser_tests_3.html').read()
+    assert 'test_4' in last_page
+    assert 'test_0' not in last_page
+    # Screenshots are linked to, not inlined
+    assert 'href="failed_browser_tests/4.png"' in last_page
+    assert 'href="failed_browser_tests_2.html"' in last_page
+    assert '2 later failures' in last_page
+
+
+def test_failures_tracked_from_reports(monkeypatch):
+    # Failures are tracked from test reports, so the xdist master tracks the failures of all slaves
+    class Report(object):
+        failed_browser_test = {'name': 'test_name', 'is_error': True, 'full_tb': '1.txt'}
+
+    monkeypatch.setattr(browser, 'MAX_TRACKED_FAILURES', 1)
+    monkeypatch.setattr(browser, 'failed_test_tracking',
+        {'tests': [], 'total_failed': 0, 'total_errored': 0, 'untracked': 0})
+    browser.pytest_runtest_logreport(Report())
+    browser.pytest_runtest_logreport(Report())
+    assert browser.failed_test_tracking == {'tests': [Report.failed_browser_test],
+        'total_failed': 0, 'total_errored': 2, 'untracked': 1}
+
+
+def test_failure_without_exception_not_captured():
+    # A strict xpass fails the test with no exception to capture
+    class Report(object):
+        failed = True
+        when = 'call'
+
+    class Outcome(object):
+        def get_result(self):
+            return report
+
+    class Item(object):
+        fixturenames = list(browser.browser_fixtures)
+
+    class Call(object):
+        excinfo = None
+    report = Report()
+    hook = browser.pytest_runtest_makereport(Item(), Call())
+    next(hook)
+    with pytest.raises(StopIteration):
+        hook.send(Outcome())
+    assert not hasattr(report, 'failed_browser_test')
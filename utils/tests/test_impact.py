@@ -0,0 +1,138 @@
+import sys
+
+import pytest
+
+from utils import impact, randomness
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+def test_tracer():
+    tracer = impact.Tracer()
+    tracer.current = files = set()
+    tracer.start()
+    try:
+        randomness.generate_random_string()
+    finally:
+        tracer.stop()
+    assert 'utils/randomness.py' in files
+    # Files outside of the project aren't recorded
+    assert all(not f.startswith('/') for f in files)
+
+
+@pytest.fixture
+def project(request, tmpdir, monkeypatch):
+    # A project of its own: a page module reading a locator table, imported by two test modules
+    monkeypatch.setattr(impact, 'project_path', tmpdir)
+    monkeypatch.syspath_prepend(tmpdir.strpath)
+    tmpdir.ensure('impact_pkg', '__init__.py')
+    tmpdir.join('impact_pkg', 'locators.py').write("LOCATORS = {'login': '#login'}\n")
+    tmpdir.join('impact_pkg', 'pages.py').write(
+        "from impact_pkg.locators import LOCATORS\n\n\n"
+        "def locator(name):\n"
+        "    return LOCATORS[name]\n")
+    for test_module in ('impact_first', 'impact_second'):
+        tmpdir.join('%s.py' % test_module).write('from impact_pkg import pages\n')
+
+    def unload():
+        for name in list(sys.modules):
+            if name.startswith(('impact_pkg', 'impact_first', 'impact_second')):
+                del sys.modules[name]
+    request.addfinalizer(unload)
+    return tmpdir
+
+
+def test_tracer_imports(project):
+    tracer = impact.Tracer()
+    tracer.start()
+    try:
+        __import__('impact_first')
+        # Already loaded, the import is still recorded
+        __import__('impact_second')
+    finally:
+        tracer.stop()
+    assert tracer.imports['impact_first.py'] == set(['impact_pkg/__init__.py',
+        'impact_pkg/pages.py'])
+    assert tracer.imports['impact_second.py'] == tracer.imports['impact_first.py']
+    assert 'impact_pkg/locators.py' in tracer.imports['impact_pkg/pages.py']
+
+
+def test_affected_transitive_import(project):
+    tracer = impact.Tracer()
+    tracer.start()
+    try:
+        __import__('impact_first')
+        __import__('impact_second')
+    finally:
+        tracer.stop()
+    impact_map = impact.ImpactMap()
+    # The locator table was never executed, and only pages.py imports it
+    impact_map.add_test('impact_second.py', 'impact_second.py::test', setup_files=set(),
+        test_files=set(['impact_pkg/pages.py']))
+    graph = impact.import_graph(tracer.imports)
+    # Submodules in a package's namespace weren't imported by the package
+    assert not graph['impact_pkg/__init__.py']
+    impact_map.add_imports(graph)
+    assert impact_map.affected('impact_second.py::test', set(['impact_pkg/locators.py']))
+    assert not impact_map.affected('impact_second.py::test', set(['impact_first.py']))
+
+
+def test_unrecorded():
+    impact_map = impact.ImpactMap()
+    impact_map.add_test('cfme/tests/test_a.py', 'cfme/tests/test_a.py::test_1',
+        setup_files=set(), test_files=set(['cfme/web_ui/paginator.py']))
+    impact_map.add_imports({'cfme/web_ui/paginator.py': set(['cfme/web_ui/locators.py'])})
+    assert impact_map.unrecorded(set(['cfme/web_ui/locators.py', 'docs/index.rst'])) is None
+    assert impact_map.unrecorded(set(['cfme/web_ui/menu.py'])) == 'cfme/web_ui/menu.py'
+
+
+def test_module_imports():
+    imports = impact.module_imports(sys.modules[__name__])
+    assert set(['utils/impact.py', 'utils/randomness.py']) <= imports
+
+
+@pytest.mark.parametrize(('changed', 'reason'), [
+    (['cfme/web_ui/paginator.py', 'docs/index.rst'], None),
+    (['cfme/web_ui/paginator.py', 'fixtures/browser.py'], 'fixtures/browser.py'),
+    (['conftest.py'], 'conftest.py'),
+    (['data/templates/base.html'], 'data/templates/base.html'),
+])
+def test_full_run_reason(changed, reason):
+    assert impact.full_run_reason(changed) == reason
+
+
+def test_affected(tmpdir):
+    impact_map = impact.ImpactMap()
+    impact_map.add_test('cfme/tests/test_a.py', 'cfme/tests/test_a.py::test_1',
+        setup_files=set(['utils/browser.py']), test_files=set(['cfme/web_ui/paginator.py']))
+    impact_map.add_test('cfme/tests/test_a.py', 'cfme/tests/test_a.py::test_2',
+        setup_files=set(), test_files=set(['cfme/infrastructure/pxe.py']))
+    impact_map.save(tmpdir.join('impact_map.json'))
+    impact_map = impact.ImpactMap.load(tmpdir.join('impact_map.json'))
+
+    def affected(*changed):
+        return [nodeid for nodeid in ['cfme/tests/test_a.py::test_1',
+            'cfme/tests/test_a.py::test_2', 'cfme/tests/test_new.py::test_1']
+            if impact_map.affected(nodeid, set(changed))]
+    # Tests that weren't recorded always run
+    assert affected('cfme/web_ui/paginator.py') == ['cfme/tests/test_a.py::test_1',
+        'cfme/tests/test_new.py::test_1']
+    assert affected('cfme/infrastructure/pxe.py') == ['cfme/tests/test_a.py::test_2',
+        'cfme/tests/test_new.py::test_1']
+    # Setup is shared by the module's tests, as is the test module itself
+    assert len(affected('utils/browser.py')) == 3
+    assert len(affected('cfme/tests/test_a.py')) == 3
+
+
+def test_save_merges(tmpdir):
+    path = tmpdir.join('impact_map.json')
+    for nodeid in ('test_a.py::test_1', 'test_a.py::test_2'):
+        impact_map = impact.ImpactMap()
+        impact_map.add_test('test_a.py', nodeid, setup_files=set([nodeid]), test_files=set())
+        impact_map.save(path)
+    impact_map = impact.ImpactMap.load(path)
+    assert sorted(impact_map.tests) == ['test_a.py::test_1', 'test_a.py::test_2']
+    assert impact_map.setup['test_a.py'] == ['test_a.py::test_1', 'test_a.py::test_2']
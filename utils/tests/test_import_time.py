@@ -0,0 +1,53 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from utils.path import project_path
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+# Backends that should only be imported by the tests (and scripts) that use them. selenium isn't
+# one of them: cfme.fixtures.pytest_selenium dispatches on selenium's WebElement class, so every
+# test run needs it from the start.
+lazy_backends = ['boto', 'novaclient', 'ovirtsdk', 'paramiko', 'pysphere', 'sqlalchemy', 'suds']
+
+# Imports the plugins loaded by conftest in a fresh interpreter, and reports what was imported
+import_script = '''
+import json, sys
+import conftest
+for plugin in conftest.pytest_plugins:
+    __import__(plugin)
+print json.dumps(sorted(set(name.split('.')[0] for name in sys.modules)))
+'''
+
+# What importing the plugins would cost, at least, if they didn't defer the backends
+backends_script = 'import %s' % ', '.join(lazy_backends)
+
+
+def import_seconds(script):
+    # Best of a few runs, so one slow run doesn't decide
+    times = []
+    for i in range(3):
+        start = time.time()
+        subprocess.check_output([sys.executable, '-W', 'ignore', '-c', script],
+            cwd=str(project_path))
+        times.append(time.time() - start)
+    return min(times)
+
+
+def test_plugins_defer_backends():
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', import_script],
+        cwd=str(project_path))
+    modules = json.loads(output.splitlines()[-1])
+    assert not set(lazy_backends) & set(modules)
+
+
+def test_plugin_import_time():
+    # Measured against importing the backends, rather than in seconds, to hold on slow machines
+    assert import_seconds(import_script) < import_seconds(backends_script) / 2
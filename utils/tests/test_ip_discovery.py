@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from utils.ip_discovery import IPDiscovery
+from utils.wait import TimedOutError
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeSystem(object):
+    # VMs get their address after a given number of polls
+    polls_until_address = {'vm1': 1, 'vm2': 3}
+
+    def __init__(self):
+        self.polls = []
+
+    def get_ip_addresses(self, vm_names):
+        self.polls.append(sorted(vm_names))
+        ip_addresses = {}
+        for vm_name in vm_names:
+            if len(self.polls) >= self.polls_until_address.get(vm_name, float('inf')):
+                ip_addresses[vm_name] = '10.0.0.%s' % vm_name[-1]
+            else:
+                ip_addresses[vm_name] = None
+        return ip_addresses
+
+    def disconnect(self):
+        pass
+
+
+@pytest.fixture
+def fake_system():
+    return FakeSystem()
+
+
+def test_discovery_batches_watched_vms(fake_system):
+    # Hold the poller back until both VMs are watched
+    watching = threading.Event()
+
+    def mgmt_factory():
+        watching.wait(5)
+        return fake_system
+
+    discovery = IPDiscovery(mgmt_factory, poll_interval=0.01)
+    vm1, vm2 = discovery.watch('vm1'), discovery.watch('vm2')
+    watching.set()
+    assert vm1.result(timeout=5) == '10.0.0.1'
+    assert vm2.result(timeout=5) == '10.0.0.2'
+    # Both VMs were asked for in the same poll, one provider client was used for all of them
+    assert fake_system.polls[0] == ['vm1', 'vm2']
+    assert fake_system.polls[-1] == ['vm2']
+    assert len(fake_system.polls) == 3
+
+
+def test_discovery_watch_same_vm(fake_system):
+    discovery = IPDiscovery(lambda: fake_system, poll_interval=0.01)
+    assert discovery.watch('vm2') is discovery.watch('vm2')
+
+
+def test_discovery_timeout(fake_system):
+    discovery = IPDiscovery(lambda: fake_system, poll_interval=0.01)
+    future = discovery.watch('vm_with_no_address', timeout=0.1)
+    with pytest.raises(TimedOutError):
+        future.result()
+    assert future.done()
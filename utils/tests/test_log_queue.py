@@ -0,0 +1,103 @@
+import logging
+import threading
+
+import pytest
+
+from utils.log import QueueHandler, QueueListener, _RelpathFilter
+from utils.path import project_path
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super(CollectingHandler, self).__init__(level)
+        self.records = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.add(threading.current_thread().name)
+
+
+@pytest.yield_fixture
+def queue_logger():
+    handler = CollectingHandler()
+    errors_handler = CollectingHandler(logging.ERROR)
+    listener = QueueListener(handler, errors_handler)
+    listener.start()
+    logger = logging.getLogger('test_log_queue')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    queue_handler = QueueHandler(listener)
+    logger.addHandler(queue_handler)
+    yield logger, listener, handler, errors_handler
+    logger.removeHandler(queue_handler)
+    listener.stop()
+
+
+def test_records_handled_in_background(queue_logger):
+    logger, listener, handler, errors_handler = queue_logger
+    message_args = ['original']
+    logger.info('message %s', message_args)
+    # The message was formatted when it was logged, not when it was handled
+    message_args[0] = 'changed'
+    logger.error('error')
+    listener.stop()
+
+    assert [record.getMessage() for record in handler.records] == [
+        "message ['original']", 'error']
+    # Handler levels are respected
+    assert [record.getMessage() for record in errors_handler.records] == ['error']
+    assert handler.threads == {'QueueListener'}
+
+
+def test_exceptions_formatted(queue_logger):
+    logger, listener, handler, errors_handler = queue_logger
+    try:
+        raise ValueError('logged exception')
+    except ValueError:
+        logger.exception('caught')
+    listener.stop()
+    record, = handler.records
+    assert record.exc_info is None
+    assert 'ValueError: logged exception' in logging.Formatter().format(record)
+
+
+def test_handled_directly_when_stopped(queue_logger):
+    logger, listener, handler, errors_handler = queue_logger
+    listener.stop()
+    logger.info('after stop')
+    assert [record.getMessage() for record in handler.records] == ['after stop']
+    assert handler.threads == {threading.current_thread().name}
+
+
+def test_listener_errors_reported(queue_logger, capsys):
+    logger, listener, handler, errors_handler = queue_logger
+
+    def broken_handle(record):
+        raise ValueError('broken handler')
+    errors_handler.handle = broken_handle
+    logger.error('first')
+    logger.error('second')
+    listener.stop()
+    # The listener kept handling records, and reported the errors
+    assert [record.getMessage() for record in handler.records] == ['first', 'second']
+    err = capsys.readouterr()[1]
+    assert err.count('ValueError: broken handler') == 2
+
+
+def test_relpath_filter_caches(monkeypatch):
+    relpath_filter = _RelpathFilter()
+    filename = str(project_path.join('utils', 'log.py'))
+    record = logging.LogRecord('test', logging.INFO, filename, 10, 'message', None, None)
+    relpath_filter.filter(record)
+    assert record.source == 'utils/log.py:10'
+
+    monkeypatch.setattr('utils.log.get_rel_path', lambda path: pytest.fail('not cached'))
+    record.lineno = 20
+    relpath_filter.filter(record)
+    assert record.source == 'utils/log.py:20'
@@ -0,0 +1,87 @@
+import pytest
+
+from utils.mgmt_replay import RecordingSystem, ReplayMiss, ReplayedError, ReplaySystem
+from utils.mgmt_system import VMInstanceNotFound
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeSystem(object):
+    # Simulates a live management system, so there's something to record
+    vms = ['vm1', 'vm2']
+
+    def list_vm(self):
+        return list(self.vms)
+
+    def list_template(self):
+        return ['template1']
+
+    def is_vm_running(self, vm_name):
+        return vm_name == 'vm1'
+
+    def vm_status(self, vm_name):
+        raise VMInstanceNotFound(vm_name)
+
+    def info(self):
+        raise ValueError('not a mgmt_system exception')
+
+    def stats(self, *requested_stats):
+        return {'num_vm': len(self.vms)}
+
+
+@pytest.fixture
+def recording(tmpdir, monkeypatch):
+    recorder = RecordingSystem(FakeSystem())
+    recorder.list_vm()
+    monkeypatch.setattr(FakeSystem, 'vms', ['vm1', 'vm2', 'vm3'])
+    recorder.list_vm()
+    monkeypatch.undo()
+    recorder.list_template()
+    recorder.is_vm_running('vm1')
+    recorder.stats('num_vm')
+    for method, arg in ((recorder.vm_status, ['vm1']), (recorder.info, [])):
+        with pytest.raises(Exception):
+            method(*arg)
+
+    filename = tmpdir.join('recording.yaml')
+    recorder.save(filename)
+    return filename
+
+
+def test_replay_in_order(recording):
+    replay = ReplaySystem(str(recording), latency_scale=0)
+    assert replay.recorded_system == 'FakeSystem'
+    # Calls with the same args replay in order, then the last result repeats
+    assert replay.list_vm() == ['vm1', 'vm2']
+    assert replay.list_vm() == ['vm1', 'vm2', 'vm3']
+    assert replay.list_vm() == ['vm1', 'vm2', 'vm3']
+
+
+def test_replay_unrecorded_args(recording):
+    replay = ReplaySystem(str(recording), latency_scale=0)
+    assert replay.is_vm_running('vm1')
+    # Results recorded for other args aren't replayed
+    with pytest.raises(ReplayMiss):
+        replay.is_vm_running('vm2')
+    with pytest.raises(ReplayMiss):
+        replay.start_vm('vm1')
+
+
+def test_replay_errors(recording):
+    replay = ReplaySystem(str(recording), latency_scale=0)
+    with pytest.raises(VMInstanceNotFound):
+        replay.vm_status('vm1')
+    with pytest.raises(ReplayedError):
+        replay.info()
+
+
+def test_replay_inventory_scale(recording):
+    replay = ReplaySystem(str(recording), latency_scale=0, inventory_scale=3)
+    templates = replay.list_template()
+    assert templates == ['template1', 'template1-1', 'template1-2']
+    assert replay.stats('num_vm') == {'num_vm': 6}
+    # Stats that weren't recorded are calculated from the scaled inventory lists
+    assert replay.stats('num_template') == {'num_template': 3}
@@ -0,0 +1,290 @@
+import threading
+from collections import defaultdict
+
+import pytest
+
+from utils import db, miq_soap
+from utils.soap import MiqClient
+from utils.wait import TimedOutError
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class Obj(object):
+    # Stands in for the objects suds builds from SOAP responses
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeService(object):
+    # Answers vmdbws calls from a dict of VMs keyed by guid, counting the calls made
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.vms = {}
+        self.datastores = {}
+        self.tagged = []
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+        self.expected_in_flight = None
+        self.all_in_flight = threading.Event()
+
+    def FindVmByGuid(self, guid):
+        self.calls['FindVmByGuid'] += 1
+        return self.vms[guid]
+
+    def FindDatastoreById(self, id):
+        self.calls['FindDatastoreById'] += 1
+        return self.datastores[id]
+
+    def VmGetTags(self, guid):
+        self.calls['VmGetTags'] += 1
+        return []
+
+    def FindEmsByGuid(self, guid):
+        self.calls['FindEmsByGuid'] += 1
+        return Obj(datastores=[Obj(id='1'), Obj(id='2'), Obj(id='3')])
+
+    def _set_tag(self, tag_prefix, id, category, tag_name):
+        with self.lock:
+            self.tagged.append((tag_prefix, id))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.in_flight == self.expected_in_flight:
+                self.all_in_flight.set()
+        # Hold on to the call until the others are made, or they're clearly not concurrent
+        self.all_in_flight.wait(2)
+        with self.lock:
+            self.in_flight -= 1
+
+    def __getattr__(self, name):
+        # EmsSetTag, HostSetTag, ...
+        if name.endswith('SetTag'):
+            return lambda *args: self._set_tag(name[:-len('SetTag')], *args)
+        raise AttributeError(name)
+
+
+class FakeTime(object):
+    # Clock that only moves when slept on
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(miq_soap, 'client',
+        Obj(service=service, pipeoptions=MiqClient.pipeoptions))
+    return service
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(miq_soap, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def vm(service, clock):
+    service.vms['vm-guid'] = Obj(name='vm1', description='VM 1', power_state='on ', datastores=[])
+    return miq_soap.MiqVM('vm-guid')
+
+
+def test_snapshot_hit(service, vm):
+    assert vm.object.name == 'vm1'
+    # Other attributes read the same snapshot
+    assert vm.description == 'VM 1'
+    assert vm.datastores == []
+    assert service.calls['FindVmByGuid'] == 1
+
+
+def test_snapshot_expiry(service, clock, vm):
+    vm.object
+    clock.sleep(miq_soap.MiqVM.CACHE_TTL - 1)
+    vm.object
+    assert service.calls['FindVmByGuid'] == 1
+    clock.sleep(1)
+    vm.object
+    assert service.calls['FindVmByGuid'] == 2
+
+
+def test_snapshot_invalidation(service, vm):
+    vm.object
+    vm.tags
+    vm.invalidate('tags')
+    vm.object
+    vm.tags
+    assert dict(service.calls) == {'FindVmByGuid': 1, 'VmGetTags': 2}
+    vm.invalidate()
+    vm.object
+    assert service.calls['FindVmByGuid'] == 2
+
+
+def test_wait_for_fetches_polled_snapshots(service, vm):
+    states = iter(['off', 'off', 'on'])
+
+    def power_state_changes(guid):
+        return Obj(power_state=next(states))
+    service.FindVmByGuid = power_state_changes
+    vm.wait_for(lambda: vm.is_powered_on, 'power_state', num_sec=10, delay=0)
+    assert vm.is_powered_on
+
+
+def test_relations_prefetch(service, vm):
+    service.datastores = {str(i): Obj(name='datastore%d' % i) for i in range(3)}
+    service.vms['vm-guid'].datastores = [Obj(id=id) for id in sorted(service.datastores)]
+    datastores = vm.datastores
+    # Related objects aren't fetched until they're read
+    assert 'FindDatastoreById' not in service.calls
+    assert miq_soap.prefetch(datastores) == datastores
+    assert service.calls['FindDatastoreById'] == 3
+    assert [datastore.name for datastore in datastores] == ['datastore0', 'datastore1',
+        'datastore2']
+    assert service.calls['FindDatastoreById'] == 3
+
+
+# Just the VMDB tables and columns used to prepare providers and find templates
+vmdb_schema = """
+create table ext_management_systems (id integer primary key, guid text);
+create table hosts (id integer primary key, guid text, name text, ems_id integer);
+create table storages (id integer primary key, name text);
+create table tags (id integer primary key, name text);
+create table taggings (id integer primary key, taggable_type text, taggable_id integer,
+    tag_id integer);
+create table vms (id integer primary key, guid text, name text, template boolean);
+insert into ext_management_systems values (1, 'ems-guid'), (2, 'other-ems-guid');
+insert into hosts values (1, 'host-1', 'tagged host', 1), (2, 'host-2', 'host', 1),
+    (3, 'host-3', 'other host', 2);
+insert into storages values (1, 'tagged datastore'), (2, 'unattached datastore'),
+    (3, 'banned datastore');
+insert into tags values (1, '/managed/prov_scope/all'), (2, '/managed/other/tag');
+insert into taggings values (1, 'Host', 1, 1), (2, 'Storage', 1, 1), (3, 'Host', 2, 2),
+    (4, 'ExtManagementSystem', 2, 1);
+insert into vms values (1, 'vm-guid', 'template', 0), (2, 'template-guid', 'template', 1),
+    (3, 'padded-guid', ' padded template ', 1);
+"""
+
+
+@pytest.fixture
+def vmdb(monkeypatch):
+    vmdb = db.Db(hostname='vmdb')
+    vmdb.db_url = 'sqlite://'
+    for statement in vmdb_schema.split(';'):
+        vmdb.engine.execute(statement)
+    # Table classes are cached by name, keep them away from the ones of the appliance's db
+    monkeypatch.setattr(db.Db, '_table_cache', {})
+    monkeypatch.setattr(miq_soap, 'cfmedb', vmdb)
+    return vmdb
+
+
+def test_prepare_provider_for_provisioning(monkeypatch, service, vmdb):
+    monkeypatch.setattr(miq_soap, 'cfme_data', {'datastores_not_for_provision': ['banned']})
+    service.expected_in_flight = 3
+    miq_soap.prepare_provider_for_provisioning(miq_soap.MiqEms('ems-guid'))
+    # Only what isn't tagged yet is tagged, including datastores not attached to any host
+    assert sorted(service.tagged) == [('Datastore', '2'), ('Ems', 'ems-guid'), ('Host', 'host-2')]
+    assert service.max_in_flight == 3
+    # Tag state comes from the VMDB, not from the tags of each object
+    assert 'VmGetTags' not in service.calls
+
+
+@pytest.mark.parametrize(('template_name', 'guid'), [
+    ('template', 'template-guid'),
+    (' template\n', 'template-guid'),
+    # Stray whitespace in the VMDB
+    ('padded template', 'padded-guid'),
+])
+def test_find_template_guid(vmdb, template_name, guid):
+    assert miq_soap.MiqVM.find_template_guid(template_name) == guid
+
+
+def test_find_template_guid_missing(vmdb):
+    with pytest.raises(Exception) as exc:
+        miq_soap.MiqVM.find_template_guid('missing')
+    assert str(exc.value) == 'Template missing not found!'
+
+
+class FakeProvisioning(FakeService):
+    # Provisioning requests, each going through the states scripted for its VM
+    def __init__(self, scripts):
+        super(FakeProvisioning, self).__init__()
+        self.scripts = scripts
+        self.requests = {}
+        self.polls = []
+
+    def VmProvisionRequest(self, version, template_fields, vm_fields, requester, tags, options):
+        vm_name = dict(field.split('=') for field in vm_fields.split('|'))['vm_name']
+        req_id = len(self.requests) + 1
+        self.requests[req_id] = iter(self.scripts[vm_name])
+        return Obj(id=req_id)
+
+    def GetVmProvisionRequest(self, req_id):
+        self.polls.append(req_id)
+        state = next(self.requests[req_id])
+        if state == 'pending':
+            return Obj(status='Ok', approval_state='pending_approval', vms=[])
+        elif state == 'approved':
+            return Obj(status='Ok', approval_state='approved', vms=[])
+        elif state == 'error':
+            return Obj(status='Error', approval_state='approved', message='No space left')
+        else:
+            # Done, the state is the name of the provisioned VM
+            self.vms[state + '-guid'] = Obj(name=state)
+            return Obj(status='Ok', approval_state='approved', vms=[Obj(guid=state + '-guid')])
+
+
+def forever(state):
+    while True:
+        yield state
+
+
+def provision(monkeypatch, scripts, **kwargs):
+    service = FakeProvisioning(scripts)
+    monkeypatch.setattr(miq_soap, 'client',
+        Obj(service=service, pipeoptions=MiqClient.pipeoptions))
+    monkeypatch.setattr(miq_soap.BulkProvisioner, '_prepare_template',
+        lambda self, template_name: template_name + '-guid')
+    provisioner = miq_soap.BulkProvisioner(**kwargs)
+    for vm_name in sorted(scripts):
+        provisioner.add('template', vm_name)
+    return provisioner, service, [vm.name for vm in provisioner.provision()]
+
+
+def test_bulk_provisioning_failure_isolated(monkeypatch, clock):
+    provisioner, service, provisioned = provision(monkeypatch, {
+        'vm1': ['pending', 'approved', 'approved', 'approved', 'vm1'],
+        'vm2': ['approved', 'error'],
+        'vm3': ['approved', 'vm3'],
+    }, concurrency=2)
+    # vm3 is submitted once vm2 fails, and finishes before vm1
+    assert provisioned == ['vm3', 'vm1']
+    assert provisioner.failures.keys() == ['vm2']
+    assert str(provisioner.failures['vm2']) == 'No space left'
+    # The outstanding requests are polled together, once per poll
+    sweeps = [sorted(service.polls[i:i + 2]) for i in range(0, 6, 2)]
+    assert sweeps == [[1, 2], [1, 2], [1, 3]]
+
+
+def test_bulk_provisioning_timeouts(monkeypatch, clock):
+    provisioner, service, provisioned = provision(monkeypatch, {
+        'never_approved': forever('pending'),
+        'never_done': forever('approved'),
+        'vm': ['approved', 'vm'],
+    }, poll_delay=5, approval_timeout=60, timeout=100)
+    assert provisioned == ['vm']
+    assert sorted(provisioner.failures) == ['never_approved', 'never_done']
+    for failure in provisioner.failures.values():
+        assert isinstance(failure, TimedOutError)
+    assert str(provisioner.failures['never_approved']) == \
+        'VM provision approval for never_approved timed out'
+    # Timed out once the approved request ran for longer than the timeout
+    assert 100 < clock.now - 1000 <= 110
@@ -0,0 +1,128 @@
+import json
+import logging
+import threading
+from collections import defaultdict
+
+import pytest
+
+from utils.log import Histogram, perflog
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+@pytest.fixture
+def clean_perflog(monkeypatch, tmpdir):
+    # Keep test events out of the session's histograms and summary
+    monkeypatch.setattr(perflog, '_histograms', defaultdict(Histogram))
+    monkeypatch.setattr(perflog, 'summary_file', tmpdir.join('perf_summary.jsonl'))
+    return perflog
+
+
+def test_span_nesting(clean_perflog):
+    with clean_perflog.span('outer') as outer:
+        assert clean_perflog.current_span is outer
+        with clean_perflog.span('inner') as inner:
+            assert inner.parent_id == outer.span_id
+        assert clean_perflog.current_span is outer
+    assert clean_perflog.current_span is None
+    assert outer.parent_id is None
+    assert outer.duration >= inner.duration
+
+
+def test_span_threads(clean_perflog):
+    # The same event name on different threads doesn't collide
+    started = [threading.Event(), threading.Event()]
+    results = {}
+
+    def track(thread_num):
+        clean_perflog.start('event')
+        # Make sure both threads are tracking the event at the same time
+        started[thread_num].set()
+        started[1 - thread_num].wait(5)
+        results[thread_num] = (clean_perflog.current_span.parent_id, clean_perflog.stop('event'))
+
+    threads = [threading.Thread(target=track, args=(i,)) for i in range(2)]
+    with clean_perflog.span('main thread'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for parent_id, seconds_taken in results.values():
+        # Spans on other threads aren't children of this thread's span
+        assert parent_id is None
+        assert seconds_taken is not None
+    assert clean_perflog.histograms()['event']['count'] == 2
+
+
+def test_stop_untracked(clean_perflog):
+    assert clean_perflog.stop('never started') is None
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(1, 101):
+        histogram.add(i / 100.0)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['max'] == 1.0
+    assert abs(summary['total'] - 50.5) < 1e-9
+    # Accurate to within a bucket
+    assert 0.5 <= summary['p50'] <= 0.5 * Histogram.BUCKET_RATIO
+    assert 0.95 <= summary['p95'] <= 0.95 * Histogram.BUCKET_RATIO
+
+
+def test_write_summary(clean_perflog):
+    clean_perflog.record('recorded', 2.0, detail='value')
+    clean_perflog.record('recorded', 4.0)
+    clean_perflog.write_summary(label='test')
+    clean_perflog.write_summary(label='test')
+
+    lines = [json.loads(line) for line in clean_perflog.summary_file.readlines()]
+    # Summaries are appended, one line per event name per run
+    assert len(lines) == 2
+    assert lines[0]['name'] == 'recorded'
+    assert lines[0]['label'] == 'test'
+    assert lines[0]['count'] == 2
+    assert lines[0]['max'] == 4.0
+
+
+def test_export_merge(clean_perflog):
+    # Slave histograms are exported, then merged on the xdist master
+    clean_perflog.record('recorded', 1.0)
+    exported = clean_perflog.export()
+    clean_perflog.record('recorded', 3.0)
+    clean_perflog.merge(exported)
+    histogram = clean_perflog.histograms()['recorded']
+    assert histogram['count'] == 3
+    assert histogram['total'] == 5.0
+    assert histogram['max'] == 3.0
+
+
+def test_event_lines_debug_only(clean_perflog, monkeypatch):
+    lines = []
+
+    class Logger(object):
+        level = logging.INFO
+
+        def isEnabledFor(self, level):
+            return level >= self.level
+
+        def debug(self, msg, *args):
+            lines.append(msg % args)
+        info = debug
+
+    logger = Logger()
+    monkeypatch.setattr(clean_perflog, 'logger', logger)
+    # Events only go to the histograms, unless the perf logger is at the debug level
+    clean_perflog.record('recorded', 1.0, detail='value')
+    assert lines == []
+    logger.level = logging.DEBUG
+    clean_perflog.record('recorded', 1.0, detail='value')
+    assert len(lines) == 1
+    assert lines[0].startswith('"recorded" event took 1.000000 seconds')
+    assert lines[0].endswith("detail='value'")
+    assert clean_perflog.histograms()['recorded']['count'] == 2
@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+import pytest
+
+from markers import requires
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class Report(namedtuple('Report', 'nodeid when outcome')):
+    passed = property(lambda self: self.outcome == 'passed')
+    failed = property(lambda self: self.outcome == 'failed')
+    skipped = property(lambda self: self.outcome == 'skipped')
+
+
+class Item(object):
+    def __init__(self, *required):
+        self.mark = pytest.mark.requires_test(*required)
+
+    def get_marker(self, name):
+        return self.mark
+
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    monkeypatch.setattr(requires, '_outcomes', {})
+    for nodeid, outcome in [
+            ('cfme/tests/test_a.py::test_passed', 'passed'),
+            ('cfme/tests/test_a.py::TestClass::()::test_failed', 'failed'),
+            ('cfme/tests/test_b.py::test_skipped', 'skipped')]:
+        requires.pytest_runtest_logreport(Report(nodeid, 'call', outcome))
+        requires.pytest_runtest_logreport(Report(nodeid, 'teardown', 'passed'))
+
+
+@pytest.mark.parametrize('test_id', ['test_passed', 'test_a.py::test_passed',
+    'tests/test_a.py::test_passed', 'cfme/tests/test_a.py::test_passed'])
+def test_passed_required(outcomes, test_id):
+    requires.pytest_runtest_setup(Item(test_id))
+
+
+@pytest.mark.parametrize(('required', 'message'), [
+    (['test_failed'], 'required test test_failed failed'),
+    (['test_passed', 'test_skipped'], 'required test test_skipped was skipped'),
+    (['test_missing', 'test_failed'], 'required test test_missing not yet run or does not '
+        'exist, required test test_failed failed'),
+])
+def test_not_passed_required(outcomes, required, message):
+    with pytest.raises(pytest.skip.Exception) as skip:
+        requires.pytest_runtest_setup(Item(*required))
+    assert str(skip.value) == message
@@ -0,0 +1,115 @@
+import subprocess
+import sys
+import threading
+import time
+
+import py
+import pytest
+
+from utils import shared_state
+from utils.path import project_path
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+# Calls run_once in another process of the same test run
+run_once_script = '''
+import sys
+from utils import shared_state
+shared_state.set_run(sys.argv[1])
+print shared_state.run_once('setup', lambda: 'called in the subprocess')
+'''
+
+# Takes a lock outside of a test run, and reports the directory it was in
+no_run_script = '''
+from utils import shared_state
+with shared_state.lock('setup'):
+    print shared_state.run_path()
+'''
+
+
+@pytest.fixture
+def run_id(request, monkeypatch):
+    # A run of its own, so the session's locks aren't touched
+    monkeypatch.setattr(shared_state, '_run_path', None)
+    run_id = 'test-%f' % time.time()
+    shared_state.set_run(run_id)
+    request.addfinalizer(lambda: shared_state.run_path().remove(ignore_errors=True))
+    return run_id
+
+
+def test_run_once_threads(run_id):
+    calls = []
+
+    def setup():
+        calls.append(None)
+        # Make sure the other thread is waiting
+        time.sleep(0.2)
+        return 'result'
+
+    results = []
+
+    def run():
+        results.append(shared_state.run_once('setup', setup))
+    threads = [threading.Thread(target=run) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['result', 'result']
+
+
+def test_run_once_processes(run_id):
+    shared_state.run_once('setup', lambda: 'called in the test')
+    output = subprocess.check_output([sys.executable, '-c', run_once_script, run_id],
+        cwd=str(project_path))
+    # The other process got this process's result
+    assert output.strip() == 'called in the test'
+
+
+def test_run_once_retries_failures(run_id):
+    def fail():
+        raise ValueError('setup failed')
+    with pytest.raises(ValueError):
+        shared_state.run_once('setup', fail)
+    assert shared_state.run_once('setup', lambda: 'retried') == 'retried'
+
+
+def test_no_run_path_removed():
+    output = subprocess.check_output([sys.executable, '-c', no_run_script],
+        cwd=str(project_path))
+    path = py.path.local(output.splitlines()[-1])
+    assert path.basename.startswith('pid-')
+    assert not path.check()
+
+
+def test_hold(run_id):
+    calls = []
+    holding, release = threading.Event(), threading.Event()
+
+    def hold_a():
+        with shared_state.hold('roles', 'a', calls.append, 'a'):
+            holding.set()
+            release.wait(5)
+
+    def hold_b():
+        with shared_state.hold('roles', 'b', calls.append, 'b'):
+            pass
+    thread_a = threading.Thread(target=hold_a)
+    thread_a.start()
+    holding.wait(5)
+    # The same state is shared while it's held, and not set up again
+    with shared_state.hold('roles', 'a', calls.append, 'a'):
+        assert calls == ['a']
+    # Another state waits until nobody holds the current one
+    thread_b = threading.Thread(target=hold_b)
+    thread_b.start()
+    time.sleep(0.2)
+    assert calls == ['a']
+    release.set()
+    thread_a.join(5)
+    thread_b.join(5)
+    assert calls == ['a', 'b']
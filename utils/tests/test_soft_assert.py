@@ -1,5 +1,8 @@
+from collections import OrderedDict
+
 import pytest
 
+from fixtures import soft_assert as soft_assert_plugin
 from fixtures.soft_assert import SoftAssertionError, _soft_assert_cm
 
 
@@ -44,3 +47,15 @@ def test_soft_assert(soft_assert):
     with _soft_assert_cm():
         # if assertions aren't cleared, this will erroneously raise AssertionError
         pass
+
+
+def test_soft_asserts_recorded(monkeypatch):
+    # Reports with soft asserts, e.g. from xdist slaves, are recorded for the run summary
+    class Report(object):
+        nodeid = 'test_file.py::test_name'
+        failed = True
+        soft_asserts = ['failure message (test_file.py:3)']
+
+    monkeypatch.setattr(soft_assert_plugin, 'failed_soft_asserts', OrderedDict())
+    soft_assert_plugin.pytest_runtest_logreport(Report())
+    assert soft_assert_plugin.failed_soft_asserts == {Report.nodeid: Report.soft_asserts}
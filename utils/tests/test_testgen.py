@@ -0,0 +1,51 @@
+import pytest
+
+from utils import conf, testgen
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+management_systems = {
+    'vsphere': {'type': 'virtualcenter', 'name': 'vsphere'},
+    'rhevm': {'type': 'rhevm', 'name': 'rhevm'},
+    'ec2': {'type': 'ec2', 'name': 'ec2'},
+}
+
+
+class FakeMetafunc(object):
+    def __init__(self, fixturenames):
+        self.fixturenames = fixturenames
+
+
+@pytest.fixture
+def fake_cfme_data(monkeypatch):
+    monkeypatch.setitem(conf, 'cfme_data', {'management_systems': management_systems})
+
+
+def test_provider_catalog_memoized(fake_cfme_data, monkeypatch):
+    catalog = testgen.provider_catalog()
+    assert testgen.provider_catalog() is catalog
+    assert sorted(entry.key for entry in catalog.by_type(['rhevm', 'ec2'])) == ['ec2', 'rhevm']
+
+    # Changed provider data gets a new catalog
+    changed = dict(management_systems, openstack={'type': 'openstack', 'name': 'openstack'})
+    monkeypatch.setitem(conf, 'cfme_data', {'management_systems': changed})
+    assert testgen.provider_catalog() is not catalog
+    assert len(testgen.provider_catalog()) == 4
+
+
+def test_provider_by_type_defers_objects(fake_cfme_data, monkeypatch):
+    def fail_build(provider_key):
+        raise AssertionError('%s was built during collection' % provider_key)
+    monkeypatch.setattr(testgen, 'get_cloud_provider', fail_build)
+    monkeypatch.setattr(testgen, 'get_infra_provider', fail_build)
+    monkeypatch.setattr(testgen, 'provider_factory', fail_build)
+
+    # provider_crud depends on provider_key, so pytest adds it to the test's fixturenames
+    metafunc = FakeMetafunc(['provider_crud', 'provider_key'])
+    argnames, argvalues, idlist = testgen.infra_providers(metafunc, 'name')
+    assert argnames == ['name', 'provider_key']
+    assert sorted(idlist) == ['rhevm', 'vsphere']
+    assert sorted(argvalues) == [['rhevm', 'rhevm'], ['vsphere', 'vsphere']]
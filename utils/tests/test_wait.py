@@ -2,7 +2,8 @@
 # pylint: disable=W0621
 import pytest
 from unittestzero import Assert
-from utils.wait import wait_for, TimedOutError
+from utils import wait
+from utils.wait import wait_for, wait_for_all, wait_for_any, TimedOutError
 import time
 
 pytestmark = [
@@ -11,6 +12,20 @@ pytestmark = [
 ]
 
 
+class FakeTime(object):
+    # Clock that only moves when slept on
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
 class Incrementor():
     value = 0
 
@@ -46,3 +61,61 @@ def test_lambda_long_wait():
                   [incman],
                   num_sec=1,
                   message="waiting for sleepy head")
+
+
+def test_expo_max_delay(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(wait, 'time', clock)
+    Assert.raises(TimedOutError, wait_for, lambda: False, num_sec=.2,
+        delay=.01, expo=True, max_delay=.04)
+    Assert.equal(clock.sleeps[:5], [.01, .02, .04, .04, .04])
+    # The last delay is cut short, to check right at the timeout
+    Assert.less(clock.sleeps[-1], .04)
+    Assert.less(abs(clock.now - .2), 1e-9)
+
+
+def test_final_check_at_deadline():
+    incman = Incrementor()
+    # The delay would overshoot the timeout, so the last check happens at the deadline instead
+    ec, tc = wait_for(lambda: incman.i_sleep_a_lot() >= 2, num_sec=.5, delay=10)
+    Assert.less(tc, 1, "Should take less than 1 second")
+
+
+def test_nested_wait_deadline():
+    def inner_wait():
+        wait_for(lambda: False, num_sec=60, delay=.05, message="inner wait")
+
+    start = time.time()
+    Assert.raises(TimedOutError, wait_for, inner_wait, num_sec=.5, delay=.05,
+        message="outer wait")
+    Assert.less(time.time() - start, 2, "Inner wait should be limited by the outer deadline")
+
+
+def test_wait_for_all_shared_refresh():
+    incman = Incrementor()
+    conditions = {
+        'soon': lambda: incman.value >= 2,
+        'later': lambda: incman.value >= 4,
+    }
+    results, tc = wait_for_all(conditions, refresh=incman.i_sleep_a_lot, delay=.01)
+    Assert.equal(results, {'soon': True, 'later': True})
+    # The refresh ran once per tick, not once per condition
+    Assert.equal(incman.value, 4)
+
+
+def test_wait_for_all_list():
+    incman = Incrementor()
+    results, tc = wait_for_all([lambda: incman.i_sleep_a_lot() >= 2, lambda: 'done'], delay=.01)
+    Assert.equal(results, [True, 'done'])
+
+
+def test_wait_for_any():
+    incman = Incrementor()
+    met, tc = wait_for_any({'never': lambda: False, 'soon': lambda: incman.i_sleep_a_lot() >= 2},
+        delay=.01)
+    Assert.equal(met, {'soon': True})
+
+
+def test_wait_for_any_timeout():
+    Assert.raises(TimedOutError, wait_for_any, [lambda: False, lambda: 0], num_sec=.2,
+        delay=.05)
@@ -0,0 +1,94 @@
+import pytest
+
+from utils import webdriver_stats
+from utils.datafile import template_env
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+class FakeConnection(object):
+    def execute(self, command, params):
+        return command
+
+
+def _function_in_module(module_name, source, **namespace):
+    # Define a function as if it were written in the named module
+    namespace['__name__'] = module_name
+    exec source in namespace
+    return namespace
+
+
+@pytest.yield_fixture
+def stats():
+    stats = webdriver_stats.instrument(connection_class=FakeConnection)
+    yield stats
+    webdriver_stats.uninstrument()
+
+
+def test_commands_attributed(stats):
+    connection = FakeConnection()
+    helpers = _function_in_module('cfme.fixtures.pytest_selenium', '''
+def element(loc):
+    return connection.execute('findElement', {})
+
+def click(loc):
+    element(loc)
+    return connection.execute('clickElement', {})
+''', connection=connection)
+    page = _function_in_module('cfme.web_ui.page', '''
+def fill():
+    helpers['click']('loc')
+    connection.execute('getTitle', {})
+''', connection=connection, helpers=helpers)
+
+    stats.current_test = 'test_one'
+    page['fill']()
+    stats.current_test = 'test_two'
+    helpers['element']('loc')
+    connection.execute('quit', {})
+
+    commands = dict(((function, command), count)
+        for function, command, count, seconds in stats.report()[0]['commands']
+        + stats.report()[1]['commands'])
+    # Commands are attributed to the outermost helper, or the cfme function that sent them
+    assert commands == {
+        ('cfme.fixtures.pytest_selenium.click', 'findElement'): 1,
+        ('cfme.fixtures.pytest_selenium.click', 'clickElement'): 1,
+        ('cfme.web_ui.page.fill', 'getTitle'): 1,
+        ('cfme.fixtures.pytest_selenium.element', 'findElement'): 1,
+        ('(not cfme)', 'quit'): 1,
+    }
+    assert [test['count'] for test in sorted(stats.report(), key=lambda t: t['name'])] == [3, 2]
+    assert dict((f, count) for f, count, seconds in stats.totals('test_one')) == {
+        'cfme.fixtures.pytest_selenium.click': 2,
+        'cfme.web_ui.page.fill': 1,
+    }
+
+
+def test_uninstrument(stats):
+    webdriver_stats.uninstrument()
+    FakeConnection().execute('quit', {})
+    assert not stats.tests
+    assert 'execute' in FakeConnection.__dict__
+
+
+def test_report_renders(stats):
+    FakeConnection().execute('quit', {})
+    tests = stats.report()
+    html = template_env.get_template('browser_stats.html').render(tests=tests,
+        functions=stats.totals(), total_count=1, total_seconds=tests[0]['seconds'])
+    assert 'quit' in html
+
+
+def test_export_merge():
+    # Slave stats are exported, then merged on the xdist master
+    slave_stats = webdriver_stats.CommandStats()
+    slave_stats.current_test = 'test_one'
+    slave_stats.record('cfme.web_ui.page.fill', 'getTitle', 1.0)
+    master_stats = webdriver_stats.CommandStats()
+    master_stats.merge(slave_stats.export())
+    master_stats.merge(slave_stats.export())
+    assert master_stats.totals() == [('cfme.web_ui.page.fill', 2, 2.0)]
@@ -1,7 +1,16 @@
+import os
+import random
+import sys
+import threading
 import time
-from utils.log import logger
 from functools import partial
 
+from utils.log import logger, perflog
+from utils.path import get_rel_path
+
+# Deadlines of the wait_for calls running in each thread, innermost last
+_deadlines = threading.local()
+
 
 def wait_for(func, func_args=[], func_kwargs={}, **kwargs):
     """Waits for a certain amount of time for an action to complete
@@ -11,9 +20,14 @@ def wait_for(func, func_args=[], func_kwargs={}, **kwargs):
     Returns the output from the function once it completes successfully,
     along with the time taken to complete the command.
 
-    Note: If using the expo keyword, the returned elapsed time will be inaccurate
-        as wait_for does not know the exact time that the function returned
-        correctly, only that it returned correctly at last check.
+    func is checked right away, and then after every delay. The last delay is shortened so
+    that func gets a final check right at the timeout, instead of sleeping past it.
+
+    Nested waits share their deadline: a wait_for called (directly or not) from within the func
+    of another wait_for will time out no later than the outer one would.
+
+    Every call is recorded to the perflog, along with the number of checks made and the file
+    and line it was called from.
 
     Args:
         func: A function to be run
@@ -21,6 +35,9 @@ def wait_for(func, func_args=[], func_kwargs={}, **kwargs):
         func_kwargs: A dict of function keyword arguments to be passed to func
         num_sec: An int describing the number of seconds to wait before timing out.
         expo: A boolean flag toggling exponential delay growth.
+        max_delay: When using expo, the delay will not grow beyond this many seconds.
+        jitter: A float between 0 and 1, randomly varies each delay by up to this fraction of
+            itself, so many concurrent waits don't poll in lockstep.
         message: A string containing a description of func's operation. If None,
             defaults to the function's name.
         fail_condition: An object describing the failure condition that should be tested
@@ -40,46 +57,219 @@ def wait_for(func, func_args=[], func_kwargs={}, **kwargs):
         TimedOutError: If num_sec is exceeded after an unsuccessful func() invocation.
 
     """
-    st_time = time.time()
-    total_time = 0
-    num_sec = kwargs.get('num_sec', 120)
-    expo = kwargs.get('expo', False)
-    message = kwargs.get('message', None)
-    if not message:
-        if isinstance(func, partial):
-            params = ", ".join([str(arg) for arg in func.args])
-            message = "partial function %s(%s)" % (func.func.func_name, params)
-        else:
-            message = "function %s()" % func.func_name
-    fail_condition = kwargs.get('fail_condition', False)
-    handle_exception = kwargs.get('handle_exception', False)
-    delay = kwargs.get('delay', 1)
-    fail_func = kwargs.get('fail_func', None)
-
-    t_delta = 0
-    while t_delta <= num_sec:
-        try:
-            out = func(*func_args, **func_kwargs)
-        except:
-            if handle_exception:
-                out = fail_condition
-            else:
-                raise
-        if out == fail_condition:
-            time.sleep(delay)
-            total_time += delay
-            if expo:
-                delay *= 2
-            if fail_func:
-                fail_func()
-        else:
-            duration = time.time() - st_time
-            logger.info('Took %f to do %s' % (duration, message))
-            return out, duration
-        t_delta = time.time() - st_time
+    wait = _Wait(func, kwargs)
+    message = wait.message
+    outer_deadline = _current_deadline()
+    if outer_deadline is not None and outer_deadline < wait.deadline:
+        logger.debug('Limiting %s to the %f seconds left of an outer wait' %
+            (message, max(outer_deadline - wait.start_time, 0)))
+        wait.deadline = outer_deadline
+
+    call_site = kwargs.get('_call_site') or _call_site()
+    _push_deadline(wait.deadline)
+    try:
+        while True:
+            wait.checks += 1
+            try:
+                out = func(*func_args, **func_kwargs)
+            except:
+                if wait.handle_exception:
+                    out = wait.fail_condition
+                else:
+                    raise
+            if out != wait.fail_condition:
+                duration = time.time() - wait.start_time
+                logger.info('Took %f to do %s' % (duration, message))
+                _record(call_site, message, duration, wait.checks, timed_out=False)
+                return out, duration
+
+            sleep_time = wait.next_delay()
+            if sleep_time is None:
+                break
+            time.sleep(sleep_time)
+            if wait.fail_func:
+                wait.fail_func()
+    finally:
+        _pop_deadline()
+
+    t_delta = time.time() - wait.start_time
+    _record(call_site, message, t_delta, wait.checks, timed_out=True)
     logger.error('Could not complete %s in time, took %f' % (message, t_delta))
     raise TimedOutError("Could not do %s in time" % message)
 
 
+class _Wait(object):
+    """Options and delay schedule of a wait, shared by :py:func:`wait_for` and
+    :py:func:`utils.aio.wait_for`
+
+    Takes the keyword arguments of :py:func:`wait_for`. The wait's func is checked right away,
+    and then after every delay given by :py:meth:`next_delay`.
+    """
+    def __init__(self, func, kwargs):
+        self.start_time = time.time()
+        self.deadline = self.start_time + kwargs.get('num_sec', 120)
+        self.message = kwargs.get('message', None) or _default_message(func)
+        self.fail_condition = kwargs.get('fail_condition', False)
+        self.handle_exception = kwargs.get('handle_exception', False)
+        self.fail_func = kwargs.get('fail_func', None)
+        self.checks = 0
+        self._delay = kwargs.get('delay', 1)
+        self._expo = kwargs.get('expo', False)
+        self._max_delay = kwargs.get('max_delay', None)
+        self._jitter = kwargs.get('jitter', 0)
+
+    def next_delay(self):
+        """Returns the seconds to sleep before the next check, or None once the deadline passed
+
+        The delay is cut short to check right at the deadline, instead of sleeping past it.
+        """
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            return None
+        sleep_time = self._delay
+        if self._jitter:
+            sleep_time *= random.uniform(1 - self._jitter, 1 + self._jitter)
+        if self._expo:
+            self._delay *= 2
+            if self._max_delay is not None:
+                self._delay = min(self._delay, self._max_delay)
+        return min(sleep_time, remaining)
+
+
+def _default_message(func):
+    if isinstance(func, partial):
+        params = ", ".join([str(arg) for arg in func.args])
+        return "partial function %s(%s)" % (func.func.func_name, params)
+    return "function %s()" % getattr(func, '__name__', func)
+
+
+def wait_for_all(conditions, refresh=None, **kwargs):
+    """Waits for many conditions to be met, checking all of them in one loop
+
+    Every check (tick) runs the refresh functions, then checks each condition that isn't met
+    yet. Conditions that are met are not checked again.
+
+    Args:
+        conditions: A dict of functions keyed by name, or a list of functions. Each function
+            takes no arguments, and its condition is met once it returns anything other than
+            ``fail_condition``.
+        refresh: A function to run once per tick, before the conditions are checked, e.g.
+            ``sel.refresh``. Can also be a dict mapping refresh functions to lists of the
+            condition keys (or list indices) they refresh; each is run only while one of its
+            conditions is still unmet.
+        **kwargs: Any other :py:func:`wait_for` keyword arguments, applying to the whole wait.
+            ``fail_condition`` and ``handle_exception`` apply to each condition separately.
+
+    Returns:
+        A tuple of the condition results (a dict or list, like ``conditions``) and a float
+        detailing the total wait time.
+
+    Raises:
+        TimedOutError: If not all conditions were met in time.
+
+    Usage:
+        # Functions are passed, not their results: bind each vm to its lambda
+        wait_for_all([lambda vm=vm: vm.is_stopped for vm in vms], refresh=provider.refresh,
+            num_sec=600)
+
+    """
+    waiter = _MultiWaiter(conditions, refresh, kwargs)
+    kwargs.setdefault('message', 'all of %d conditions' % len(waiter.pending))
+    wait_for(waiter.tick, [True], _call_site=_call_site(), **kwargs)
+    return waiter.results(), time.time() - waiter.start_time
+
+
+def wait_for_any(conditions, refresh=None, **kwargs):
+    """Waits for any one of many conditions to be met, checking all of them in one loop
+
+    Takes the same arguments as :py:func:`wait_for_all`.
+
+    Returns:
+        A tuple of a dict of the conditions met, keyed by name (or list index), with their
+        results, and a float detailing the total wait time. More than one condition may have
+        been met in the same tick.
+
+    Raises:
+        TimedOutError: If no condition was met in time.
+
+    """
+    waiter = _MultiWaiter(conditions, refresh, kwargs)
+    kwargs.setdefault('message', 'any of %d conditions' % len(waiter.pending))
+    wait_for(waiter.tick, [False], _call_site=_call_site(), **kwargs)
+    return waiter.met, time.time() - waiter.start_time
+
+
+class _MultiWaiter(object):
+    """Tracks the conditions of :py:func:`wait_for_all` and :py:func:`wait_for_any`"""
+    def __init__(self, conditions, refresh, kwargs):
+        self.start_time = time.time()
+        self.as_list = not isinstance(conditions, dict)
+        if self.as_list:
+            conditions = dict(enumerate(conditions))
+        self.pending = dict(conditions)
+        self.met = {}
+        if refresh is None:
+            self.refresh = {}
+        elif callable(refresh):
+            self.refresh = {refresh: list(conditions)}
+        else:
+            self.refresh = refresh
+        self.fail_condition = kwargs.pop('fail_condition', False)
+        self.handle_exception = kwargs.pop('handle_exception', False)
+
+    def tick(self, wait_all):
+        for refresh_func, keys in self.refresh.items():
+            if any(key in self.pending for key in keys):
+                refresh_func()
+        for key, func in self.pending.items():
+            try:
+                out = func()
+            except Exception:
+                if self.handle_exception:
+                    continue
+                raise
+            if out != self.fail_condition:
+                self.met[key] = out
+                del self.pending[key]
+        if wait_all:
+            return not self.pending
+        return bool(self.met)
+
+    def results(self):
+        if self.as_list:
+            return [self.met[i] for i in range(len(self.met))]
+        return self.met
+
+
+def _current_deadline():
+    stack = getattr(_deadlines, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def _push_deadline(deadline):
+    if not hasattr(_deadlines, 'stack'):
+        _deadlines.stack = []
+    _deadlines.stack.append(deadline)
+
+
+def _pop_deadline():
+    _deadlines.stack.pop()
+
+
+def _call_site():
+    """Returns "file:line" of the code calling wait_for"""
+    frame = sys._getframe(2)
+    filename = frame.f_code.co_filename
+    filename = get_rel_path(filename) or os.path.basename(filename)
+    return '%s:%d' % (filename, frame.f_lineno)
+
+
+def _record(call_site, message, duration, checks, timed_out):
+    perflog.record('wait_for %s' % call_site, duration,
+        message=message, checks=checks, timed_out=timed_out)
+
+
 class TimedOutError(Exception):
     pass
@@ -0,0 +1,177 @@
+"""WebDriver command instrumentation
+
+Counts and times every command sent to the browser, attributing each one to the test that was
+running and the cfme function that issued it, to show where browser time goes.
+
+Commands are attributed to the outermost :py:mod:`cfme.fixtures.pytest_selenium` helper on the
+stack, so all the commands sent while, for example, ``force_navigate`` or ``click`` run are
+counted against that helper. Commands sent outside of those helpers are attributed to the
+innermost ``cfme.*`` function that sent them.
+
+Usage:
+
+.. code-block:: python
+
+    from utils import webdriver_stats
+
+    stats = webdriver_stats.instrument()
+    stats.current_test = 'some test'
+    # drive the browser
+    webdriver_stats.uninstrument()
+    for function, count, seconds in stats.totals():
+        print function, count, seconds
+
+With pytest, pass ``--browser-stats`` to record every test and write the
+``log/browser_stats.html`` report.
+
+"""
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+from time import time
+
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+#: Module holding the browser helpers that commands are attributed to
+HELPER_MODULE = 'cfme.fixtures.pytest_selenium'
+
+# The instrumented class, and its original execute
+_instrumented = None
+
+
+class CommandStats(object):
+    """Per-test counts and durations of WebDriver commands
+
+    Attributes:
+        current_test: Name of the test commands are currently attributed to
+        tests: Ordered dict of test name to a dict of ``(function, command)`` to a
+            ``[count, seconds]`` list
+    """
+    def __init__(self):
+        self.current_test = None
+        self.tests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, function, command, seconds):
+        with self._lock:
+            self._add(self.current_test, function, command, 1, seconds)
+
+    def _add(self, test, function, command, count, seconds):
+        try:
+            test_stats = self.tests[test]
+        except KeyError:
+            test_stats = self.tests[test] = defaultdict(lambda: [0, 0.0])
+        stats = test_stats[function, command]
+        stats[0] += count
+        stats[1] += seconds
+
+    def export(self):
+        """Returns the stats as builtin types, for :py:meth:`merge`
+
+        Stats are exported as a list of ``[test, function, command, count, seconds]`` lists, so
+        they can be sent to other processes, like the xdist master.
+        """
+        with self._lock:
+            return [[test, function, command, count, seconds]
+                for test, test_stats in self.tests.items()
+                for (function, command), (count, seconds) in test_stats.items()]
+
+    def merge(self, exported):
+        """Add stats exported by :py:meth:`export`, e.g. from another process, to these stats"""
+        with self._lock:
+            for test, function, command, count, seconds in exported:
+                self._add(test, function, command, count, seconds)
+
+    def totals(self, test=None):
+        """Returns a list of ``(function, count, seconds)`` tuples, slowest function first
+
+        Args:
+            test: Name of a test to total, or ``None`` for all tests
+        """
+        totals = defaultdict(lambda: [0, 0.0])
+        with self._lock:
+            tests = [self.tests[test]] if test is not None else self.tests.values()
+            for test_stats in tests:
+                for (function, command), (count, seconds) in test_stats.items():
+                    totals[function][0] += count
+                    totals[function][1] += seconds
+        return sorted(((function, count, seconds)
+            for function, (count, seconds) in totals.items()), key=lambda t: t[2], reverse=True)
+
+    def report(self):
+        """Returns the stats of each test, for the ``browser_stats.html`` template
+
+        Tests and their commands are ordered by the time spent in them, slowest first.
+        """
+        report = []
+        with self._lock:
+            tests = self.tests.items()
+        for test, test_stats in tests:
+            commands = sorted(((function, command, count, seconds)
+                for (function, command), (count, seconds) in test_stats.items()),
+                key=lambda c: c[3], reverse=True)
+            report.append({
+                'name': test or '(outside of tests)',
+                'count': sum(c[2] for c in commands),
+                'seconds': sum(c[3] for c in commands),
+                'functions': self.totals(test),
+                'commands': commands,
+            })
+        return sorted(report, key=lambda t: t['seconds'], reverse=True)
+
+
+def _calling_function(frame):
+    helper = None
+    function = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module == HELPER_MODULE:
+            # Keep looking for the outermost helper
+            helper = frame
+        elif function is None and module.startswith('cfme.'):
+            function = frame
+        frame = frame.f_back
+    frame = helper or function
+    if frame is None:
+        return '(not cfme)'
+    return '%s.%s' % (frame.f_globals['__name__'], frame.f_code.co_name)
+
+
+def instrument(stats=None, connection_class=RemoteConnection):
+    """Start recording the commands sent by all browsers
+
+    Args:
+        stats: :py:class:`CommandStats` to record to, a new one by default
+        connection_class: Class of the webdriver command executor to instrument
+
+    Returns: The :py:class:`CommandStats` commands are recorded to
+    """
+    global _instrumented
+    if stats is None:
+        stats = CommandStats()
+    uninstrument()
+    original_execute = connection_class.execute
+
+    def execute(self, command, params):
+        start = time()
+        try:
+            return original_execute(self, command, params)
+        finally:
+            stats.record(_calling_function(sys._getframe(1)), command, time() - start)
+
+    # Remember what to put back, execute may be inherited rather than defined on the class
+    _instrumented = connection_class, connection_class.__dict__.get('execute')
+    connection_class.execute = execute
+    return stats
+
+
+def uninstrument():
+    """Stop recording browser commands"""
+    global _instrumented
+    if _instrumented is not None:
+        connection_class, execute = _instrumented
+        if execute is None:
+            del connection_class.execute
+        else:
+            connection_class.execute = execute
+        _instrumented = None